@@ -1,177 +1,312 @@
+import argparse
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+from itertools import islice, permutations
+import mmap
+import os
+import pickle
 import sys
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import zlib
+
+
+OUTPUT_BUFFER_SIZE = 1 << 16
+BIN_CHUNK_SIZE = 1 << 12
+INCREMENTAL_CHUNK_SIZE = 1 << 10
+PARALLEL_CHUNK_SIZE = 1 << 14
+
+
+class Command(NamedTuple):
+    """A cleaned command, classified and split into its fields."""
+
+    command_type: str
+    text: str
+    symbol: Optional[str] = None
+    dest: Optional[str] = None
+    comp: Optional[str] = None
+    jump: Optional[str] = None
+
+
+# cleaned C-command text -> Command, records are immutable hence shared. Only
+# C-commands are cached: their spellings are a small finite set, while A and
+# L commands have a symbol or a constant each, which would keep the cache
+# growing with the program
+_c_command_cache: Dict[str, Command] = {}
+
+
+def parse_command(cmd):
+    if cmd.startswith("@"):
+        return Command("A_COMMAND", cmd, symbol=cmd[1:])
+    if cmd.startswith("("):
+        return Command("L_COMMAND", cmd, symbol=cmd[1:-1])
+    command = _c_command_cache.get(cmd)
+    if command is None:
+        dest, has_dest, comp = cmd.partition("=")
+        if not has_dest:
+            dest, comp = None, cmd
+        comp, has_jump, jump = comp.partition(";")
+        command = Command(
+            "C_COMMAND", cmd, dest=dest, comp=comp, jump=jump if has_jump else None
+        )
+        _c_command_cache[cmd] = command
+    return command
 
 
 class Parser:
     def __init__(self, stream):
         self._cmds = []
-        for line in stream.readlines():
-            if line.isspace():
-                continue
-            line = line.strip()
-            if line.startswith("//"):
-                continue
-            self._cmds.append(self._clean_cmd(line))
-        self._cmd_index = -1
+        for line in stream:
+            command = self._parse_line(line)
+            if command is not None:
+                self._cmds.append(command)
+        self.reset()
+
+    def _parse_line(self, line):
+        """Return the Command of a line, None for blank and comment lines."""
+        cmd = self._clean_cmd(line)
+        if cmd:
+            return parse_command(cmd)
+        return None
 
     def _clean_cmd(self, line):
         """Remove whitespace and inline comments. """
-        return "".join([c for c in line if not c.isspace()]).split("//")[0]
+        return "".join(line.split("//", 1)[0].split())
 
     def has_more_commands(self):
         return self._cmd_index < len(self._cmds) - 1
 
     def advance(self):
         self._cmd_index += 1
+        self._command = self._cmds[self._cmd_index]
 
     def command_type(self):
-        current_command = self.current_command
-        if current_command.startswith("@"):
-            return "A_COMMAND"
-        elif current_command.startswith("("):
-            return "L_COMMAND"
-        return "C_COMMAND"
+        return self._command.command_type
 
     def symbol(self):
-        command_type = self.command_type()
-        if command_type == "C_COMMAND":
+        command = self._command
+        if command.command_type == "C_COMMAND":
             raise ValueError("Cannot get symbol of C_COMMAND")
-        current_command = self.current_command
-        if command_type == "A_COMMAND":
-            return current_command[1:]
-        return current_command[1 : len(current_command) - 1]
+        return command.symbol
 
     def dest(self):
-        command_type = self.command_type()
-        if command_type != "C_COMMAND":
-            raise ValueError(f"Cannot get dest of {command_type}")
-        current_command = self.current_command
-        if "=" in current_command:
-            return current_command.split("=")[0]
+        command = self._command
+        if command.command_type != "C_COMMAND":
+            raise ValueError(f"Cannot get dest of {command.command_type}")
+        return command.dest
 
     def comp(self):
-        command_type = self.command_type()
-        if command_type != "C_COMMAND":
-            raise ValueError(f"Cannot get comp of {command_type}")
-        current_command = self.current_command
-        if "=" in current_command:
-            return current_command.split("=")[1].split(";")[0]
-        return current_command.split(";")[0]
+        command = self._command
+        if command.command_type != "C_COMMAND":
+            raise ValueError(f"Cannot get comp of {command.command_type}")
+        return command.comp
 
     def jump(self):
-        command_type = self.command_type()
-        if command_type != "C_COMMAND":
-            raise ValueError(f"Cannot get dest of {command_type}")
-        current_command = self.current_command
-        if ";" in current_command:
-            return current_command.split(";")[1]
+        command = self._command
+        if command.command_type != "C_COMMAND":
+            raise ValueError(f"Cannot get jump of {command.command_type}")
+        return command.jump
+
+    @property
+    def command(self):
+        """The current Command record."""
+        return self._command
 
     @property
     def current_command(self):
-        if self._cmd_index >= 0:
-            return self._cmds[self._cmd_index]
+        if self._command is not None:
+            return self._command.text
 
     def reset(self):
         self._cmd_index = -1
+        self._command = None
+
+
+def _dest_codes():
+    """Map every spelling of a dest field (letters in any order) to its 3 bits."""
+    codes = {}
+    for code in range(8):
+        letters = "A" * (code >> 2 & 1) + "D" * (code >> 1 & 1) + "M" * (code & 1)
+        for perm in permutations(letters):
+            codes["".join(perm)] = code
+    return codes
+
+
+DEST_CODES = _dest_codes()
+
+# 'a' bit followed by the six ALU control bits
+COMP_CODES = {
+    "0": 0b0101010,
+    "1": 0b0111111,
+    "-1": 0b0111010,
+    "D": 0b0001100,
+    "A": 0b0110000,
+    "M": 0b1110000,
+    "!D": 0b0001101,
+    "!A": 0b0110001,
+    "!M": 0b1110001,
+    "-D": 0b0001111,
+    "-A": 0b0110011,
+    "-M": 0b1110011,
+    "D+1": 0b0011111,
+    "A+1": 0b0110111,
+    "M+1": 0b1110111,
+    "D-1": 0b0001110,
+    "A-1": 0b0110010,
+    "M-1": 0b1110010,
+    "D+A": 0b0000010,
+    "D+M": 0b1000010,
+    "D-A": 0b0010011,
+    "D-M": 0b1010011,
+    "A-D": 0b0000111,
+    "M-D": 0b1000111,
+    "D&A": 0b0000000,
+    "D&M": 0b1000000,
+    "D|A": 0b0010101,
+    "D|M": 0b1010101,
+}
+# commutative spellings, e.g. `A+D`, as emitted by the VM translator
+for _comp, _code in list(COMP_CODES.items()):
+    if len(_comp) == 3 and _comp[1] in "+&|" and _comp[0] != _comp[2]:
+        COMP_CODES[_comp[2] + _comp[1] + _comp[0]] = _code
+    if _comp[1:] == "+1":
+        COMP_CODES["1+" + _comp[0]] = _code
+
+JUMP_CODES = {
+    "": 0b000,
+    "JGT": 0b001,
+    "JEQ": 0b010,
+    "JGE": 0b011,
+    "JLT": 0b100,
+    "JNE": 0b101,
+    "JLE": 0b110,
+    "JMP": 0b111,
+}
 
 
 def encode_dest(dest):
-    if dest is None:
-        return [0, 0, 0]
-    result = [0, 0, 0]
-    if "A" in dest:
-        result[0] = 1
-    if "D" in dest:
-        result[1] = 1
-    if "M" in dest:
-        result[2] = 1
-    return result
+    try:
+        return DEST_CODES[dest or ""]
+    except KeyError:
+        raise ValueError(f"Unknown dest value: {dest}") from None
 
 
 def encode_comp(comp):
-    if comp == "0":
-        return [0, 1, 0, 1, 0, 1, 0]
-    if comp == "1":
-        return [0, 1, 1, 1, 1, 1, 1]
-    if comp == "-1":
-        return [0, 1, 1, 1, 0, 1, 0]
-    if comp == "D":
-        return [0, 0, 0, 1, 1, 0, 0]
-    if comp == "A":
-        return [0, 1, 1, 0, 0, 0, 0]
-    if comp == "M":
-        return [1, 1, 1, 0, 0, 0, 0]
-    if comp == "!D":
-        return [0, 0, 0, 1, 1, 0, 1]
-    if comp == "!A":
-        return [0, 1, 1, 0, 0, 0, 1]
-    if comp == "!M":
-        return [1, 1, 1, 0, 0, 0, 1]
-    if comp == "-D":
-        return [0, 0, 0, 1, 1, 1, 1]
-    if comp == "-A":
-        return [0, 1, 1, 0, 0, 1, 1]
-    if comp == "-M":
-        return [1, 1, 1, 0, 0, 1, 1]
-    if comp == "D+1":
-        return [0, 0, 1, 1, 1, 1, 1]
-    if comp == "A+1":
-        return [0, 1, 1, 0, 1, 1, 1]
-    if comp == "M+1":
-        return [1, 1, 1, 0, 1, 1, 1]
-    if comp == "D-1":
-        return [0, 0, 0, 1, 1, 1, 0]
-    if comp == "A-1":
-        return [0, 1, 1, 0, 0, 1, 0]
-    if comp == "M-1":
-        return [1, 1, 1, 0, 0, 1, 0]
-    if comp == "D+A":
-        return [0, 0, 0, 0, 0, 1, 0]
-    if comp == "D+M":
-        return [1, 0, 0, 0, 0, 1, 0]
-    if comp == "D-A":
-        return [0, 0, 1, 0, 0, 1, 1]
-    if comp == "D-M":
-        return [1, 0, 1, 0, 0, 1, 1]
-    if comp == "A-D":
-        return [0, 0, 0, 0, 1, 1, 1]
-    if comp == "M-D":
-        return [1, 0, 0, 0, 1, 1, 1]
-    if comp == "D&A":
-        return [0, 0, 0, 0, 0, 0, 0]
-    if comp == "D&M":
-        return [1, 0, 0, 0, 0, 0, 0]
-    if comp == "D|A":
-        return [0, 0, 1, 0, 1, 0, 1]
-    if comp == "D|M":
-        return [1, 0, 1, 0, 1, 0, 1]
-    raise ValueError(f"Unknown comp value: {comp}")
+    try:
+        return COMP_CODES[comp]
+    except KeyError:
+        raise ValueError(f"Unknown comp value: {comp}") from None
 
 
 def encode_jump(jump):
-    if jump is None or jump == "":
-        return [0, 0, 0]
-    if jump == "JGT":
-        return [0, 0, 1]
-    if jump == "JEQ":
-        return [0, 1, 0]
-    if jump == "JGE":
-        return [0, 1, 1]
-    if jump == "JLT":
-        return [1, 0, 0]
-    if jump == "JNE":
-        return [1, 0, 1]
-    if jump == "JLE":
-        return [1, 1, 0]
-    if jump == "JMP":
-        return [1, 1, 1]
-
-
-def to_15_bits(n):
-    bits = []
-    for _ in range(15):
-        bits.append(n % 2)
-        n = n // 2
-    return bits[::-1]
+    try:
+        return JUMP_CODES[jump or ""]
+    except KeyError:
+        raise ValueError(f"Unknown jump value: {jump}") from None
+
+
+# cleaned C-instruction text -> 16-bit word
+_c_instruction_cache = {}
+
+
+def encode_c_instruction(cmd):
+    """Encode a cleaned C-instruction such as `MD=M+1;JGT` as a 16-bit int."""
+    word = _c_instruction_cache.get(cmd)
+    if word is None:
+        dest, _, comp = cmd.rpartition("=")
+        comp, _, jump = comp.partition(";")
+        word = (
+            0b111 << 13
+            | encode_comp(comp) << 6
+            | encode_dest(dest) << 3
+            | encode_jump(jump)
+        )
+        _c_instruction_cache[cmd] = word
+    return word
+
+
+def write_hack(words, stream):
+    """Write 16-bit words as the textual `.hack` format, one per line."""
+    stream.writelines(f"{word:016b}\n" for word in words)
+
+
+def write_bin(words, stream):
+    """Write 16-bit words as a packed little-endian ROM image."""
+    words = iter(words)
+    while chunk := array("H", islice(words, BIN_CHUNK_SIZE)):
+        if sys.byteorder == "big":
+            chunk.byteswap()
+        stream.write(chunk.tobytes())
+
+
+def read_hack(stream):
+    """Read a textual `.hack` stream into an array of 16-bit words."""
+    return array("H", (int(line, 2) for line in stream if not line.isspace()))
+
+
+def load_rom(filename):
+    """Expose a binary ROM image as a sequence of 16-bit words.
+
+    The file is memory-mapped and, on little-endian hosts, returned as a
+    zero-copy `memoryview` of unsigned shorts; it is copied into an `array`
+    otherwise.
+    """
+    with open(filename, "rb") as stream:
+        if os.fstat(stream.fileno()).st_size == 0:
+            return array("H")
+        image = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(image) % 2:
+        raise ValueError(f"{filename} is not a ROM image: odd number of bytes")
+    if sys.byteorder == "little":
+        return memoryview(image).cast("H")
+    words = array("H", image)
+    words.byteswap()
+    return words
+
+
+OUTPUT_FORMATS = {
+    "hack": (".hack", "w", write_hack),
+    "bin": (".bin", "wb", write_bin),
+}
+
+
+class StreamParser(Parser):
+    """Parser reading commands lazily from a seekable stream.
+
+    Only the current and the next command are kept in memory, and `reset`
+    rewinds the stream, so that each pass re-reads the source.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.reset()
+
+    def _read_command(self):
+        for line in self._stream:
+            command = self._parse_line(line)
+            if command is not None:
+                return command
+        return None
+
+    def has_more_commands(self):
+        return self._next_command is not None
+
+    def advance(self):
+        self._command = self._next_command
+        self._next_command = self._read_command()
+
+    def reset(self):
+        self._stream.seek(0)
+        self._command = None
+        self._next_command = self._read_command()
+
+
+class CommandParser(Parser):
+    """Parser over Command records built in memory, e.g. by a compiler."""
+
+    def __init__(self, commands):
+        self._cmds = commands
+        self.reset()
 
 
 class SymbolTable:
@@ -223,8 +358,9 @@ def first_pass(parser, symbol_table):
     rom_index = 0
     while parser.has_more_commands():
         parser.advance()
-        if parser.command_type() == "L_COMMAND":
-            symbol = parser.symbol()
+        command = parser.command
+        if command.command_type == "L_COMMAND":
+            symbol = command.symbol
             if symbol_table.contains(symbol):
                 raise ValueError(f"symbol {symbol} defined multiple times")
             symbol_table.add_entry(symbol, rom_index)
@@ -232,46 +368,247 @@ def first_pass(parser, symbol_table):
             rom_index += 1
 
 
-def second_pass(parser, symbol_table):
-    translated_lines = []
+def encode_commands(parser, symbol_table):
+    """Yield the 16-bit word of each A and C command, resolving symbols."""
     while parser.has_more_commands():
         parser.advance()
-        current_translated_line = []
-        if parser.command_type() == "A_COMMAND":
-            symbol = parser.symbol()
+        command = parser.command
+        command_type = command.command_type
+        if command_type == "A_COMMAND":
+            symbol = command.symbol
             if symbol.isdigit():
                 address = int(symbol)
             elif symbol_table.contains(symbol):
                 address = symbol_table.get_address(symbol)
             else:
                 address = symbol_table.add_entry(symbol)
-            current_translated_line = [0] + to_15_bits(address)
-        elif parser.command_type() == "C_COMMAND":
-            encoded_comp = encode_comp(parser.comp())
-            encoded_dest = encode_dest(parser.dest())
-            encoded_jump = encode_jump(parser.jump())
-            current_translated_line = (
-                [1, 1, 1] + encoded_comp + encoded_dest + encoded_jump
-            )
+            yield address & 0x7FFF
+        elif command_type == "C_COMMAND":
+            yield encode_c_instruction(command.text)
+
+
+def second_pass(parser, symbol_table):
+    return list(encode_commands(parser, symbol_table))
+
+
+class ChunkEncoding(NamedTuple):
+    """Relocatable encoding of a chunk of source lines.
+
+    `words` holds the final encoding of C-commands and numeric A-commands;
+    the words of symbolic A-commands are patched at link time, from `refs`.
+    """
+
+    labels: List[Tuple[str, int]]  # (label, offset in chunk)
+    refs: List[Tuple[int, str]]  # (offset in chunk, symbol)
+    words: array
+
+
+def _is_chunk_anchor(line):
+    line = line.strip()
+    return line.startswith("(") and zlib.crc32(line.encode()) % 8 == 0
+
+
+def split_chunks(lines, chunk_size=INCREMENTAL_CHUNK_SIZE):
+    """Split source lines in chunks of roughly `chunk_size` lines.
+
+    Chunks are cut before labels selected by a hash of their name rather
+    than at fixed positions, so that inserting or removing lines only
+    changes the chunks around the edit.
+    """
+    chunk = []
+    for line in lines:
+        at_anchor = len(chunk) >= chunk_size // 4 and _is_chunk_anchor(line)
+        if at_anchor or len(chunk) >= 4 * chunk_size:
+            yield chunk
+            chunk = []
+        chunk.append(line)
+    if chunk:
+        yield chunk
+
+
+def encode_chunk(lines):
+    parser = Parser(lines)
+    labels = []
+    refs = []
+    words = array("H")
+    while parser.has_more_commands():
+        parser.advance()
+        command = parser.command
+        command_type = command.command_type
+        if command_type == "L_COMMAND":
+            labels.append((command.symbol, len(words)))
+        elif command_type == "A_COMMAND":
+            symbol = command.symbol
+            if symbol.isdigit():
+                words.append(int(symbol) & 0x7FFF)
+            else:
+                refs.append((len(words), symbol))
+                words.append(0)
+        else:
+            words.append(encode_c_instruction(command.text))
+    return ChunkEncoding(labels, refs, words)
+
+
+class AssemblyCache:
+    """On-disk cache of chunk encodings, keyed by a hash of the chunk source."""
+
+    VERSION = 1
+
+    def __init__(self, filename):
+        self._filename = filename
+        self._entries = {}
+        self._used_keys = set()
+        self.nb_hits = 0
+        self.nb_misses = 0
+        try:
+            with open(filename, "rb") as stream:
+                version, entries = pickle.load(stream)
+            if version == self.VERSION:
+                self._entries = {k: ChunkEncoding(*v) for k, v in entries.items()}
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError):
+            pass
+
+    def get_chunk_encoding(self, lines):
+        text = "".join(lines).encode()
+        key = hashlib.blake2b(text, digest_size=16).digest()
+        self._used_keys.add(key)
+        encoding = self._entries.get(key)
+        if encoding is None:
+            self.nb_misses += 1
+            encoding = encode_chunk(lines)
+            self._entries[key] = encoding
         else:
-            continue
-        translated_lines.append(current_translated_line)
-    return translated_lines
+            self.nb_hits += 1
+        return encoding
+
+    def save(self):
+        """Write the entries used since loading, dropping stale ones."""
+        # stored as plain tuples, to be loadable whatever the module name
+        entries = {
+            k: tuple(v) for k, v in self._entries.items() if k in self._used_keys
+        }
+        with open(self._filename, "wb") as stream:
+            pickle.dump((self.VERSION, entries), stream)
 
 
-if __name__ == "__main__":
-    filename = sys.argv[1]
-    with open(filename) as stream:
-        parser = Parser(stream)
+def link_chunks(encodings):
+    """Assemble a program from the relocatable encodings of its chunks.
+
+    The result is identical to a full build: labels are resolved from the
+    chunk base addresses, and variables are allocated in order of first
+    reference across the whole program.
+    """
     symbol_table = SymbolTable()
-    first_pass(parser, symbol_table)
-    parser.reset()
-    translated_lines = second_pass(parser, symbol_table)
+    rom_index = 0
+    for encoding in encodings:
+        for label, offset in encoding.labels:
+            if symbol_table.contains(label):
+                raise ValueError(f"symbol {label} defined multiple times")
+            symbol_table.add_entry(label, rom_index + offset)
+        rom_index += len(encoding.words)
+
+    words = array("H")
+    for encoding in encodings:
+        base = len(words)
+        words.extend(encoding.words)
+        for offset, symbol in encoding.refs:
+            if symbol_table.contains(symbol):
+                address = symbol_table.get_address(symbol)
+            else:
+                address = symbol_table.add_entry(symbol)
+            words[base + offset] = address & 0x7FFF
+    return words
+
+
+def incremental_assemble(lines, cache, chunk_size=INCREMENTAL_CHUNK_SIZE):
+    """Assemble source lines, only encoding the chunks missing from `cache`."""
+    return link_chunks(
+        [cache.get_chunk_encoding(chunk) for chunk in split_chunks(lines, chunk_size)]
+    )
+
+
+def parallel_assemble(lines, jobs, chunk_size=PARALLEL_CHUNK_SIZE):
+    """Assemble source lines, parsing and encoding chunks in worker processes.
 
-    if len(sys.argv) > 2:
-        output_filename = sys.argv[2]
+    Experimental: the output is the same as a serial build, but the speedup
+    has not been measured on multi-core hardware.
+    """
+    with ProcessPoolExecutor(jobs) as executor:
+        encodings = list(executor.map(encode_chunk, split_chunks(lines, chunk_size)))
+    return link_chunks(encodings)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Assemble a Hack .asm file.")
+    argparser.add_argument("input_file", metavar="input", help="File to assemble.")
+    argparser.add_argument(
+        "output_file",
+        metavar="output",
+        nargs="?",
+        help="Output file, defaults to the input file with the extension of the "
+        "output format.",
+    )
+    argparser.add_argument(
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default="hack",
+        help="Textual .hack file, or packed little-endian 16-bit ROM image (.bin).",
+    )
+    build_mode = argparser.add_mutually_exclusive_group()
+    build_mode.add_argument(
+        "--stream",
+        action="store_true",
+        help="Read the source once per pass and write each word as soon as it "
+        "is encoded, instead of loading the whole program in memory.",
+    )
+    build_mode.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Experimental: parse and encode chunks of the program in N worker "
+        "processes. The default is a serial build; no speedup has been measured "
+        "yet, and process and pickling overhead make it slower on a single core.",
+    )
+    build_mode.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Cache the encoding of source chunks in <input>.cache, and only "
+        "re-encode the chunks that changed since the previous build.",
+    )
+    args = argparser.parse_args()
+    filename = args.input_file
+    extension, mode, write_words = OUTPUT_FORMATS[args.format]
+    output_filename = args.output_file or filename.split(".")[0] + extension
+
+    symbol_table = SymbolTable()
+    if args.stream:
+        with open(filename) as stream, open(
+            output_filename, mode, buffering=OUTPUT_BUFFER_SIZE
+        ) as output_stream:
+            parser = StreamParser(stream)
+            first_pass(parser, symbol_table)
+            parser.reset()
+            write_words(encode_commands(parser, symbol_table), output_stream)
+    elif args.jobs > 1:
+        with open(filename) as stream:
+            words = parallel_assemble(stream, args.jobs)
+        with open(output_filename, mode) as output_stream:
+            write_words(words, output_stream)
+    elif args.incremental:
+        cache = AssemblyCache(filename + ".cache")
+        with open(filename) as stream:
+            words = incremental_assemble(stream, cache)
+        with open(output_filename, mode) as output_stream:
+            write_words(words, output_stream)
+        cache.save()
+        print(
+            f"{cache.nb_misses}/{cache.nb_hits + cache.nb_misses} chunks encoded"
+        )
     else:
-        output_filename = filename.split(".")[0] + ".hack"
-    with open(output_filename, "w") as output_stream:
-        for tl in translated_lines:
-            output_stream.write("".join(str(b) for b in tl) + "\n")
+        with open(filename) as stream:
+            parser = Parser(stream)
+        first_pass(parser, symbol_table)
+        parser.reset()
+        words = second_pass(parser, symbol_table)
+        with open(output_filename, mode) as output_stream:
+            write_words(words, output_stream)
@@ -0,0 +1,133 @@
+"""Time assemblers on a large generated program.
+
+Usage: python bench_assembler.py [--size N] [--parse] [assembler.py ...]
+
+Each given assembler script is run on the same generated `.asm` file, which
+allows comparing with an older version, e.g.
+`git show HEAD~1:projects/06/assembler.py > /tmp/old.py`.
+With --parse, only the parser of each assembler is timed, in process.
+"""
+import argparse
+import importlib.util
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+C_INSTRUCTIONS = [
+    "D=M",
+    "D=A",
+    "M=D",
+    "A=M",
+    "AM=M-1",
+    "M=M+1",
+    "A=A-1",
+    "D=D+A",
+    "D=M-D",
+    "M=D|M",
+    "M=!M",
+    "D;JEQ",
+    "D;JGT",
+    "0;JMP",
+    "MD=M+1;JNE",
+]
+
+
+def generate_program(nb_instructions, seed=0):
+    rand = random.Random(seed)
+    nb_labels = max(1, nb_instructions // 50)
+    lines = ["// generated benchmark program"]
+    for i in range(nb_instructions):
+        if i % 50 == 0:
+            lines.append(f"(LABEL_{i // 50})")
+        r = rand.random()
+        if r < 0.15:
+            lines.append(f"@LABEL_{rand.randrange(nb_labels)}")
+        elif r < 0.25:
+            lines.append(f"@var_{rand.randrange(200)}")
+        elif r < 0.45:
+            lines.append(f"@{rand.randrange(32768)}")
+        else:
+            lines.append(f"    {rand.choice(C_INSTRUCTIONS)}  // comment")
+    return "\n".join(lines) + "\n"
+
+
+def time_assembler(assembler, asm_filename, extra_args, repeat):
+    hack_filename = asm_filename[: -len(".asm")] + ".hack"
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, assembler, asm_filename, hack_filename, *extra_args],
+            check=True,
+        )
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def time_parser(assembler, asm_filename, repeat):
+    spec = importlib.util.spec_from_file_location("assembler", assembler)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with open(asm_filename) as stream:
+            parser = module.Parser(stream)
+        while parser.has_more_commands():
+            parser.advance()
+            if parser.command_type() == "C_COMMAND":
+                parser.dest(), parser.comp(), parser.jump()
+            else:
+                parser.symbol()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Benchmark Hack assemblers.")
+    argparser.add_argument(
+        "assemblers",
+        nargs="*",
+        default=[os.path.join(os.path.dirname(__file__) or ".", "assembler.py")],
+        help="Assembler scripts to compare.",
+    )
+    argparser.add_argument(
+        "--size", type=int, default=500_000, help="Number of instructions.",
+    )
+    argparser.add_argument(
+        "--repeat", type=int, default=3, help="Keep the best of N runs.",
+    )
+    argparser.add_argument(
+        "--parse", action="store_true", help="Only time the parsers.",
+    )
+    argparser.add_argument(
+        "--args",
+        dest="extra_args",
+        default="",
+        help="Extra arguments passed to each assembler.",
+    )
+    args = argparser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        asm_filename = os.path.join(tmp_dir, "Bench.asm")
+        with open(asm_filename, "w") as stream:
+            stream.write(generate_program(args.size))
+        baseline = None
+        with open(asm_filename) as stream:
+            nb_lines = sum(1 for _ in stream)
+        for assembler in args.assemblers:
+            if args.parse:
+                elapsed = time_parser(assembler, asm_filename, args.repeat)
+                throughput = f"{nb_lines / elapsed / 1000:.0f}k lines/s"
+            else:
+                elapsed = time_assembler(
+                    assembler, asm_filename, args.extra_args.split(), args.repeat
+                )
+                throughput = f"{args.size / elapsed / 1000:.0f}k instructions/s"
+            baseline = baseline or elapsed
+            print(
+                f"{assembler}: {elapsed:.3f}s, {throughput}, x{baseline / elapsed:.2f}"
+            )
@@ -0,0 +1,73 @@
+"""Measure the speed of the Hack CPU emulator, in instructions per second.
+
+Usage: python bench_cpu.py [--cycles N] [--jit]
+
+Max and Rect halt after a few hundred instructions, so they are run again
+from a reset until reaching the number of instructions; Pong (which waits
+for the keyboard forever) is run for that number of instructions. With
+--jit, the speedup of JitHackCPU over HackCPU is reported against its 10x
+target.
+"""
+import argparse
+import os
+import time
+
+from hack_cpu import HackCPU, JitHackCPU, load_program
+
+
+PROJECTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# speedup of JitHackCPU over HackCPU aimed for, not reached yet
+JIT_TARGET_SPEEDUP = 10
+
+# (name, program, RAM initialization)
+BENCHMARKS = [
+    ("Max", os.path.join(PROJECTS_DIR, "05", "Max.hack"), {0: 1234, 1: 5678}),
+    ("Rect", os.path.join(PROJECTS_DIR, "05", "Rect.hack"), {0: 255}),
+    ("Pong", os.path.join(PROJECTS_DIR, "06", "pong", "Pong.asm"), {}),
+]
+
+
+def run_benchmark(cpu_class, filename, ram_init, nb_cycles, repeat):
+    program = load_program(filename)
+    timings = []
+    for _ in range(repeat):
+        cpu = cpu_class(program)
+        start = time.perf_counter()
+        while cpu.cycles < nb_cycles:
+            for address, value in ram_init.items():
+                cpu.ram[address] = value
+            cpu.reset()
+            cpu.run(nb_cycles - cpu.cycles)
+        timings.append(time.perf_counter() - start)
+    return cpu.cycles / min(timings)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Benchmark the CPU emulator.")
+    argparser.add_argument(
+        "--cycles", type=int, default=5_000_000, help="Instructions per program.",
+    )
+    argparser.add_argument(
+        "--repeat", type=int, default=3, help="Keep the best of N runs.",
+    )
+    argparser.add_argument(
+        "--jit", action="store_true", help="Also measure the JIT emulator.",
+    )
+    args = argparser.parse_args()
+    cpu_classes = [HackCPU, JitHackCPU] if args.jit else [HackCPU]
+    for name, filename, ram_init in BENCHMARKS:
+        speeds = []
+        for cpu_class in cpu_classes:
+            ips = run_benchmark(
+                cpu_class, filename, ram_init, args.cycles, args.repeat
+            )
+            speeds.append(ips)
+            print(f"{name} ({cpu_class.__name__}): {ips / 1e6:.2f}M instructions/s")
+        if args.jit:
+            speedup = speeds[1] / speeds[0]
+            status = "reached" if speedup >= JIT_TARGET_SPEEDUP else "not reached"
+            print(
+                f"{name} JIT speedup: x{speedup:.1f}, "
+                f"target x{JIT_TARGET_SPEEDUP} {status}"
+            )
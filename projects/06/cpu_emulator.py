@@ -0,0 +1,73 @@
+import argparse
+import time
+
+from hack_cpu import HackCPU, JitHackCPU, load_program
+
+
+def parse_ram_assignment(arg):
+    address, value = arg.split("=")
+    return int(address), int(value)
+
+
+def parse_ram_range(arg):
+    start, _, end = arg.partition(":")
+    return range(int(start), int(end) if end else int(start) + 1)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Run a Hack program.")
+    argparser.add_argument(
+        "program", help="Program to run, as a .hack, .bin or .asm file."
+    )
+    argparser.add_argument(
+        "--cycles",
+        type=int,
+        help="Maximum number of instructions to execute, no limit by default.",
+    )
+    argparser.add_argument(
+        "--no-stop-on-loop",
+        dest="stop_on_loop",
+        action="store_false",
+        help="Keep running when reaching the infinite loop ending the program.",
+    )
+    argparser.add_argument(
+        "--set",
+        dest="assignments",
+        metavar="ADDRESS=VALUE",
+        type=parse_ram_assignment,
+        action="append",
+        default=[],
+        help="Set a RAM word before running.",
+    )
+    argparser.add_argument(
+        "--print",
+        dest="ram_ranges",
+        metavar="ADDRESS[:END]",
+        type=parse_ram_range,
+        action="append",
+        default=[],
+        help="Print RAM words after running.",
+    )
+    argparser.add_argument(
+        "--jit",
+        action="store_true",
+        help="Compile the program into Python functions while running it.",
+    )
+    args = argparser.parse_args()
+    if args.cycles is None and not args.stop_on_loop:
+        argparser.error("--no-stop-on-loop requires --cycles")
+
+    cpu_class = JitHackCPU if args.jit else HackCPU
+    cpu = cpu_class(load_program(args.program))
+    for address, value in args.assignments:
+        cpu.ram[address] = value
+    start = time.perf_counter()
+    nb_cycles = cpu.run(args.cycles, args.stop_on_loop)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{nb_cycles} instructions in {elapsed:.3f}s "
+        f"({nb_cycles / elapsed / 1e6:.2f}M instructions/s), PC={cpu.pc}"
+    )
+    for ram_range in args.ram_ranges:
+        for address in ram_range:
+            print(f"RAM[{address}] = {cpu.ram[address]}")
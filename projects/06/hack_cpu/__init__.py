@@ -0,0 +1,2 @@
+from hack_cpu.cpu import HackCPU, KBD, load_program, SCREEN
+from hack_cpu.jit import JitHackCPU
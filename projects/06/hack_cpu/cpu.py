@@ -0,0 +1,215 @@
+from array import array
+import sys
+from typing import Callable, Dict, List, Optional, Sequence
+
+from assembler import (
+    first_pass,
+    load_rom,
+    Parser,
+    read_hack,
+    second_pass,
+    SymbolTable,
+)
+
+
+ROM_SIZE = 1 << 15
+RAM_SIZE = 1 << 15
+SCREEN = 16384
+KBD = 24576
+
+# opcodes of the decoded ROM, C-instructions use the handler table from here
+LOAD_A = 0
+HALT_LOOP = 1
+FIRST_HANDLER = 2
+
+# d, a and m are signed 16-bit values, `m` being RAM[A]
+COMP_EXPRESSIONS = {
+    0b0101010: "0",
+    0b0111111: "1",
+    0b0111010: "-1",
+    0b0001100: "d",
+    0b0110000: "a",
+    0b1110000: "m",
+    0b0001101: "~d",
+    0b0110001: "~a",
+    0b1110001: "~m",
+    0b0001111: "-d",
+    0b0110011: "-a",
+    0b1110011: "-m",
+    0b0011111: "d + 1",
+    0b0110111: "a + 1",
+    0b1110111: "m + 1",
+    0b0001110: "d - 1",
+    0b0110010: "a - 1",
+    0b1110010: "m - 1",
+    0b0000010: "d + a",
+    0b1000010: "d + m",
+    0b0010011: "d - a",
+    0b1010011: "d - m",
+    0b0000111: "a - d",
+    0b1000111: "m - d",
+    0b0000000: "d & a",
+    0b1000000: "d & m",
+    0b0010101: "d | a",
+    0b1010101: "d | m",
+}
+
+# conditions on the ALU output, indexed by the jump bits
+JUMP_CONDITIONS = [
+    None,
+    "out > 0",
+    "out == 0",
+    "out >= 0",
+    "out < 0",
+    "out != 0",
+    "out <= 0",
+    "True",
+]
+
+Handler = Callable[[int, int, int, array], tuple]
+
+
+def alu_expression(comp):
+    """Python expression of the ALU output for a comp field, not wrapped."""
+    expr = COMP_EXPRESSIONS.get(comp)
+    if expr is None:
+        # not one of the documented instructions: follow the ALU control bits
+        x = "0" if comp & 0b100000 else "d"
+        if comp & 0b010000:
+            x = f"~{x}"
+        y = "0" if comp & 0b001000 else ("m" if comp & 0b1000000 else "a")
+        if comp & 0b000100:
+            y = f"~{y}"
+        expr = f"{x} + {y}" if comp & 0b000010 else f"{x} & {y}"
+        if comp & 0b000001:
+            expr = f"~({expr})"
+    return expr
+
+
+def needs_wrap(expr):
+    """Whether the value of an ALU expression can exceed 16 bits."""
+    return expr != "-1" and ("+" in expr or "-" in expr)
+
+
+def comp_expression(comp):
+    """Python expression of the ALU output for a comp field, wrapped to 16 bits."""
+    expr = alu_expression(comp)
+    if needs_wrap(expr):
+        return f"(({expr}) + 32768 & 65535) - 32768"
+    return expr
+
+
+_handler_cache: Dict[int, Handler] = {}
+
+
+def make_handler(word):
+    """Compile a C-instruction into a function `(a, d, pc, ram) -> (a, d, pc)`."""
+    handler = _handler_cache.get(word)
+    if handler is None:
+        comp, dest, jump = word >> 6 & 0x7F, word >> 3 & 0b111, word & 0b111
+        new_a = "out" if dest & 0b100 else "a"
+        new_d = "out" if dest & 0b010 else "d"
+        lines = ["def handler(a, d, pc, ram):"]
+        if comp & 0b1000000:
+            lines.append("    m = ram[a & 32767]")
+        lines.append(f"    out = {comp_expression(comp)}")
+        if dest & 0b001:
+            lines.append("    ram[a & 32767] = out")
+        if jump:
+            lines.append(f"    if {JUMP_CONDITIONS[jump]}:")
+            lines.append(f"        return {new_a}, {new_d}, a & 32767")
+        lines.append(f"    return {new_a}, {new_d}, pc + 1")
+        namespace: dict = {}
+        exec("\n".join(lines), namespace)
+        handler = _handler_cache[word] = namespace["handler"]
+    return handler
+
+
+def is_halt_loop(rom, address):
+    """Whether `address` starts the `(END) @END 0;JMP` idiom ending programs."""
+    if address + 1 >= len(rom) or rom[address] != address:
+        return False
+    word = rom[address + 1]
+    # unconditional jump, without any destination
+    return word >> 13 == 0b111 and word & 0b111 == 0b111 and not word & 0b111000
+
+
+class HackCPU:
+    """Hack computer emulator: CPU, 32K ROM and 32K words of RAM.
+
+    The ROM is decoded once: A-instructions into their value, and each
+    distinct C-instruction into a handler compiled by `make_handler`.
+    """
+
+    def __init__(self, rom: Sequence[int]) -> None:
+        if len(rom) > ROM_SIZE:
+            raise ValueError(f"program too large: {len(rom)} instructions")
+        self.ram = array("h", bytes(2 * RAM_SIZE))
+        self._ops = array("H", bytes(2 * ROM_SIZE))
+        self._args = array("H", bytes(2 * ROM_SIZE))
+        self._handlers: List[Optional[Handler]] = [None] * FIRST_HANDLER
+        handler_ops: Dict[int, int] = {}
+        for address, word in enumerate(rom):
+            if word < 0x8000:
+                self._args[address] = word
+                if is_halt_loop(rom, address):
+                    self._ops[address] = HALT_LOOP
+            else:
+                if word not in handler_ops:
+                    handler_ops[word] = len(self._handlers)
+                    self._handlers.append(make_handler(word))
+                self._ops[address] = handler_ops[word]
+        self.a = 0
+        self.d = 0
+        self.pc = 0
+        self.cycles = 0
+
+    def reset(self) -> None:
+        self.pc = 0
+
+    def run(self, nb_cycles: Optional[int] = None, stop_on_loop: bool = True) -> int:
+        """Execute up to `nb_cycles` instructions, or without limit if None.
+
+        With `stop_on_loop`, execution stops when the program enters the
+        infinite loop ending it. Return the number of executed instructions.
+        """
+        if nb_cycles is None:
+            if not stop_on_loop:
+                raise ValueError("cannot run without a limit nor a stop condition")
+            nb_cycles = sys.maxsize
+        ops, args, handlers, ram = self._ops, self._args, self._handlers, self.ram
+        a, d, pc = self.a, self.d, self.pc
+        executed = nb_cycles
+        for cycle in range(nb_cycles):
+            op = ops[pc]
+            if op == LOAD_A:
+                a = args[pc]
+                pc += 1
+            elif op != HALT_LOOP:
+                a, d, pc = handlers[op](a, d, pc, ram)
+            elif stop_on_loop:
+                executed = cycle
+                break
+            else:
+                a = args[pc]
+                pc += 1
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles += executed
+        return executed
+
+    def step(self) -> None:
+        self.run(1, stop_on_loop=False)
+
+
+def load_program(filename: str) -> Sequence[int]:
+    """Load a program from a .hack, binary .bin or .asm file."""
+    if filename.endswith(".bin"):
+        return load_rom(filename)
+    with open(filename) as stream:
+        if filename.endswith(".asm"):
+            parser = Parser(stream)
+            symbol_table = SymbolTable()
+            first_pass(parser, symbol_table)
+            parser.reset()
+            return second_pass(parser, symbol_table)
+        return read_hack(stream)
@@ -0,0 +1,86 @@
+from array import array
+import os
+import random
+import unittest
+
+from hack_cpu.cpu import *
+
+
+PROJECTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+
+
+def to_signed(value):
+    value &= 0xFFFF
+    return value - 0x10000 if value & 0x8000 else value
+
+
+def alu(comp, x, y):
+    """Reference implementation of the Hack ALU, from its control bits."""
+    if comp & 0b100000:
+        x = 0
+    if comp & 0b010000:
+        x = ~x
+    if comp & 0b001000:
+        y = 0
+    if comp & 0b000100:
+        y = ~y
+    out = x + y if comp & 0b000010 else x & y
+    if comp & 0b000001:
+        out = ~out
+    return to_signed(out)
+
+
+class TestHackCPU(unittest.TestCase):
+    def test_max(self):
+        cpu = HackCPU(load_program(os.path.join(PROJECTS_DIR, "05", "Max.hack")))
+        cpu.ram[0] = 3
+        cpu.ram[1] = -7
+        cpu.run()
+        assert cpu.ram[2] == 3
+        assert cpu.run() == 0
+
+    def test_rect(self):
+        asm_file = os.path.join(PROJECTS_DIR, "06", "rect", "Rect.asm")
+        cpu = HackCPU(load_program(asm_file))
+        cpu.ram[0] = 4
+        cpu.run()
+        rows = [cpu.ram[SCREEN + 32 * row] for row in range(6)]
+        assert rows == [-1, -1, -1, -1, 0, 0]
+
+    def test_run_cycles(self):
+        cpu = HackCPU([0b0000000000000111, 0b1110110000010000])  # @7, D=A
+        assert cpu.run(1) == 1
+        assert (cpu.a, cpu.d, cpu.pc) == (7, 0, 1)
+        cpu.step()
+        assert (cpu.a, cpu.d, cpu.pc, cpu.cycles) == (7, 7, 2, 2)
+
+    def test_handlers_follow_alu(self):
+        rand = random.Random(0)
+        values = [0, 1, -1, 32767, -32768, rand.randrange(-32768, 32768)]
+        ram = array("h", bytes(2 * RAM_SIZE))
+        for comp in range(128):
+            handler = make_handler(0b111 << 13 | comp << 6 | 0b010 << 3)  # D=comp
+            for a in values:
+                for d in values:
+                    for m in values:
+                        ram[a & 0x7FFF] = m
+                        y = m if comp & 0b1000000 else a
+                        _, out, _ = handler(a, d, 0, ram)
+                        assert out == alu(comp, d, y), (bin(comp), a, d, m)
+
+    def test_jumps(self):
+        conditions = [
+            lambda out: False,
+            lambda out: out > 0,
+            lambda out: out == 0,
+            lambda out: out >= 0,
+            lambda out: out < 0,
+            lambda out: out != 0,
+            lambda out: out <= 0,
+            lambda out: True,
+        ]
+        for jump, condition in enumerate(conditions):
+            handler = make_handler(0b1110001100000000 | jump)  # D;jump
+            for d in [-1, 0, 1]:
+                _, _, pc = handler(42, d, 0, array("h"))
+                assert pc == (42 if condition(d) else 1), (jump, d)
@@ -0,0 +1,46 @@
+import os
+import unittest
+
+from hack_cpu.cpu import *
+from hack_cpu.jit import *
+
+
+PROJECTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+
+
+def cpu_state(cpu):
+    return cpu.ram.tobytes(), cpu.a, cpu.d, cpu.pc, cpu.cycles
+
+
+class TestJitHackCPU(unittest.TestCase):
+    def test_same_as_interpreter(self):
+        program = load_program(os.path.join(PROJECTS_DIR, "06", "pong", "Pong.asm"))
+        for nb_cycles in [1, 1000, 123457]:
+            cpu, jit_cpu = HackCPU(program), JitHackCPU(program)
+            assert jit_cpu.run(nb_cycles) == cpu.run(nb_cycles) == nb_cycles
+            assert cpu_state(jit_cpu) == cpu_state(cpu), nb_cycles
+
+    def test_stop_on_loop(self):
+        program = load_program(os.path.join(PROJECTS_DIR, "05", "Max.hack"))
+        for values in [(3, -7), (-7, 3)]:
+            cpu, jit_cpu = HackCPU(program), JitHackCPU(program)
+            for address, value in enumerate(values):
+                cpu.ram[address] = jit_cpu.ram[address] = value
+            cpu.run()
+            jit_cpu.run()
+            assert jit_cpu.ram[2] == 3
+            assert cpu_state(jit_cpu) == cpu_state(cpu), values
+
+    def test_overflow(self):
+        # @32767, D=A, D=D+1, @5, M=D
+        program = [32767, 0b1110110000010000, 0b1110011111010000, 5, 0b1110001100001000]
+        cpu = JitHackCPU(program)
+        cpu.run(len(program))
+        assert cpu.ram[5] == -32768
+
+    def test_compile_block(self):
+        # @4, D;JGT, @3, D=A: the conditional jump is compiled into the block
+        block = compile_block([4, 0b1110001100000001, 3, 0b1110110000010000], 0)
+        assert block.length == 4
+        assert block.function(0, 1, None) == (4, 1, 4, 2)
+        assert block.function(0, 0, None) == (3, 3, 4, 4)
@@ -0,0 +1,107 @@
+import io
+import os
+import tempfile
+import unittest
+
+from assembler import *
+
+
+PROJECTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def assemble_file(filename):
+    with open(filename) as stream:
+        parser = Parser(stream)
+    symbol_table = SymbolTable()
+    first_pass(parser, symbol_table)
+    parser.reset()
+    output_stream = io.StringIO()
+    write_hack(second_pass(parser, symbol_table), output_stream)
+    return output_stream.getvalue()
+
+
+def stream_assemble_file(filename):
+    output_stream = io.StringIO()
+    with open(filename) as stream:
+        parser = StreamParser(stream)
+        symbol_table = SymbolTable()
+        first_pass(parser, symbol_table)
+        parser.reset()
+        write_hack(encode_commands(parser, symbol_table), output_stream)
+    return output_stream.getvalue()
+
+
+def read_reference(name):
+    with open(os.path.join(PROJECTS_DIR, "05", f"{name}.hack")) as stream:
+        return "".join(line.rstrip() + "\n" for line in stream)
+
+
+class TestAssembler(unittest.TestCase):
+    def test_reference_programs(self):
+        for name, asm_file in [
+            ("Add", "add/Add.asm"),
+            ("Max", "max/Max.asm"),
+            ("Max", "max/MaxL.asm"),
+            ("Rect", "rect/Rect.asm"),
+            ("Rect", "rect/RectL.asm"),
+        ]:
+            output = assemble_file(os.path.join(PROJECTS_DIR, "06", asm_file))
+            assert output == read_reference(name), asm_file
+
+    def test_stream_parser(self):
+        for asm_file in ["max/Max.asm", "pong/Pong.asm", "pong/PongL.asm"]:
+            filename = os.path.join(PROJECTS_DIR, "06", asm_file)
+            assert stream_assemble_file(filename) == assemble_file(filename)
+
+    def test_bin_format(self):
+        filename = os.path.join(PROJECTS_DIR, "06", "rect", "Rect.asm")
+        words = read_hack(io.StringIO(assemble_file(filename)))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            rom_filename = os.path.join(tmp_dir, "Rect.bin")
+            with open(rom_filename, "wb") as stream:
+                write_bin(words, stream)
+            assert os.path.getsize(rom_filename) == 2 * len(words)
+            rom = load_rom(rom_filename)
+            assert list(rom) == list(words)
+            del rom
+
+    def test_incremental_assemble(self):
+        filename = os.path.join(PROJECTS_DIR, "06", "pong", "Pong.asm")
+        with open(filename) as stream:
+            lines = stream.readlines()
+        # move labels and add a variable, both referenced from other chunks
+        edited_lines = lines[:1000] + ["@newvar\n", "M=0\n"] + lines[1010:]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_filename = os.path.join(tmp_dir, "Pong.asm.cache")
+            for source_lines, expected_misses in [(lines, None), (edited_lines, 1)]:
+                cache = AssemblyCache(cache_filename)
+                words = incremental_assemble(source_lines, cache, chunk_size=200)
+                cache.save()
+                parser = Parser(source_lines)
+                symbol_table = SymbolTable()
+                first_pass(parser, symbol_table)
+                parser.reset()
+                assert list(words) == second_pass(parser, symbol_table)
+                if expected_misses is not None:
+                    assert cache.nb_misses == expected_misses
+                    assert cache.nb_hits > 0
+
+    def test_parallel_assemble(self):
+        filename = os.path.join(PROJECTS_DIR, "06", "pong", "Pong.asm")
+        with open(filename) as stream:
+            words = parallel_assemble(stream, jobs=2, chunk_size=2000)
+        expected_words = read_hack(io.StringIO(assemble_file(filename)))
+        assert words == expected_words
+
+    def test_encode_c_instruction(self):
+        assert encode_c_instruction("D=M") == 0b1111110000010000
+        assert encode_c_instruction("0;JMP") == 0b1110101010000111
+        assert encode_c_instruction("AMD=D|M;JNE") == 0b1111010101111101
+        # dest letters in any order, commutative comp spellings
+        assert encode_c_instruction("DM=M+1") == encode_c_instruction("MD=M+1")
+        assert encode_c_instruction("A=A+D") == encode_c_instruction("A=D+A")
+
+    def test_encode_c_instruction_errors(self):
+        for cmd in ["D=X", "B=M", "0;JMP2"]:
+            with self.assertRaises(ValueError):
+                encode_c_instruction(cmd)
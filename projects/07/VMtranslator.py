@@ -1,4 +1,6 @@
+import io
 import sys
+from typing import NamedTuple
 
 
 class Parser:
@@ -51,10 +53,114 @@ class Parser:
             return self._cmds[self._cmd_index]
 
 
+WRITE_BUFFER_SIZE = 1 << 16
+
+
+class Template(NamedTuple):
+    """Instructions of a VM command, as text with `str.format` fields."""
+
+    text: str
+    size: int  # number of instructions, comments excluded
+
+
+def template(*instructions):
+    return Template(
+        "".join(f"{cmd}\n" for cmd in instructions),
+        sum(1 for cmd in instructions if not cmd.startswith("//")),
+    )
+
+
+# push D to the top of the stack
+PUSH_D = ["@SP", "A=M", "M=D", "@SP", "M=M+1"]
+# pop to the address in D, stored in R13 as allowed by the standard VM mapping
+POP_TO_D = ["@R13", "M=D", "@SP", "A=M-1", "D=M", "@R13", "A=M", "M=D", "@SP", "M=M-1"]
+
+# segment -> base symbol, and the instruction putting the base address in D
+SEGMENT_BASES = {
+    "local": ("LCL", "D=M"),
+    "argument": ("ARG", "D=M"),
+    "this": ("THIS", "D=M"),
+    "that": ("THAT", "D=M"),
+    "pointer": ("R3", "D=A"),
+    "temp": ("R5", "D=A"),
+}
+COMMENT = "// {cmd} {segment} {index}"
+
+
+def _push_templates():
+    templates = {
+        "constant": template(COMMENT, "@{index}", "D=A", *PUSH_D),
+        "static": template(COMMENT, "@{filename}.{index}", "D=M", *PUSH_D),
+    }
+    for segment, (base, load_base) in SEGMENT_BASES.items():
+        templates[segment] = template(
+            COMMENT, f"@{base}", load_base, "@{index}", "A=A+D", "D=M", *PUSH_D
+        )
+    return templates
+
+
+def _pop_templates():
+    templates = {"static": template(COMMENT, "@{filename}.{index}", "D=A", *POP_TO_D)}
+    for segment, (base, load_base) in SEGMENT_BASES.items():
+        templates[segment] = template(
+            COMMENT, f"@{base}", load_base, "@{index}", "D=A+D", *POP_TO_D
+        )
+    return templates
+
+
+PUSH_TEMPLATES = _push_templates()
+POP_TEMPLATES = _pop_templates()
+
+
+def _arithmetic_templates():
+    templates = {}
+    for cmd, op in [("add", "+"), ("sub", "-"), ("and", "&"), ("or", "|")]:
+        templates[cmd] = template(
+            f"// {cmd}", "@SP", "A=M-1", "D=M", "A=A-1", f"M=M{op}D", "@SP", "M=M-1"
+        )
+    for cmd, op in [("neg", "-"), ("not", "!")]:
+        templates[cmd] = template(f"// {cmd}", "@SP", "A=M-1", f"M={op}M")
+    # {true} and {end} are the addresses of the instructions setting true, and
+    # of the end of the comparison, relative to its first instruction: 13, 17
+    for cmd, jump in [("eq", "JEQ"), ("lt", "JLT"), ("gt", "JGT")]:
+        templates[cmd] = template(
+            f"// {cmd}",
+            "@SP",
+            "A=M-1",
+            "D=M",
+            "A=A-1",
+            "D=M-D",
+            "@{true}",
+            f"D;{jump}",
+            "@SP",
+            "A=M-1",
+            "A=A-1",
+            "M=0",
+            "@{end}",
+            "0;JMP",
+            "@SP",
+            "A=M-1",
+            "A=A-1",
+            "M=-1",
+            "@SP",
+            "M=M-1",
+        )
+    return templates
+
+
+ARITHMETIC_TEMPLATES = _arithmetic_templates()
+
+
 class CodeWriter:
+    """Write the assembly of VM commands, rendered from their Template.
+
+    The assembly is buffered, and written to the stream in large blocks.
+    """
+
     # NOTE: CodeWriter is owning the stream, and this is responsible for closing it
     def __init__(self, stream):
         self._stream = stream
+        self._buffer = io.StringIO()
         self._filename = None
         self._asm_cmd_index = 0
 
@@ -62,157 +168,42 @@ class CodeWriter:
         self._filename = filename
 
     def write_arithmetic(self, cmd):
-        if cmd == "add":
-            self._write_binary_op(cmd, "+")
-        elif cmd == "sub":
-            self._write_binary_op(cmd, "-")
-        elif cmd == "and":
-            self._write_binary_op(cmd, "&")
-        elif cmd == "or":
-            self._write_binary_op(cmd, "|")
-        elif cmd == "neg":
-            self._write_unary_op(cmd, "-")
-        elif cmd == "not":
-            self._write_unary_op(cmd, "!")
-        elif cmd == "eq":
-            self._write_compare_op(cmd, "JEQ")
-        elif cmd == "lt":
-            self._write_compare_op(cmd, "JLT")
-        elif cmd == "gt":
-            self._write_compare_op(cmd, "JGT")
-        else:
+        template = ARITHMETIC_TEMPLATES.get(cmd)
+        if template is None:
             raise ValueError(f"unrecognized arithmetic operation: {cmd}")
-
-    def _write_binary_op(self, cmd, op):
-        self._write_asm_cmd(f"// {cmd}")
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("A=M-1")
-        self._write_asm_cmd("D=M")
-        self._write_asm_cmd("A=A-1")
-        self._write_asm_cmd(f"M=M{op}D")
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("M=M-1")
-
-    def _write_unary_op(self, cmd, op):
-        self._write_asm_cmd(f"// {cmd}")
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("A=M-1")
-        self._write_asm_cmd(f"M={op}M")
-
-    def _write_compare_op(self, cmd, jmp):
-        self._write_asm_cmd(f"// {cmd}")
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("A=M-1")
-        self._write_asm_cmd("D=M")
-        self._write_asm_cmd("A=A-1")
-        self._write_asm_cmd("D=M-D")
-        self._write_asm_cmd(f"@{self._asm_cmd_index + 8}")
-        self._write_asm_cmd(f"D;{jmp}")
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("A=M-1")
-        self._write_asm_cmd("A=A-1")
-        self._write_asm_cmd("M=0")
-        self._write_asm_cmd(f"@{self._asm_cmd_index + 6}")
-        self._write_asm_cmd("0;JMP")
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("A=M-1")
-        self._write_asm_cmd("A=A-1")
-        self._write_asm_cmd("M=-1")
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("M=M-1")
+        index = self._asm_cmd_index
+        self._write_template(template, true=index + 13, end=index + 17)
 
     def write_push_pop(self, cmd, segment, index):
         if cmd == "C_PUSH":
-            self._write_push(cmd, segment, index)
+            templates = PUSH_TEMPLATES
         elif cmd == "C_POP":
-            self._write_pop(cmd, segment, index)
-
-    def _get_segment_base(self, segment, index):
-        if segment == "local":
-            return "LCL"
-        elif segment == "argument":
-            return "ARG"
-        elif segment == "this":
-            return "THIS"
-        elif segment == "that":
-            return "THAT"
-        elif segment == "pointer":
-            return "R3"
-        elif segment == "temp":
-            return "R5"
-        elif segment == "static":
-            return f"{self._filename}.{index}"
-        raise ValueError(f"unknown segment {segment}")
-
-    def _write_push(self, cmd, segment, index):
-        if segment == "constant":
-            self._write_asm_cmd(f"// {cmd} {segment} {index}")
-            self._write_asm_cmd(f"@{index}")
-            self._write_asm_cmd("D=A")
-            self._write_asm_cmd("@SP")
-            self._write_asm_cmd("A=M")
-            self._write_asm_cmd("M=D")
-            self._write_asm_cmd("@SP")
-            self._write_asm_cmd("M=M+1")
-            return
-
-        base = self._get_segment_base(segment, index)
-        self._write_asm_cmd(f"// {cmd} {segment} {index}")
-        # put in D the content of the address we want to push from
-        self._write_asm_cmd(f"@{base}")
-        if segment in ["pointer", "temp"]:
-            self._write_asm_cmd("D=A")
+            if segment == "constant":
+                raise ValueError("cannot pop to constant segment")
+            templates = POP_TEMPLATES
         else:
-            self._write_asm_cmd("D=M")
-        if segment != "static":
-            self._write_asm_cmd(f"@{index}")
-            self._write_asm_cmd("A=A+D")
-            self._write_asm_cmd("D=M")
-
-        # push D to the top of the stack
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("A=M")
-        self._write_asm_cmd("M=D")
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("M=M+1")
-
-    def _write_pop(self, cmd, segment, index):
-        if segment == "constant":
-            raise ValueError("cannot pop to constant segment")
-
-        base = self._get_segment_base(segment, index)
-        self._write_asm_cmd(f"// {cmd} {segment} {index}")
-        # put in D the address we want to pop to
-        self._write_asm_cmd(f"@{base}")
-        if segment in ["pointer", "temp", "static"]:
-            self._write_asm_cmd("D=A")
-        else:
-            self._write_asm_cmd("D=M")
-        if segment != "static":
-            self._write_asm_cmd(f"@{index}")
-            self._write_asm_cmd("D=A+D")
-
-        # pop to target address
-        # use R13 to store the target address.
-        # this is allowed as per the standard VM mapping.
-        self._write_asm_cmd("@R13")
-        self._write_asm_cmd("M=D")
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("A=M-1")
-        self._write_asm_cmd("D=M")
-        self._write_asm_cmd("@R13")
-        self._write_asm_cmd("A=M")
-        self._write_asm_cmd("M=D")
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("M=M-1")
-
-    def _write_asm_cmd(self, cmd):
-        self._stream.write(f"{cmd}\n")
-        # do not count comments
-        if not cmd.startswith("//"):
-            self._asm_cmd_index += 1
+            return
+        template = templates.get(segment)
+        if template is None:
+            raise ValueError(f"unknown segment {segment}")
+        self._write_template(
+            template, cmd=cmd, segment=segment, filename=self._filename, index=index
+        )
+
+    def _write_template(self, template, **fields):
+        self._buffer.write(template.text.format_map(fields))
+        self._asm_cmd_index += template.size
+        if self._buffer.tell() >= WRITE_BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered assembly to the stream."""
+        self._stream.write(self._buffer.getvalue())
+        self._buffer.seek(0)
+        self._buffer.truncate()
 
     def close(self):
+        self.flush()
         self._stream.close()
 
 
@@ -1,5 +1,22 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import io
 import os
+import re
 import sys
+from typing import Dict, List, NamedTuple, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "06"))
+
+from assembler import (  # noqa: E402
+    Command,
+    CommandParser,
+    OUTPUT_FORMATS,
+    parse_command,
+    second_pass,
+    SymbolTable,
+)
 
 
 class Parser:
@@ -24,6 +41,9 @@ class Parser:
     def advance(self):
         self._cmd_index += 1
 
+    def reset(self):
+        self._cmd_index = -1
+
     def command_type(self):
         current_cmd = self.current_command
         if current_cmd.startswith("push"):
@@ -65,328 +85,769 @@ class Parser:
             return self._cmds[self._cmd_index]
 
 
+WRITE_BUFFER_SIZE = 1 << 16
+
+
+class Template(NamedTuple):
+    """Instructions of a VM command, as text with `str.format` fields.
+
+    They are also parsed once into assembler Command records, written as they
+    are to an AssemblerStream: the fields are only in the symbols of A and L
+    commands, formatted by `Template.records`.
+    """
+
+    text: str
+    size: int  # number of instructions, labels excluded
+    commands: Tuple[Command, ...]
+    # indexes of the commands with fields in their symbol
+    field_indexes: Tuple[int, ...]
+
+    def records(self, fields):
+        """Command records of the instructions, with their fields."""
+        if not self.field_indexes:
+            return self.commands
+        commands = list(self.commands)
+        for i in self.field_indexes:
+            command = commands[i]
+            symbol = command.symbol.format_map(fields)
+            if command.command_type == "A_COMMAND":
+                commands[i] = command._replace(text=f"@{symbol}", symbol=symbol)
+            else:
+                commands[i] = command._replace(text=f"({symbol})", symbol=symbol)
+        return commands
+
+
+def template(*instructions):
+    commands = tuple(parse_command(cmd) for cmd in instructions)
+    field_indexes = tuple(i for i, cmd in enumerate(instructions) if "{" in cmd)
+    for i in field_indexes:
+        if commands[i].command_type == "C_COMMAND":
+            raise ValueError(f"fields of C-command {instructions[i]}")
+    return Template(
+        "".join(f"{cmd}\n" for cmd in instructions),
+        sum(1 for cmd in instructions if not cmd.startswith("(")),
+        commands,
+        field_indexes,
+    )
+
+
+# push D to the top of the stack
+PUSH_D = ["@SP", "A=M", "M=D", "@SP", "M=M+1"]
+# pop to the address in D, stored in R13 as allowed by the standard VM mapping
+POP_TO_D = ["@R13", "M=D", "@SP", "A=M-1", "D=M", "@R13", "A=M", "M=D", "@SP", "M=M-1"]
+
+# segment -> base symbol, and the instruction putting the base address in D
+SEGMENT_BASES = {
+    "local": ("LCL", "D=M"),
+    "argument": ("ARG", "D=M"),
+    "this": ("THIS", "D=M"),
+    "that": ("THAT", "D=M"),
+    "pointer": ("R3", "D=A"),
+    "temp": ("R5", "D=A"),
+}
+
+
+def _push_templates():
+    templates = {
+        "constant": template("@{index}", "D=A", *PUSH_D),
+        "static": template("@{filename}.{index}", "D=M", *PUSH_D),
+    }
+    for segment, (base, load_base) in SEGMENT_BASES.items():
+        templates[segment] = template(
+            f"@{base}", load_base, "@{index}", "A=A+D", "D=M", *PUSH_D
+        )
+    return templates
+
+
+def _pop_templates():
+    templates = {"static": template("@{filename}.{index}", "D=A", *POP_TO_D)}
+    for segment, (base, load_base) in SEGMENT_BASES.items():
+        templates[segment] = template(
+            f"@{base}", load_base, "@{index}", "D=A+D", *POP_TO_D
+        )
+    return templates
+
+
+PUSH_TEMPLATES = _push_templates()
+POP_TEMPLATES = _pop_templates()
+
+
+COMPARE_JUMPS = {"eq": "JEQ", "lt": "JLT", "gt": "JGT"}
+
+
+def _arithmetic_templates():
+    templates = {}
+    for cmd, op in [("add", "+"), ("sub", "-"), ("and", "&"), ("or", "|")]:
+        templates[cmd] = template(
+            "@SP", "A=M-1", "D=M", "A=A-1", f"M=M{op}D", "@SP", "M=M-1"
+        )
+    for cmd, op in [("neg", "-"), ("not", "!")]:
+        templates[cmd] = template("@SP", "A=M-1", f"M={op}M")
+    # {true} and {end} are the addresses of the instructions setting true, and
+    # of the end of the comparison, relative to its first instruction: 13, 17
+    for cmd, jump in COMPARE_JUMPS.items():
+        templates[cmd] = template(
+            "@SP",
+            "A=M-1",
+            "D=M",
+            "A=A-1",
+            "D=M-D",
+            "@{true}",
+            f"D;{jump}",
+            "@SP",
+            "A=M-1",
+            "A=A-1",
+            "M=0",
+            "@{end}",
+            "0;JMP",
+            "@SP",
+            "A=M-1",
+            "A=A-1",
+            "M=-1",
+            "@SP",
+            "M=M-1",
+        )
+    return templates
+
+
+ARITHMETIC_TEMPLATES = _arithmetic_templates()
+
+
+def _compare_routine(cmd, jump):
+    """Routine popping the two values on top of the stack, and returning the
+    result of their comparison in D to the address in D."""
+    name = f"$${cmd.upper()}"
+    return_to_r15 = ["@R15", "A=M", "0;JMP"]
+    return template(
+        f"({name})",
+        "@R15",
+        "M=D",
+        "@SP",
+        "M=M-1",
+        "AM=M-1",
+        "D=M",
+        "A=A+1",
+        "D=D-M",
+        f"@{name}_TRUE",
+        f"D;{jump}",
+        "D=0",
+        *return_to_r15,
+        f"({name}_TRUE)",
+        "D=-1",
+        *return_to_r15,
+    )
+
+
+COMPARE_ROUTINES = {
+    cmd: _compare_routine(cmd, jump) for cmd, jump in COMPARE_JUMPS.items()
+}
+# D = return address
+SHARED_COMPARES = {
+    cmd: template(
+        "@{return_label}", "D=A", f"@$${cmd.upper()}", "0;JMP", "({return_label})"
+    )
+    for cmd in COMPARE_JUMPS
+}
+
+
+def _call_frame(*load_nb_args):
+    """Push the return address in D and the segments, set ARG and LCL."""
+    instructions = list(PUSH_D)
+    # push memory segments
+    for segment in ["LCL", "ARG", "THIS", "THAT"]:
+        instructions += [f"@{segment}", "D=M", *PUSH_D]
+    # ARG = SP - n - 5
+    instructions += [*load_nb_args, "@5", "D=D+A", "@SP", "D=M-D", "@ARG", "M=D"]
+    # LCL = SP
+    instructions += ["@SP", "D=M", "@LCL", "M=D"]
+    return instructions
+
+
+def _return_frame():
+    # FRAME = LCL (stored in R14)
+    instructions = ["@LCL", "D=M", "@R14", "M=D"]
+    # RET = *(FRAME - 5) (stored in R15)
+    instructions += ["@5", "D=A", "@R14", "D=M-D", "A=D", "D=M", "@R15", "M=D"]
+    # *ARG = POP()
+    instructions += ["@ARG", "D=M", "@0", "D=A+D", *POP_TO_D]
+    # SP = ARG + 1
+    instructions += ["@ARG", "D=M+1", "@SP", "M=D"]
+    # restore segments from caller
+    for segment in ["THAT", "THIS", "ARG", "LCL"]:
+        instructions += ["@R14", "M=M-1", "A=M", "D=M", f"@{segment}", "M=D"]
+    # GOTO RET
+    instructions += ["@R15", "A=M", "0;JMP"]
+    return instructions
+
+
+BOOTSTRAP = template("@256", "D=A", "@SP", "M=D")
+HALT = template("@{address}", "0;JMP")
+LABEL = template("({function}${label})")
+GOTO = template("@{function}${label}", "0;JMP")
+IF_GOTO = template("@SP", "M=M-1", "A=M", "D=M", "@{function}${label}", "D;JNE")
+CALL = template(
+    "@{return_label}",
+    "D=A",
+    *_call_frame("@{nb_args}", "D=A"),
+    "@{name}",
+    "0;JMP",
+    "({return_label})",
+)
+# R13 = function, R14 = nb_args, D = return address
+SHARED_CALL = template(
+    "@{name}",
+    "D=A",
+    "@R13",
+    "M=D",
+    "@{nb_args}",
+    "D=A",
+    "@R14",
+    "M=D",
+    "@{return_label}",
+    "D=A",
+    "@$$CALL",
+    "0;JMP",
+    "({return_label})",
+)
+FUNCTION = template("({name})")
+RETURN = template(*_return_frame())
+SHARED_RETURN = template("@$$RETURN", "0;JMP")
+CALL_ROUTINE = template("($$CALL)", *_call_frame("@R14", "D=M"), "@R13", "A=M", "0;JMP")
+RETURN_ROUTINE = template("($$RETURN)", *_return_frame())
+
+# With the top of the stack cached in D, the stack in RAM holds the values
+# below it: a push spills D then loads the value in D, a pop stores D.
+SPILL = template("@SP", "AM=M+1", "A=A-1", "M=D")
+# load the top of the stack in RAM to D
+LOAD_TOP = template("@SP", "AM=M-1", "D=M")
+# a base+index address from A, until loading the index becomes shorter
+MAX_INCREMENTED_INDEX = 9
+FIXED_SEGMENTS = {"pointer": 3, "temp": 5}
+
+
+def _cached_push_templates():
+    templates = {
+        "constant": template("@{index}", "D=A"),
+        "static": template("@{filename}.{index}", "D=M"),
+    }
+    for segment in FIXED_SEGMENTS:
+        templates[segment] = template("@{address}", "D=M")
+    for segment, (base, _) in SEGMENT_BASES.items():
+        if segment not in FIXED_SEGMENTS:
+            templates[segment, 0] = template(f"@{base}", "A=M", "D=M")
+            templates[segment, 1] = template(f"@{base}", "A=M+1", "D=M")
+            templates[segment] = template(
+                f"@{base}", "D=M", "@{index}", "A=D+A", "D=M"
+            )
+    return templates
+
+
+def _cached_pop_templates():
+    templates = {"static": template("@{filename}.{index}", "M=D")}
+    for segment in FIXED_SEGMENTS:
+        templates[segment] = template("@{address}", "M=D")
+    for segment, (base, _) in SEGMENT_BASES.items():
+        if segment not in FIXED_SEGMENTS:
+            for index in range(MAX_INCREMENTED_INDEX + 1):
+                templates[segment, index] = template(
+                    f"@{base}", "A=M", *["A=A+1"] * index, "M=D"
+                )
+            # D is kept in R13 while the address is computed to R14
+            templates[segment] = template(
+                "@R13",
+                "M=D",
+                f"@{base}",
+                "D=M",
+                "@{index}",
+                "D=D+A",
+                "@R14",
+                "M=D",
+                "@R13",
+                "D=M",
+                "@R14",
+                "A=M",
+                "M=D",
+            )
+    return templates
+
+
+def _cached_arithmetic_templates():
+    """Templates of the operations on D and the value below it, to D."""
+    templates = {}
+    for cmd, comp in [("add", "D+M"), ("sub", "M-D"), ("and", "D&M"), ("or", "D|M")]:
+        templates[cmd] = template("@SP", "AM=M-1", f"D={comp}")
+    # {true} and {end} are relative to the first instruction: 8 and 9
+    for cmd, jump in COMPARE_JUMPS.items():
+        templates[cmd] = template(
+            "@SP",
+            "AM=M-1",
+            "D=M-D",
+            "@{true}",
+            f"D;{jump}",
+            "D=0",
+            "@{end}",
+            "0;JMP",
+            "D=-1",
+        )
+    return templates
+
+
+CACHED_PUSH_TEMPLATES = _cached_push_templates()
+CACHED_POP_TEMPLATES = _cached_pop_templates()
+CACHED_ARITHMETIC_TEMPLATES = _cached_arithmetic_templates()
+# unary operations on D, and on the top of the stack in RAM to D
+CACHED_UNARY_TEMPLATES = {
+    "neg": (template("D=-D"), template("@SP", "AM=M-1", "D=-M")),
+    "not": (template("D=!D"), template("@SP", "AM=M-1", "D=!M")),
+}
+CACHED_IF_GOTO = template("@{function}${label}", "D;JNE")
+
+
 class CodeWriter:
+    """Write the assembly of VM commands, rendered from their Template.
+
+    The assembly is buffered, and written to the stream in large blocks. An
+    AssemblerStream is written the Command records of the templates instead.
+    """
+
     # NOTE: CodeWriter is owning the stream, and thus is responsible for closing it
-    def __init__(self, stream):
+    def __init__(
+        self,
+        stream,
+        shared_routines=False,
+        shared_compares=False,
+        cache_top=False,
+        relocatable=False,
+    ):
         self._stream = stream
+        # the stream takes Command records, see AssemblerStream
+        self._records = hasattr(stream, "write_records")
+        self._buffer = io.StringIO()
         self._filename = None
         self._asm_cmd_index = 0
         self._current_function_name = None
+        # calls and returns jump to the routines written by write_shared_routines
+        self._shared_routines = shared_routines
+        # and so do comparisons, to the routine of their operation
+        self._shared_compares = shared_compares
+        # the comparisons cached in D are shorter inlined
+        self._compare_routines = shared_compares and not cache_top
+        # the top of the stack is kept in D between stack commands, and only
+        # written to the stack in RAM before labels, jumps, calls and returns
+        self._cache_top = cache_top
+        self._top_in_d = False
+        # addresses are written <relative to the first instruction>, see relocate
+        self._relocatable = relocatable
+        self.nb_calls = 0
+        self.nb_returns = 0
+        self.nb_compares = dict.fromkeys(COMPARE_JUMPS, 0)
+        self.shared_routines_saving = 0
 
     def set_filename(self, filename):
         self._filename = filename
 
     def write_bootstrap_code(self):
         # SP = 256
-        self._write_asm_cmd("@256")
-        self._write_asm_cmd("D=A")
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("M=D")
+        self._write_template(BOOTSTRAP)
         # call Sys.init
         self.write_call("Sys.init", 0)
         # infinite loop
-        self._write_asm_cmd(f"@{self._asm_cmd_index}")
-        self._write_asm_cmd("0;JMP")
+        self._write_template(HALT, address=self._address())
 
     def write_arithmetic(self, cmd):
-        if cmd == "add":
-            self._write_binary_op("+")
-        elif cmd == "sub":
-            self._write_binary_op("-")
-        elif cmd == "and":
-            self._write_binary_op("&")
-        elif cmd == "or":
-            self._write_binary_op("|")
-        elif cmd == "neg":
-            self._write_unary_op("-")
-        elif cmd == "not":
-            self._write_unary_op("!")
-        elif cmd == "eq":
-            self._write_compare_op("JEQ")
-        elif cmd == "lt":
-            self._write_compare_op("JLT")
-        elif cmd == "gt":
-            self._write_compare_op("JGT")
-        else:
+        if cmd in COMPARE_JUMPS:
+            self.nb_compares[cmd] += 1
+            if self._compare_routines:
+                self.write_spill()
+                return_label = f"RET_{self._address()}"
+                self._write_template(SHARED_COMPARES[cmd], return_label=return_label)
+                # the result is left in D, as with cache_top
+                self._top_in_d = True
+                return
+        if self._cache_top or self._top_in_d:
+            # without cache_top, on the result of a shared comparison
+            self._write_cached_arithmetic(cmd)
+            return
+        template = ARITHMETIC_TEMPLATES.get(cmd)
+        if template is None:
             raise ValueError(f"unrecognized arithmetic operation: {cmd}")
-
-    def _write_binary_op(self, op):
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("A=M-1")
-        self._write_asm_cmd("D=M")
-        self._write_asm_cmd("A=A-1")
-        self._write_asm_cmd(f"M=M{op}D")
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("M=M-1")
-
-    def _write_unary_op(self, op):
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("A=M-1")
-        self._write_asm_cmd(f"M={op}M")
-
-    def _write_compare_op(self, jmp):
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("A=M-1")
-        self._write_asm_cmd("D=M")
-        self._write_asm_cmd("A=A-1")
-        self._write_asm_cmd("D=M-D")
-        self._write_asm_cmd(f"@{self._asm_cmd_index + 8}")
-        self._write_asm_cmd(f"D;{jmp}")
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("A=M-1")
-        self._write_asm_cmd("A=A-1")
-        self._write_asm_cmd("M=0")
-        self._write_asm_cmd(f"@{self._asm_cmd_index + 6}")
-        self._write_asm_cmd("0;JMP")
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("A=M-1")
-        self._write_asm_cmd("A=A-1")
-        self._write_asm_cmd("M=-1")
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("M=M-1")
+        self._write_template(template, true=self._address(13), end=self._address(17))
 
     def write_push_pop(self, cmd, segment, index):
         if cmd == "C_PUSH":
-            self._write_push(segment, index)
+            templates = PUSH_TEMPLATES
         elif cmd == "C_POP":
-            self._write_pop(segment, index)
-
-    def _get_segment_base(self, segment, index):
-        if segment == "local":
-            return "LCL"
-        elif segment == "argument":
-            return "ARG"
-        elif segment == "this":
-            return "THIS"
-        elif segment == "that":
-            return "THAT"
-        elif segment == "pointer":
-            return "R3"
-        elif segment == "temp":
-            return "R5"
-        elif segment == "static":
-            return f"{self._filename}.{index}"
-        raise ValueError(f"unknown segment {segment}")
-
-    def _write_push(self, segment, index):
-        if segment == "constant":
-            self._write_asm_cmd(f"@{index}")
-            self._write_asm_cmd("D=A")
-            self._write_asm_cmd("@SP")
-            self._write_asm_cmd("A=M")
-            self._write_asm_cmd("M=D")
-            self._write_asm_cmd("@SP")
-            self._write_asm_cmd("M=M+1")
+            if segment == "constant":
+                raise ValueError("cannot pop to constant segment")
+            templates = POP_TEMPLATES
+        else:
+            return
+        if self._cache_top or self._top_in_d and cmd == "C_POP":
+            self._write_cached_push_pop(cmd, segment, index)
             return
+        # without cache_top, a comparison result in D is only popped from D
+        self.write_spill()
+        template = templates.get(segment)
+        if template is None:
+            raise ValueError(f"unknown segment {segment}")
+        self._write_template(template, filename=self._filename, index=index)
 
-        base = self._get_segment_base(segment, index)
-        # put in D the content of the address we want to push from
-        self._write_asm_cmd(f"@{base}")
-        if segment in ["pointer", "temp"]:
-            self._write_asm_cmd("D=A")
-        else:
-            self._write_asm_cmd("D=M")
-        if segment != "static":
-            self._write_asm_cmd(f"@{index}")
-            self._write_asm_cmd("A=A+D")
-            self._write_asm_cmd("D=M")
-
-        # push D to the top of the stack
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("A=M")
-        self._write_asm_cmd("M=D")
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("M=M+1")
-
-    def _write_pop(self, segment, index):
-        if segment == "constant":
-            raise ValueError("cannot pop to constant segment")
-
-        base = self._get_segment_base(segment, index)
-        # put in D the address we want to pop to
-        self._write_asm_cmd(f"@{base}")
-        if segment in ["pointer", "temp", "static"]:
-            self._write_asm_cmd("D=A")
+    def _write_cached_push_pop(self, cmd, segment, index):
+        templates = CACHED_PUSH_TEMPLATES if cmd == "C_PUSH" else CACHED_POP_TEMPLATES
+        template = templates.get((segment, index)) or templates.get(segment)
+        if template is None:
+            raise ValueError(f"unknown segment {segment}")
+        if cmd == "C_PUSH":
+            self.write_spill()
+        elif not self._top_in_d:
+            self._write_template(LOAD_TOP)
+        self._write_template(
+            template,
+            filename=self._filename,
+            index=index,
+            address=FIXED_SEGMENTS.get(segment, 0) + index,
+        )
+        self._top_in_d = cmd == "C_PUSH"
+
+    def _write_cached_arithmetic(self, cmd):
+        if cmd in CACHED_UNARY_TEMPLATES:
+            on_d, on_stack = CACHED_UNARY_TEMPLATES[cmd]
+            self._write_template(on_d if self._top_in_d else on_stack)
         else:
-            self._write_asm_cmd("D=M")
-        if segment != "static":
-            self._write_asm_cmd(f"@{index}")
-            self._write_asm_cmd("D=A+D")
-
-        # pop to target address
-        # use R13 to store the target address.
-        # this is allowed as per the standard VM mapping.
-        self._write_asm_cmd("@R13")
-        self._write_asm_cmd("M=D")
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("A=M-1")
-        self._write_asm_cmd("D=M")
-        self._write_asm_cmd("@R13")
-        self._write_asm_cmd("A=M")
-        self._write_asm_cmd("M=D")
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("M=M-1")
+            template = CACHED_ARITHMETIC_TEMPLATES.get(cmd)
+            if template is None:
+                raise ValueError(f"unrecognized arithmetic operation: {cmd}")
+            if not self._top_in_d:
+                self._write_template(LOAD_TOP)
+            self._write_template(template, true=self._address(8), end=self._address(9))
+        self._top_in_d = True
+
+    def write_spill(self):
+        """Write the top of the stack cached in D, if any, to the stack."""
+        if self._top_in_d:
+            self._write_template(SPILL)
+            self._top_in_d = False
 
     def write_label(self, label):
-        self._write_asm_cmd(f"({self._build_asm_function_label(label)})")
+        self.write_spill()
+        self._write_template(LABEL, function=self._current_function_name, label=label)
 
     def write_goto(self, label):
-        self._write_asm_cmd(f"@{self._build_asm_function_label(label)}")
-        self._write_asm_cmd("0;JMP")
+        self.write_spill()
+        self._write_template(GOTO, function=self._current_function_name, label=label)
 
     def write_if(self, label):
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("M=M-1")
-        self._write_asm_cmd("A=M")
-        self._write_asm_cmd("D=M")
-        self._write_asm_cmd(f"@{self._build_asm_function_label(label)}")
-        self._write_asm_cmd("D;JNE")
+        template = CACHED_IF_GOTO if self._top_in_d else IF_GOTO
+        self._top_in_d = False
+        self._write_template(
+            template, function=self._current_function_name, label=label
+        )
 
     def write_call(self, name, nb_args):
-        # push return address
-        return_label = f"RET_{self._asm_cmd_index}"
-        self._write_asm_cmd(f"@{return_label}")
-        self._write_asm_cmd("D=A")
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("A=M")
-        self._write_asm_cmd("M=D")
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("M=M+1")
-
-        # push memory segments
-        def _save_segment(segment):
-            self._write_asm_cmd(f"@{segment}")
-            self._write_asm_cmd("D=M")
-            self._write_asm_cmd("@SP")
-            self._write_asm_cmd("A=M")
-            self._write_asm_cmd("M=D")
-            self._write_asm_cmd("@SP")
-            self._write_asm_cmd("M=M+1")
-
-        _save_segment("LCL")
-        _save_segment("ARG")
-        _save_segment("THIS")
-        _save_segment("THAT")
-        # ARG = SP - n - 5
-        self._write_asm_cmd(f"@{nb_args}")
-        self._write_asm_cmd("D=A")
-        self._write_asm_cmd("@5")
-        self._write_asm_cmd("D=D+A")
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("D=M-D")
-        self._write_asm_cmd("@ARG")
-        self._write_asm_cmd("M=D")
-        # LCL = SP
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("D=M")
-        self._write_asm_cmd("@LCL")
-        self._write_asm_cmd("M=D")
-
-        # jump to function
-        self._write_asm_cmd(f"@{name}")
-        self._write_asm_cmd("0;JMP")
-        # set return label
-        self._write_asm_cmd(f"({return_label})")
+        self.write_spill()
+        self.nb_calls += 1
+        self._write_template(
+            SHARED_CALL if self._shared_routines else CALL,
+            name=name,
+            nb_args=nb_args,
+            return_label=f"RET_{self._address()}",
+        )
 
     def write_function(self, name, nb_locals):
+        self.write_spill()
         self._current_function_name = name
-        self._write_asm_cmd(f"({name})")
+        self._write_template(FUNCTION, name=name)
         for _ in range(nb_locals):
-            self._write_push("constant", 0)
+            self._write_template(PUSH_TEMPLATES["constant"], index=0)
 
     def write_return(self):
-        # FRAME = LCL (stored in R14)
-        self._write_asm_cmd("@LCL")
-        self._write_asm_cmd("D=M")
-        self._write_asm_cmd("@R14")
-        self._write_asm_cmd("M=D")
-        # RET = *(FRAME - 5) (stored in R15)
-        self._write_asm_cmd("@5")
-        self._write_asm_cmd("D=A")
-        self._write_asm_cmd("@R14")
-        self._write_asm_cmd("D=M-D")
-        self._write_asm_cmd("A=D")
-        self._write_asm_cmd("D=M")
-        self._write_asm_cmd("@R15")
-        self._write_asm_cmd("M=D")
-        # *ARG = POP()
-        self._write_pop("argument", 0)
-        # SP = ARG + 1
-        self._write_asm_cmd("@ARG")
-        self._write_asm_cmd("D=M+1")
-        self._write_asm_cmd("@SP")
-        self._write_asm_cmd("M=D")
-
-        # restore segments from caller
-        def _restore_from_caller(segment):
-            self._write_asm_cmd("@R14")
-            self._write_asm_cmd("M=M-1")
-            self._write_asm_cmd("A=M")
-            self._write_asm_cmd("D=M")
-            self._write_asm_cmd(f"@{segment}")
-            self._write_asm_cmd("M=D")
-
-        _restore_from_caller("THAT")
-        _restore_from_caller("THIS")
-        _restore_from_caller("ARG")
-        _restore_from_caller("LCL")
-        # GOTO RET
-        self._write_asm_cmd("@R15")
-        self._write_asm_cmd("A=M")
-        self._write_asm_cmd("0;JMP")
-
-    def _write_asm_cmd(self, cmd):
-        self._stream.write(f"{cmd}\n")
-        # labels will not be removed by assembler, so we must not count them
-        if not cmd.startswith("("):
-            self._asm_cmd_index += 1
-
-    def _build_asm_function_label(self, label):
-        return f"{self._current_function_name}${label}"
+        self.write_spill()
+        self.nb_returns += 1
+        self._write_template(SHARED_RETURN if self._shared_routines else RETURN)
+
+    def write_shared_routines(self):
+        """Write the routines used by calls, returns and comparisons.
+
+        Their instructions are shared by all the calls and returns, instead of
+        being repeated by each one of them, see `shared_routines_saving`, and
+        so are the ones of each comparison, see `count_instructions`.
+        """
+        if self._compare_routines and any(self.nb_compares.values()):
+            self._write_compare_routines()
+        if not self._shared_routines or not self.nb_calls and not self.nb_returns:
+            return
+        self._write_template(CALL_ROUTINE)
+        self._write_template(RETURN_ROUTINE)
+        call_size = CALL_ROUTINE.size
+        return_size = RETURN_ROUTINE.size
+        # an inlined call is one instruction longer than $$CALL: two to load
+        # the return address, two to jump instead of three from R13
+        self.shared_routines_saving = (
+            self.nb_calls * (call_size + 1 - SHARED_CALL.size)
+            + self.nb_returns * (return_size - SHARED_RETURN.size)
+            - call_size
+            - return_size
+        )
+
+    def _write_compare_routines(self):
+        # without bootstrap, the program may end by running into the routines
+        self._write_template(HALT, address=self._address())
+        for cmd, nb_compares in self.nb_compares.items():
+            if nb_compares:
+                self._write_template(COMPARE_ROUTINES[cmd])
+
+    def write_relocated(self, translated_file):
+        """Write the relocatable assembly of a file, see translate_file."""
+        self._buffer.write(relocate(translated_file.asm, self._asm_cmd_index))
+        self._asm_cmd_index += translated_file.nb_instructions
+        self.nb_calls += translated_file.nb_calls
+        self.nb_returns += translated_file.nb_returns
+        for cmd, nb_compares in translated_file.nb_compares.items():
+            self.nb_compares[cmd] += nb_compares
+        if self._buffer.tell() >= WRITE_BUFFER_SIZE:
+            self.flush()
+
+    @property
+    def options(self):
+        """Constructor arguments changing the code written."""
+        return {
+            "shared_routines": self._shared_routines,
+            "shared_compares": self._shared_compares,
+            "cache_top": self._cache_top,
+        }
+
+    @property
+    def nb_instructions(self):
+        return self._asm_cmd_index
+
+    def _address(self, offset=0):
+        """Address of the instruction written `offset` instructions from now."""
+        address = self._asm_cmd_index + offset
+        return f"<{address}>" if self._relocatable else address
+
+    def _write_template(self, template, **fields):
+        self._asm_cmd_index += template.size
+        if self._records:
+            if self._buffer.tell():
+                # the relocated text of the files translated in parallel
+                self.flush()
+            self._stream.write_records(template.records(fields))
+            return
+        self._buffer.write(template.text.format_map(fields))
+        if self._buffer.tell() >= WRITE_BUFFER_SIZE:
+            self.flush()
 
     def write_comment(self, comment):
-        self._stream.write(f"// {comment}\n")
+        self._buffer.write(f"// {comment}\n")
+
+    def flush(self):
+        """Write the buffered assembly to the stream."""
+        self._stream.write(self._buffer.getvalue())
+        self._buffer.seek(0)
+        self._buffer.truncate()
 
     def close(self):
+        self.flush()
         self._stream.close()
 
 
-if __name__ == "__main__":
-    arg = sys.argv[1]
-    if os.path.isfile(arg):
-        filenames = [arg]
-        output_filename = arg.split(".")[0] + ".asm"
-    elif os.path.isdir(arg):
-        filenames = [
-            os.path.join(arg, fn) for fn in os.listdir(arg) if fn.endswith(".vm")
-        ]
-        output_filename = os.path.join(
-            arg, os.path.split(arg.strip(os.sep))[1] + ".asm"
-        )
-    else:
-        print("file not found")
-        sys.exit(1)
-    if len(filenames) == 0:
-        print("no vm file found in this folder")
-        sys.exit(1)
+def reachable_functions(parsers, entry_points):
+    """Names of the functions called, directly or not, from `entry_points`.
 
-    parsers = []
-    for fn in filenames:
-        with open(fn) as input_file:
-            parsers.append(Parser(input_file))
+    The code of a file before its first function is named None.
+    """
+    calls = {}
+    for parser in parsers:
+        function = None
+        calls.setdefault(function, set())
+        while parser.has_more_commands():
+            parser.advance()
+            cmd_type = parser.command_type()
+            if cmd_type == "C_FUNCTION":
+                function = parser.arg1()
+                calls.setdefault(function, set())
+            elif cmd_type == "C_CALL":
+                calls[function].add(parser.arg1())
+        parser.reset()
+    reachable = set()
+    to_visit = list(entry_points)
+    while to_visit:
+        function = to_visit.pop()
+        if function not in reachable:
+            reachable.add(function)
+            to_visit.extend(calls.get(function, ()))
+    return reachable
+
+
+# the stack grows from 256 up to the heap
+STACK_BASE = 256
+HEAP_BASE = 2048
+# words pushed by a call above its arguments: return address, LCL, ARG, THIS
+# and THAT
+FRAME_SIZE = 5
+
+
+class FunctionStack(NamedTuple):
+    """Stack words of a function, without the functions it calls."""
+
+    nb_locals: int
+    max_depth: int  # of the operand stack, above the locals
+    # called function, and the operand stack depth with its arguments
+    calls: List[Tuple[str, int]]
+
+
+def _function_stack(nb_locals, commands):
+    """Follow the operand stack depth along the branches of a function."""
+    labels = {
+        arg1: index
+        for index, (cmd_type, arg1, _) in enumerate(commands)
+        if cmd_type == "C_LABEL"
+    }
+    depths = [None] * len(commands)
+    to_visit = [0] if commands else []
+    if commands:
+        depths[0] = 0
+    max_depth = 0
+    calls = {}
+    while to_visit:
+        index = to_visit.pop()
+        depth = depths[index]
+        cmd_type, arg1, arg2 = commands[index]
+        next_indexes = [index + 1]
+        if cmd_type == "C_PUSH":
+            depth += 1
+        elif cmd_type in ("C_POP", "C_IF"):
+            depth -= 1
+        elif cmd_type == "C_ARITHMETIC" and arg1 not in ("neg", "not"):
+            depth -= 1
+        elif cmd_type == "C_CALL":
+            calls[index] = (arg1, depth)
+            depth += 1 - arg2
+        elif cmd_type == "C_RETURN":
+            next_indexes = []
+        if cmd_type == "C_GOTO":
+            next_indexes = [labels[arg1]] if arg1 in labels else []
+        elif cmd_type == "C_IF" and arg1 in labels:
+            next_indexes.append(labels[arg1])
+        max_depth = max(max_depth, depth)
+        for next_index in next_indexes:
+            # the compiled code has the same depth on all the paths to a label
+            if next_index < len(commands) and depths[next_index] is None:
+                depths[next_index] = depth
+                to_visit.append(next_index)
+    return FunctionStack(nb_locals, max_depth, [calls[i] for i in sorted(calls)])
 
-    output_file = open(output_filename, "w")
-    code_writer = CodeWriter(output_file)
-    if not (len(sys.argv) > 2 and sys.argv[2] == "no_bootstrap"):
+
+def function_stacks(parsers):
+    """Stack words of each function of the parsed VM files.
+
+    The code of a file before its first function is named None.
+    """
+    functions = {}
+    for parser in parsers:
+        function, nb_locals, commands = None, 0, []
+        while parser.has_more_commands():
+            parser.advance()
+            cmd_type = parser.command_type()
+            if cmd_type == "C_FUNCTION":
+                if commands or function is not None:
+                    functions[function] = _function_stack(nb_locals, commands)
+                function, nb_locals, commands = parser.arg1(), parser.arg2(), []
+                continue
+            arg1 = parser.arg1() if cmd_type != "C_RETURN" else None
+            arg2 = parser.arg2() if cmd_type == "C_CALL" else None
+            commands.append((cmd_type, arg1, arg2))
+        if commands or function is not None:
+            functions[function] = _function_stack(nb_locals, commands)
+        parser.reset()
+    return functions
+
+
+class StackUsage(NamedTuple):
+    """Worst case of the stack words used by a call, over its call paths."""
+
+    nb_words: int
+    path: List[str]  # functions of the worst call path
+    # functions whose recursive calls are not counted
+    recursive: List[str]
+    # called functions not in the program
+    undefined: List[str]
+
+
+def stack_usage(functions, entry_point):
+    """Worst-case stack words of a call of `entry_point`, frame included.
+
+    Recursive calls are not followed, whose depth cannot be bounded. The
+    code before the functions, named None, has no frame.
+    """
+    totals = {}
+    active = set()
+    recursive, undefined = set(), set()
+
+    def visit(name):
+        if name in totals:
+            return totals[name]
+        if name not in functions:
+            undefined.add(name)
+            return FRAME_SIZE, [name]
+        active.add(name)
+        function = functions[name]
+        nb_words, path = function.max_depth, []
+        for callee, depth in function.calls:
+            if callee in active:
+                recursive.add(callee)
+                continue
+            callee_words, callee_path = visit(callee)
+            if depth + callee_words > nb_words:
+                nb_words, path = depth + callee_words, callee_path
+        active.remove(name)
+        frame_size = FRAME_SIZE if name is not None else 0
+        totals[name] = frame_size + function.nb_locals + nb_words, [name] + path
+        return totals[name]
+
+    nb_words, path = visit(entry_point)
+    return StackUsage(nb_words, path, sorted(recursive), sorted(undefined))
+
+
+def uncalled_functions(functions):
+    """Functions called by no other function, e.g. the entry points of a
+    program without bootstrap, the code before the functions first."""
+    called = {
+        callee
+        for name, function in functions.items()
+        for callee, _ in function.calls
+        if callee != name
+    }
+    names = [name for name in functions if name not in called]
+    return sorted(names, key=lambda name: (name is not None, name or ""))
+
+
+def translate(parsers, filenames, code_writer, bootstrap=True, reachable=None):
+    """Translate the parsed VM files with `code_writer`, without closing it.
+
+    The functions not in `reachable`, if given, are skipped: return their
+    names, and their number of VM commands.
+    """
+    removed_functions = []
+    nb_removed_cmds = 0
+    if bootstrap:
         code_writer.write_comment(f"bootstrap")
         code_writer.write_bootstrap_code()
     for parser, fn in zip(parsers, filenames):
         code_writer.set_filename(os.path.split(fn)[1].split(".")[0])
         code_writer.write_comment(f"file {fn}")
+        is_reachable = True
         while parser.has_more_commands():
             parser.advance()
-            code_writer.write_comment(parser.current_command)
             cmd_type = parser.command_type()
+            if cmd_type == "C_FUNCTION" and reachable is not None:
+                is_reachable = parser.arg1() in reachable
+                if not is_reachable:
+                    removed_functions.append(parser.arg1())
+            if not is_reachable:
+                nb_removed_cmds += 1
+                continue
+            code_writer.write_comment(parser.current_command)
             if cmd_type == "C_ARITHMETIC":
                 code_writer.write_arithmetic(parser.current_command)
             elif cmd_type in ["C_PUSH", "C_POP"]:
@@ -412,5 +873,586 @@ if __name__ == "__main__":
                 code_writer.write_function(name, nb_locals)
             elif cmd_type == "C_RETURN":
                 code_writer.write_return()
+        # the code may run into the next file
+        code_writer.write_spill()
+    return removed_functions, nb_removed_cmds
+
+
+def count_instructions(parsers, filenames, bootstrap=True, reachable=None, **options):
+    """Number of instructions of the translation of the parsed VM files with
+    the CodeWriter `options`, shared routines included, e.g. to compare the
+    size of the program with and without an option.
+
+    The parsers are reset, ready to translate again.
+    """
+    code_writer = CodeWriter(io.StringIO(), **options)
+    translate(parsers, filenames, code_writer, bootstrap, reachable)
+    code_writer.write_shared_routines()
+    for parser in parsers:
+        parser.reset()
+    return code_writer.nb_instructions
+
+
+RELOCATABLE_ADDRESS = re.compile(r"<(\d+)>")
+
+
+def relocate(asm, base):
+    """Resolve the relocatable addresses of assembly starting at `base`."""
+    return RELOCATABLE_ADDRESS.sub(lambda m: str(base + int(m[1])), asm)
+
+
+class TranslatedFile(NamedTuple):
+    """Relocatable assembly of a VM file, translated on its own."""
+
+    asm: str
+    nb_instructions: int
+    nb_calls: int
+    nb_returns: int
+    nb_compares: Dict[str, int]
+    removed_functions: List[str]
+    nb_removed_cmds: int
+
+
+def translate_file(filename, reachable=None, **options):
+    """Translate a VM file alone, to be written by CodeWriter.write_relocated.
+
+    The addresses of its comparisons and return labels are relative to its
+    first instruction. Labels outside of functions are not prefixed by the
+    last function of the previous file, unlike with `translate`.
+    """
+    with open(filename) as input_file:
+        parser = Parser(input_file)
+    stream = io.StringIO()
+    code_writer = CodeWriter(stream, relocatable=True, **options)
+    removed_functions, nb_removed_cmds = translate(
+        [parser], [filename], code_writer, bootstrap=False, reachable=reachable
+    )
+    code_writer.flush()
+    return TranslatedFile(
+        stream.getvalue(),
+        code_writer.nb_instructions,
+        code_writer.nb_calls,
+        code_writer.nb_returns,
+        code_writer.nb_compares,
+        removed_functions,
+        nb_removed_cmds,
+    )
+
+
+def parallel_translate(filenames, code_writer, jobs, bootstrap=True, reachable=None):
+    """Same as `translate`, the files being parsed and translated in parallel.
+
+    Each file is translated by a worker process to relocatable assembly,
+    which is written in order with its addresses resolved.
+    """
+    removed_functions = []
+    nb_removed_cmds = 0
+    if bootstrap:
+        code_writer.write_comment(f"bootstrap")
+        code_writer.write_bootstrap_code()
+    with ProcessPoolExecutor(jobs) as executor:
+        translated_files = executor.map(
+            partial(translate_file, reachable=reachable, **code_writer.options),
+            filenames,
+        )
+        for translated_file in translated_files:
+            code_writer.write_relocated(translated_file)
+            removed_functions += translated_file.removed_functions
+            nb_removed_cmds += translated_file.nb_removed_cmds
+    return removed_functions, nb_removed_cmds
+
+
+class PeepholeOptimizer:
+    """Stream rewriting the assembly written by CodeWriter before writing it.
+
+    The program is buffered until closed, then the instruction sequences of
+    consecutive VM commands are rewritten by the rules of each of the
+    OPTIMIZATION_PASSES in turn: address constants are folded, and a pushed
+    value which is popped right away does not go through incrementing then
+    decrementing SP. Patterns never span a label, as it may be jumped to.
+    """
+
+    # (pattern, replacement) rules: a pattern is a regex per instruction, the
+    # replacement a function of the match returning the new instructions
+    OPTIMIZATION_PASSES = [
+        [
+            # fold the addresses of the temp and pointer segments
+            (
+                [r"@R(?P<base>\d+)", "D=A", r"@(?P<index>\d+)", r"D=A\+D"],
+                lambda m: [f"@{int(m['base']) + int(m['index'])}", "D=A"],
+            ),
+            (
+                [r"@R(?P<base>\d+)", "D=A", r"@(?P<index>\d+)", r"A=A\+D", "D=M"],
+                lambda m: [f"@{int(m['base']) + int(m['index'])}", "D=M"],
+            ),
+            # n + 5 of ARG = SP - n - 5 in calls
+            (
+                [r"@(?P<nb_args>\d+)", "D=A", "@5", r"D=D\+A"],
+                lambda m: [f"@{int(m['nb_args']) + 5}", "D=A"],
+            ),
+            # segments at index 0 or 1
+            (
+                [r"@(?P<base>\w+)", "D=M", "@0", r"D=A\+D"],
+                lambda m: [f"@{m['base']}", "D=M"],
+            ),
+            (
+                [r"@(?P<base>\w+)", "D=M", "@0", r"A=A\+D", "D=M"],
+                lambda m: [f"@{m['base']}", "A=M", "D=M"],
+            ),
+            (
+                [r"@(?P<base>\w+)", "D=M", "@1", r"D=A\+D"],
+                lambda m: [f"@{m['base']}", "D=M+1"],
+            ),
+            (
+                [r"@(?P<base>\w+)", "D=M", "@1", r"A=A\+D", "D=M"],
+                lambda m: [f"@{m['base']}", "A=M+1", "D=M"],
+            ),
+            # pop to a constant address, without going through R13
+            (
+                [
+                    r"@(?P<address>[\w.]+)",
+                    "D=A",
+                    "@R13",
+                    "M=D",
+                    "@SP",
+                    "A=M-1",
+                    "D=M",
+                    "@R13",
+                    "A=M",
+                    "M=D",
+                    "@SP",
+                    "M=M-1",
+                ],
+                lambda m: ["@SP", "AM=M-1", "D=M", f"@{m['address']}", "M=D"],
+            ),
+        ],
+        [
+            # a push followed by a command popping the value keeps it in D,
+            # instead of incrementing then decrementing SP; the value is still
+            # written above the stack, leaving RAM as without optimization
+            (
+                ["@SP", "A=M", "M=D", "@SP", r"M=M\+1", "@SP", "AM=M-1", "D=M"],
+                lambda m: ["@SP", "A=M", "M=D"],
+            ),
+            (
+                ["@SP", "A=M", "M=D", "@SP", r"M=M\+1", "@SP", "M=M-1", "A=M", "D=M"],
+                lambda m: ["@SP", "A=M", "M=D"],
+            ),
+            (
+                [
+                    "@SP",
+                    "A=M",
+                    "M=D",
+                    "@SP",
+                    r"M=M\+1",
+                    "@SP",
+                    "A=M-1",
+                    "D=M",
+                    "A=A-1",
+                    r"M=(?P<expr>M[-+&|]D)",
+                    "@SP",
+                    "M=M-1",
+                ],
+                lambda m: ["@SP", "A=M", "M=D", "A=A-1", f"M={m['expr']}"],
+            ),
+            (
+                ["@SP", "A=M", "M=D", "@SP", r"M=M\+1", r"@(?P<base>\w+)", "D=M"]
+                + [r"@(?P<index>\d+)", r"D=A\+D", "@R13", "M=D", "@SP", "A=M-1"]
+                + ["D=M", "@R13", "A=M", "M=D", "@SP", "M=M-1"],
+                lambda m: ["@SP", "A=M", "M=D", f"@{m['base']}", "D=M"]
+                + [f"@{m['index']}", "D=A+D", "@R13", "M=D", "@SP", "A=M"]
+                + ["D=M", "@R13", "A=M", "M=D"],
+            ),
+            (
+                ["@SP", "A=M", "M=D", "@SP", r"M=M\+1", r"@(?P<base>\w+)"]
+                + [r"(?P<address>D=M|D=M\+1)", "@R13", "M=D", "@SP", "A=M-1"]
+                + ["D=M", "@R13", "A=M", "M=D", "@SP", "M=M-1"],
+                lambda m: ["@SP", "A=M", "M=D", f"@{m['base']}", m["address"]]
+                + ["@R13", "M=D", "@SP", "A=M", "D=M", "@R13", "A=M", "M=D"],
+            ),
+            # the value pushed is still in D, and its address in A
+            (
+                ["@SP", "A=M", "M=D", "@SP", r"M=M\+1", "@SP", "A=M-1", "D=M"],
+                lambda m: ["@SP", "AM=M+1", "A=A-1", "M=D"],
+            ),
+        ],
+        [
+            # push 0 or 1 without going through D
+            (
+                ["@(?P<value>[01])", "D=A", "@SP", "A=M", "M=D", "@SP", r"M=M\+1"],
+                lambda m: ["@SP", "A=M", f"M={m['value']}", "@SP", "M=M+1"],
+            ),
+        ],
+        [
+            # update SP while loading it
+            (
+                ["@SP", "A=M", "M=(?P<value>D|0|1)", "@SP", r"M=M\+1"],
+                lambda m: ["@SP", "AM=M+1", "A=A-1", f"M={m['value']}"],
+            ),
+            (
+                ["@SP", "M=M-1", "A=M", "D=M"],
+                lambda m: ["@SP", "AM=M-1", "D=M"],
+            ),
+            (
+                [
+                    "@SP",
+                    "A=M-1",
+                    "D=M",
+                    "A=A-1",
+                    r"M=(?P<expr>M[-+&|]D)",
+                    "@SP",
+                    "M=M-1",
+                ],
+                lambda m: ["@SP", "AM=M-1", "D=M", "A=A-1", f"M={m['expr']}"],
+            ),
+            (
+                ["@SP", "M=M(?P<op>[-+])1", "@SP"],
+                lambda m: ["@SP", f"M=M{m['op']}1"],
+            ),
+        ],
+    ]
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._lines = []
+        self.nb_instructions_before = 0
+        self.nb_instructions_after = 0
+
+    def write(self, text):
+        self._lines.extend(text.splitlines())
+
+    def close(self):
+        lines = self._label_jump_targets(self._lines)
+        instructions, comments = self._split_comments(lines)
+        self.nb_instructions_before = self._count_instructions(instructions)
+        for rules in self.OPTIMIZATION_PASSES:
+            self._apply_rules(instructions, comments, rules)
+        instructions, comments = self._resolve_jump_targets(instructions, comments)
+        self.nb_instructions_after = self._count_instructions(instructions)
+        for instruction, instruction_comments in zip(instructions, comments):
+            for comment in instruction_comments:
+                self._stream.write(f"{comment}\n")
+            if instruction is not None:
+                self._stream.write(f"{instruction}\n")
+        self._stream.close()
+
+    @staticmethod
+    def _label_jump_targets(lines):
+        """Replace the addresses of jumps by labels, as instructions move.
 
+        CodeWriter jumps to numeric addresses in comparisons and at the end
+        of the bootstrap code, `@address` being followed by a jump.
+        """
+        lines = list(lines)
+        instructions = [
+            i for i, line in enumerate(lines) if not line.startswith(("//", "("))
+        ]
+        targets = set()
+        for i, next_i in zip(instructions, instructions[1:]):
+            if lines[i][1:].isdigit() and ";J" in lines[next_i]:
+                targets.add(int(lines[i][1:]))
+                lines[i] = f"@$${lines[i][1:]}"
+        # the end of the program may be jumped to
+        instructions.append(len(lines))
+        for address in sorted(targets, reverse=True):
+            lines.insert(instructions[address], f"($${address})")
+        return lines
+
+    @staticmethod
+    def _resolve_jump_targets(instructions, comments):
+        """Replace the labels added by _label_jump_targets by addresses."""
+        addresses = {}
+        resolved, resolved_comments = [], []
+        pending_comments = []
+        address = 0
+        for cmd, cmd_comments in zip(instructions, comments):
+            if cmd is not None and cmd.startswith("($$") and cmd[3:-1].isdigit():
+                addresses[cmd[1:-1]] = address
+                pending_comments.extend(cmd_comments)
+                continue
+            if cmd is not None and not cmd.startswith("("):
+                address += 1
+            resolved.append(cmd)
+            resolved_comments.append(pending_comments + cmd_comments)
+            pending_comments = []
+        resolved = [
+            f"@{addresses[cmd[1:]]}"
+            if cmd and cmd.startswith("@$$") and cmd[3:].isdigit()
+            else cmd
+            for cmd in resolved
+        ]
+        return resolved, resolved_comments
+
+    @staticmethod
+    def _split_comments(lines):
+        """Instructions, and the comments preceding each one of them.
+
+        The last instruction is None, to keep the comments ending the program.
+        """
+        instructions, comments = [], [[]]
+        for line in lines:
+            if line.startswith("//"):
+                comments[-1].append(line)
+            else:
+                instructions.append(line)
+                comments.append([])
+        instructions.append(None)
+        return instructions, comments
+
+    @staticmethod
+    def _count_instructions(instructions):
+        return sum(
+            1 for cmd in instructions if cmd is not None and not cmd.startswith("(")
+        )
+
+    @staticmethod
+    def _apply_rules(instructions, comments, rules):
+        # rules are tried where their first instruction matches
+        compiled_rules = [
+            (re.compile(pattern[0]), len(pattern), re.compile("\n".join(pattern)))
+            + (replace,)
+            for pattern, replace in rules
+        ]
+        max_length = max(len(pattern) for pattern, _ in rules)
+        i = 0
+        while i < len(instructions) - 1:
+            for first_pattern, length, pattern, replace in compiled_rules:
+                if not first_pattern.fullmatch(instructions[i]):
+                    continue
+                window = instructions[i : i + length]
+                if None in window:
+                    continue
+                match = pattern.fullmatch("\n".join(window))
+                if match is None:
+                    continue
+                replacement = replace(match)
+                window_comments = sum(comments[i : i + length], [])
+                instructions[i : i + length] = replacement
+                comments[i : i + length] = [[] for _ in replacement]
+                if replacement:
+                    comments[i] = window_comments
+                else:
+                    comments[i] = window_comments + comments[i]
+                # the replacement may complete a pattern starting earlier
+                i = max(i - max_length, 0)
+                break
+            else:
+                i += 1
+
+
+class AssemblerStream:
+    """CodeWriter stream assembling the program in memory, without text files.
+
+    Instructions are kept as assembler Command records: a CodeWriter writes
+    the records of its templates, and blocks of assembly written as text,
+    e.g. by a PeepholeOptimizer, are parsed (comments are dropped). Labels
+    are resolved as they are written, which saves the first pass.
+    """
+
+    def __init__(self):
+        self.commands = []
+        self.symbol_table = SymbolTable()
+
+    def write(self, text):
+        for line in text.splitlines():
+            if line and not line.startswith("//"):
+                self.write_command(line)
+
+    def write_command(self, cmd):
+        self.write_records([parse_command(cmd)])
+
+    def write_records(self, commands):
+        for command in commands:
+            if command.command_type == "L_COMMAND":
+                symbol = command.symbol
+                if self.symbol_table.contains(symbol):
+                    raise ValueError(f"symbol {symbol} defined multiple times")
+                self.symbol_table.add_entry(symbol, len(self.commands))
+            else:
+                self.commands.append(command)
+
+    def close(self):
+        pass
+
+    def assemble(self):
+        """Resolve the variables of the program, and return its 16-bit words."""
+        parser = CommandParser(self.commands)
+        return second_pass(parser, self.symbol_table)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Translate VM code to assembly.")
+    argparser.add_argument("input", help="VM file, or directory of VM files.")
+    argparser.add_argument(
+        "no_bootstrap",
+        nargs="?",
+        choices=["no_bootstrap"],
+        help="Do not write the bootstrap code calling Sys.init.",
+    )
+    argparser.add_argument(
+        "--shared-routines",
+        action="store_true",
+        help="Jump to shared $$CALL and $$RETURN routines in calls and returns.",
+    )
+    argparser.add_argument(
+        "--shared-compares",
+        action="store_true",
+        help="Jump to shared $$EQ, $$LT and $$GT routines in comparisons, "
+        "returning their result in D: arithmetic, pop and if-goto commands "
+        "take it from D, other commands first push it (inlined with --cache-top).",
+    )
+    argparser.add_argument(
+        "--cache-top",
+        action="store_true",
+        help="Keep the top of the stack in D between stack commands.",
+    )
+    argparser.add_argument(
+        "--remove-unused-functions",
+        action="store_true",
+        help="Only translate the functions called from Sys.init, with bootstrap.",
+    )
+    argparser.add_argument(
+        "--stack-usage",
+        action="store_true",
+        help="Report the worst-case stack usage, from Sys.init with bootstrap, "
+        "else from each function which is not called.",
+    )
+    argparser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="Rewrite the assembly with a peephole optimizer.",
+    )
+    argparser.add_argument(
+        "--format",
+        choices=["asm"] + list(OUTPUT_FORMATS),
+        default="asm",
+        help="Assembly, or assemble the program in memory to a textual .hack "
+        "file or a packed little-endian 16-bit ROM image (.bin).",
+    )
+    argparser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Parse and translate the files in N worker processes.",
+    )
+    args = argparser.parse_intermixed_args()
+    extension = ".asm" if args.format == "asm" else OUTPUT_FORMATS[args.format][0]
+    arg = args.input
+    if os.path.isfile(arg):
+        filenames = [arg]
+        output_filename = arg.split(".")[0] + extension
+    elif os.path.isdir(arg):
+        filenames = [
+            os.path.join(arg, fn) for fn in os.listdir(arg) if fn.endswith(".vm")
+        ]
+        output_filename = os.path.join(
+            arg, os.path.split(arg.strip(os.sep))[1] + extension
+        )
+    else:
+        print("file not found")
+        sys.exit(1)
+    if len(filenames) == 0:
+        print("no vm file found in this folder")
+        sys.exit(1)
+
+    parsers = []
+    # parallel builds parse the files in the worker processes
+    if (
+        args.jobs == 1
+        or args.remove_unused_functions
+        or args.stack_usage
+        or args.shared_compares
+    ):
+        for fn in filenames:
+            with open(fn) as input_file:
+                parsers.append(Parser(input_file))
+
+    reachable = None
+    if args.remove_unused_functions and not args.no_bootstrap:
+        # the code before the first function of a file is kept
+        reachable = reachable_functions(parsers, [None, "Sys.init"])
+    if args.stack_usage:
+        functions = function_stacks(parsers)
+        # without bootstrap, each function which is not called may be run
+        entry_points = (
+            uncalled_functions(functions) if args.no_bootstrap else ["Sys.init"]
+        )
+        usages = [(name, stack_usage(functions, name)) for name in entry_points]
+
+    if args.shared_compares:
+        # the size of the program with comparisons inlined
+        nb_inlined_compares = count_instructions(
+            parsers,
+            filenames,
+            not args.no_bootstrap,
+            reachable,
+            shared_routines=args.shared_routines,
+            cache_top=args.cache_top,
+        )
+
+    if args.format == "asm":
+        output_file = open(output_filename, "w")
+    else:
+        output_file = assembler_stream = AssemblerStream()
+    if args.optimize:
+        output_file = optimizer = PeepholeOptimizer(output_file)
+    code_writer = CodeWriter(
+        output_file, args.shared_routines, args.shared_compares, args.cache_top
+    )
+    if args.jobs > 1:
+        removed_functions, nb_removed_cmds = parallel_translate(
+            filenames, code_writer, args.jobs, not args.no_bootstrap, reachable
+        )
+    else:
+        removed_functions, nb_removed_cmds = translate(
+            parsers, filenames, code_writer, not args.no_bootstrap, reachable
+        )
+    if args.shared_routines or args.shared_compares:
+        code_writer.write_comment("shared routines")
+        code_writer.write_shared_routines()
     code_writer.close()
+    if args.format != "asm":
+        _, mode, write_words = OUTPUT_FORMATS[args.format]
+        with open(output_filename, mode) as output_stream:
+            write_words(assembler_stream.assemble(), output_stream)
+    if reachable is not None:
+        print(
+            f"removed {len(removed_functions)} unused functions "
+            f"({nb_removed_cmds} VM commands): {', '.join(removed_functions)}"
+        )
+    if args.shared_routines:
+        print(
+            f"shared routines: {code_writer.shared_routines_saving} instructions "
+            f"saved ({code_writer.nb_calls} calls, {code_writer.nb_returns} returns)"
+        )
+    if args.shared_compares:
+        saving = nb_inlined_compares - code_writer.nb_instructions
+        print(
+            f"shared compares: {saving} instructions saved "
+            f"({sum(code_writer.nb_compares.values())} comparisons)"
+        )
+    if args.stack_usage:
+        if not usages:
+            print("stack usage: every function is called by another one")
+        for name, usage in usages:
+            top = STACK_BASE + usage.nb_words
+            path = " -> ".join(f or "(before functions)" for f in usage.path)
+            print(
+                f"stack usage: {usage.nb_words} words at most, up to {top - 1}, "
+                f"through {path}"
+            )
+            if usage.recursive:
+                recursive = ", ".join(usage.recursive)
+                print(f"not bounded, recursive functions: {recursive}")
+            if usage.undefined:
+                undefined = ", ".join(usage.undefined)
+                print(f"undefined functions, frame only: {undefined}")
+            if top > HEAP_BASE:
+                print(f"warning: the stack may overflow into the heap at {HEAP_BASE}")
+    if args.optimize:
+        nb_before = optimizer.nb_instructions_before
+        nb_after = optimizer.nb_instructions_after
+        print(
+            f"optimized: {nb_before} -> {nb_after} instructions "
+            f"(-{nb_before - nb_after}, -{1 - nb_after / max(nb_before, 1):.1%})"
+        )
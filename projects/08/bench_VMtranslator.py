@@ -0,0 +1,145 @@
+"""Time the build of a directory of VM files to a Hack program.
+
+Usage: python bench_VMtranslator.py [--input DIR] [--build | --translate]
+       [VMtranslator.py ...]
+
+Each given translator script translates the same copy of the input directory
+(the OS of tools/OS by default) to assembly, which allows comparing with an
+older version kept next to this one (it imports the assembler of project 6),
+e.g. `git show HEAD~1:projects/08/VMtranslator.py > projects/08/old.py`.
+With --build, the end-to-end build to a .hack file is timed instead: as
+assembly text then assembled by projects/06/assembler.py, and assembled in
+memory by the translator (--format hack).
+With --translate, only the parsing and translation are timed, in process.
+"""
+import argparse
+import importlib.util
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+PROJECTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+ASSEMBLER = os.path.join(PROJECTS_DIR, "06", "assembler.py")
+
+
+def count_vm_commands(directory):
+    nb_commands = 0
+    for filename in os.listdir(directory):
+        if filename.endswith(".vm"):
+            with open(os.path.join(directory, filename)) as stream:
+                for line in stream:
+                    line = line.split("//")[0]
+                    nb_commands += bool(line.strip())
+    return nb_commands
+
+
+def time_commands(commands, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for command in commands:
+            subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def time_translation(translator, directory, repeat):
+    spec = importlib.util.spec_from_file_location("VMtranslator", translator)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    filenames = [
+        os.path.join(directory, fn)
+        for fn in os.listdir(directory)
+        if fn.endswith(".vm")
+    ]
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parsers = []
+        for fn in filenames:
+            with open(fn) as stream:
+                parsers.append(module.Parser(stream))
+        code_writer = module.CodeWriter(io.StringIO())
+        module.translate(parsers, filenames, code_writer)
+        code_writer.close()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def build_commands(translator, directory, extra_args, build):
+    """Commands translating `directory`, in each build mode."""
+    translate = [sys.executable, translator, directory, *extra_args]
+    if not build:
+        return {"asm": [translate]}
+    name = os.path.basename(directory)
+    asm_filename = os.path.join(directory, f"{name}.asm")
+    return {
+        "asm + assembler": [translate, [sys.executable, ASSEMBLER, asm_filename]],
+        "in memory": [translate + ["--format", "hack"]],
+    }
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Benchmark VM translators.")
+    argparser.add_argument(
+        "translators",
+        nargs="*",
+        default=[os.path.join(os.path.dirname(__file__) or ".", "VMtranslator.py")],
+        help="VM translator scripts to compare.",
+    )
+    argparser.add_argument(
+        "--input",
+        default=os.path.join(PROJECTS_DIR, "..", "tools", "OS"),
+        help="Directory of VM files to translate.",
+    )
+    argparser.add_argument(
+        "--repeat", type=int, default=5, help="Keep the best of N runs.",
+    )
+    mode = argparser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--build",
+        action="store_true",
+        help="Time the build to .hack, through assembly text and in memory.",
+    )
+    mode.add_argument(
+        "--translate",
+        action="store_true",
+        help="Only time the translation, in process.",
+    )
+    argparser.add_argument(
+        "--args",
+        dest="extra_args",
+        default="",
+        help="Extra arguments passed to each translator.",
+    )
+    args = argparser.parse_args()
+
+    nb_commands = count_vm_commands(args.input)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        directory = os.path.join(tmp_dir, "Bench")
+        shutil.copytree(args.input, directory)
+        baseline = None
+        for translator in args.translators:
+            if args.translate:
+                elapsed = time_translation(translator, directory, args.repeat)
+                results = [(translator, elapsed)]
+            else:
+                modes = build_commands(
+                    translator, directory, args.extra_args.split(), args.build
+                )
+                results = [
+                    (f"{translator} ({mode})", time_commands(commands, args.repeat))
+                    for mode, commands in modes.items()
+                ]
+            for name, elapsed in results:
+                baseline = baseline or elapsed
+                print(
+                    f"{name}: {elapsed:.3f}s, "
+                    f"{nb_commands / elapsed / 1000:.0f}k VM commands/s, "
+                    f"x{baseline / elapsed:.2f}"
+                )
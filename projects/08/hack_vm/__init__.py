@@ -0,0 +1,3 @@
+from hack_vm.jack_os import BUILTINS, JackOS
+from hack_vm.profiler import FunctionProfile, Profile
+from hack_vm.vm import HackVM, load_program, VMProgram
@@ -0,0 +1,391 @@
+from array import array
+from typing import Callable, Dict, FrozenSet, Optional, Tuple
+
+
+# powers of two of Math and Screen, as computed by their init functions
+TWO_TO_THE = [1 << i if i < 15 else -32768 for i in range(16)]
+NEW_LINE = 128
+BACKSPACE = 129
+
+
+def _word(value: int) -> int:
+    """Wrap to a signed 16-bit value."""
+    return (value + 32768 & 65535) - 32768
+
+
+class JackOS:
+    """Python built-ins of the functions of the OS of tools/OS.
+
+    A built-in takes the arguments of the VM function and returns its result,
+    or None to let the VM function run instead, when it would call Sys.error.
+    Results, the heap, the screen and the static variables of the OS classes
+    are updated as by the VM code, but not `temp 0` nor the words above the
+    stack pointer that the VM code uses as scratch.
+    """
+
+    def __init__(self, ram: array, statics: Dict[Tuple[str, int], int]) -> None:
+        self.ram = ram
+        self._statics = statics
+
+    def _static(self, class_name: str, index: int) -> int:
+        """Address of a static variable of an OS class."""
+        return self._statics[(class_name, index)]
+
+    # Math: twoToThe is static 0, the scratch array of divide static 1
+
+    def math_abs(self, x: int) -> int:
+        return _word(-x) if x < 0 else x
+
+    def math_multiply(self, x: int, y: int) -> int:
+        negative = x < 0 < y or y < 0 < x
+        x, y = self.math_abs(x), self.math_abs(y)
+        if x < y:
+            x, y = y, x
+        total = covered = bit = 0
+        while _word(covered - 1) < _word(y - 1):
+            if TWO_TO_THE[bit] & y:
+                total = _word(total + x)
+                covered = _word(covered + TWO_TO_THE[bit])
+            x = _word(x + x)
+            bit += 1
+        return _word(-total) if negative else total
+
+    def math_divide(self, x: int, y: int) -> Optional[int]:
+        if y == 0:
+            return None
+        ram = self.ram
+        negative = x < 0 < y or y < 0 < x
+        # multiples of y by powers of two, while not above x
+        multiples = ram[self._static("Math", 1)]
+        ram[multiples] = self.math_abs(y)
+        x = self.math_abs(x)
+        bit, overflow = 0, False
+        while bit < 15 and not overflow:
+            multiple = ram[_word(multiples + bit)]
+            overflow = _word(32767 - _word(multiple - 1)) < _word(multiple - 1)
+            if not overflow:
+                ram[_word(multiples + bit + 1)] = _word(multiple + multiple)
+                multiple = ram[_word(multiples + bit + 1)]
+                overflow = _word(multiple - 1) > _word(x - 1)
+                if not overflow:
+                    bit += 1
+        quotient = 0
+        while bit > -1:
+            multiple = ram[_word(multiples + bit)]
+            if not _word(multiple - 1) > _word(x - 1):
+                quotient = _word(quotient + TWO_TO_THE[bit])
+                x = _word(x - multiple)
+            bit -= 1
+        return _word(-quotient) if negative else quotient
+
+    def math_sqrt(self, x: int) -> Optional[int]:
+        if x < 0:
+            return None
+        root = 0
+        for bit in range(7, -1, -1):
+            candidate = _word(root + TWO_TO_THE[bit])
+            square = self.math_multiply(candidate, candidate)
+            if not square > x and not square < 0:
+                root = candidate
+        return root
+
+    def math_max(self, x: int, y: int) -> int:
+        return x if x > y else y
+
+    def math_min(self, x: int, y: int) -> int:
+        return x if x < y else y
+
+    # Memory: the heap is a list of free blocks from 2048, of their size then
+    # the address of the next block
+
+    def memory_peek(self, address: int) -> int:
+        return self.ram[_word(address + self.ram[self._static("Memory", 0)])]
+
+    def memory_poke(self, address: int, value: int) -> int:
+        self.ram[_word(address + self.ram[self._static("Memory", 0)])] = value
+        return 0
+
+    def memory_alloc(self, size: int) -> Optional[int]:
+        if size < 1:
+            return None
+        ram = self.ram
+        block = 2048
+        # first fit, leaving the endless searches to the VM code
+        for _ in range(len(ram)):
+            if not ram[block] < size:
+                break
+            block = ram[_word(block + 1)]
+        else:
+            return None
+        if _word(block + size) > 16379:
+            return None
+        if ram[block] > _word(size + 2):
+            ram[_word(block + size + 2)] = _word(ram[block] - size - 2)
+            if ram[_word(block + 1)] == _word(block + 2):
+                ram[_word(block + size + 3)] = _word(block + size + 4)
+            else:
+                ram[_word(block + size + 3)] = ram[_word(block + 1)]
+            ram[_word(block + 1)] = _word(block + size + 2)
+        ram[block] = 0
+        return _word(block + 2)
+
+    def memory_deAlloc(self, address: int) -> int:
+        ram = self.ram
+        block = _word(address - 2)
+        next_block = ram[_word(block + 1)]
+        if ram[next_block] == 0:
+            ram[block] = _word(ram[_word(block + 1)] - block - 2)
+        else:
+            ram[block] = _word(ram[_word(block + 1)] - block + ram[next_block])
+            if ram[_word(next_block + 1)] == _word(next_block + 2):
+                ram[_word(block + 1)] = _word(block + 2)
+            else:
+                ram[_word(block + 1)] = ram[_word(next_block + 1)]
+        return 0
+
+    def array_new(self, size: int) -> Optional[int]:
+        return self.memory_alloc(size) if size > 0 else None
+
+    def array_dispose(self, this: int) -> int:
+        return self.memory_deAlloc(this)
+
+    # Screen: the bit masks are static 0, the screen address static 1 and the
+    # color static 2
+
+    def _update_location(self, address: int, mask: int) -> None:
+        ram = self.ram
+        address = _word(address + ram[self._static("Screen", 1)])
+        if ram[self._static("Screen", 2)]:
+            ram[address] |= mask
+        else:
+            ram[address] &= ~mask
+
+    # the word columns are computed with Math.divide, as it leaves its
+    # multiples of the divisor in the heap
+
+    def _draw_pixel(self, x: int, y: int) -> None:
+        masks = self.ram[self._static("Screen", 0)]
+        column = self.math_divide(x, 16)
+        self._update_location(y * 32 + column, self.ram[masks + x - column * 16])
+
+    def _draw_rows(self, y1: int, y2: int, x1: int, x2: int) -> None:
+        """Draw the pixels from x1 to x2 of the rows from y1 to y2."""
+        masks = self.ram[self._static("Screen", 0)]
+        column1 = self.math_divide(x1, 16)
+        column2 = self.math_divide(x2, 16)
+        left_mask = ~_word(self.ram[masks + x1 - column1 * 16] - 1)
+        right_mask = _word(self.ram[masks + x2 - column2 * 16 + 1] - 1)
+        for y in range(y1, y2 + 1):
+            address = y * 32 + column1
+            end = address + column2 - column1
+            if address == end:
+                self._update_location(address, right_mask & left_mask)
+                continue
+            self._update_location(address, left_mask)
+            for address in range(address + 1, end):
+                self._update_location(address, -1)
+            self._update_location(end, right_mask)
+
+    def _draw_horizontal(self, y: int, x1: int, x2: int) -> None:
+        """Draw the pixels of row y from x1 to x2, clipped to the screen."""
+        x1, x2 = min(x1, x2), max(x1, x2)
+        if -1 < y < 256 and x1 < 512 and x2 > -1:
+            self._draw_rows(y, y, max(x1, 0), min(x2, 511))
+
+    def screen_clearScreen(self) -> int:
+        ram = self.ram
+        screen = ram[self._static("Screen", 1)]
+        for address in range(8192):
+            ram[_word(address + screen)] = 0
+        return 0
+
+    def screen_drawPixel(self, x: int, y: int) -> Optional[int]:
+        if x < 0 or x > 511 or y < 0 or y > 255:
+            return None
+        self._draw_pixel(x, y)
+        return 0
+
+    def screen_drawLine(self, x1: int, y1: int, x2: int, y2: int) -> Optional[int]:
+        if x1 < 0 or x2 > 511 or y1 < 0 or y2 > 255:
+            return None
+        dx = self.math_abs(_word(x2 - x1))
+        dy = self.math_abs(_word(y2 - y1))
+        steep = dx < dy
+        if steep and y2 < y1 or not steep and x2 < x1:
+            x1, y1, x2, y2 = x2, y2, x1, y1
+        # Bresenham along the major axis a, the minor one being b
+        if steep:
+            dx, dy = dy, dx
+            a, b, a_end, b_decreasing = y1, x1, y2, x1 > x2
+        else:
+            a, b, a_end, b_decreasing = x1, y1, x2, y1 > y2
+        error = _word(self.math_multiply(2, dy) - dx)
+        straight = self.math_multiply(2, dy)
+        diagonal = self.math_multiply(2, _word(dy - dx))
+        pixels = [(a, b)]
+        while a < a_end:
+            if error < 0:
+                error = _word(error + straight)
+            else:
+                error = _word(error + diagonal)
+                b = _word(b - 1 if b_decreasing else b + 1)
+            a += 1
+            pixels.append((a, b))
+        if steep:
+            pixels = [(x, y) for y, x in pixels]
+        # the VM code fails on the first pixel off the screen, draw nothing
+        if any(x < 0 or x > 511 or y < 0 or y > 255 for x, y in pixels):
+            return None
+        for x, y in pixels:
+            self._draw_pixel(x, y)
+        return 0
+
+    def screen_drawRectangle(
+        self, x1: int, y1: int, x2: int, y2: int
+    ) -> Optional[int]:
+        if x1 > x2 or y1 > y2 or x1 < 0 or x2 > 511 or y1 < 0 or y2 > 255:
+            return None
+        self._draw_rows(y1, y2, x1, x2)
+        return 0
+
+    def screen_drawCircle(self, x: int, y: int, r: int) -> Optional[int]:
+        if x < 0 or x > 511 or y < 0 or y > 255:
+            return None
+        if (
+            _word(x - r) < 0
+            or _word(x + r) > 511
+            or _word(y - r) < 0
+            or _word(y + r) > 255
+        ):
+            return None
+        dx, dy, error = 0, r, _word(1 - r)
+        self._draw_symmetric(x, y, dx, dy)
+        while dy > dx:
+            if error < 0:
+                error = _word(error + self.math_multiply(2, dx) + 3)
+            else:
+                error = _word(error + self.math_multiply(2, _word(dx - dy)) + 5)
+                dy -= 1
+            dx += 1
+            self._draw_symmetric(x, y, dx, dy)
+        return 0
+
+    def _draw_symmetric(self, x: int, y: int, dx: int, dy: int) -> None:
+        self._draw_horizontal(_word(y - dy), _word(x + dx), _word(x - dx))
+        self._draw_horizontal(_word(y + dy), _word(x + dx), _word(x - dx))
+        self._draw_horizontal(_word(y - dx), _word(x - dy), _word(x + dy))
+        self._draw_horizontal(_word(y + dx), _word(x - dy), _word(x + dy))
+
+    # Output: the cursor is the column / 2 in static 0, its address in the
+    # screen in static 1 and whether it is in the left half of a word in
+    # static 2; the screen address is static 4, the font maps statics 5 and 6
+
+    def _draw_char(self, c: int) -> None:
+        ram = self.ram
+        left = ram[self._static("Output", 2)]
+        if c < 32 or c > 126:
+            c = 0
+        font = self._static("Output", 5 if left else 6)
+        bitmap = ram[_word(c + ram[font])]
+        address = ram[self._static("Output", 1)]
+        screen = ram[self._static("Output", 4)]
+        for line in range(11):
+            word = _word(address + screen)
+            kept = ram[word] & (-256 if left else 255)
+            ram[word] = ram[_word(line + bitmap)] | kept
+            address = _word(address + 32)
+
+    def output_println(self) -> int:
+        ram = self.ram
+        column = self._static("Output", 0)
+        address = self._static("Output", 1)
+        ram[address] = _word(ram[address] + 352 - ram[column])
+        ram[column] = 0
+        ram[self._static("Output", 2)] = -1
+        if ram[address] == 8128:
+            ram[address] = 32
+        return 0
+
+    def output_backSpace(self) -> int:
+        ram = self.ram
+        column = self._static("Output", 0)
+        address = self._static("Output", 1)
+        left = self._static("Output", 2)
+        if ram[left]:
+            if ram[column] > 0:
+                ram[column] -= 1
+                ram[address] = _word(ram[address] - 1)
+            else:
+                ram[column] = 31
+                if ram[address] == 32:
+                    ram[address] = 8128
+                ram[address] = _word(ram[address] - 321)
+            ram[left] = 0
+        else:
+            ram[left] = -1
+        self._draw_char(32)
+        return 0
+
+    def output_printChar(self, c: int) -> int:
+        if c == NEW_LINE:
+            return self.output_println()
+        if c == BACKSPACE:
+            return self.output_backSpace()
+        ram = self.ram
+        column = self._static("Output", 0)
+        left = self._static("Output", 2)
+        self._draw_char(c)
+        if ~ram[left]:
+            ram[column] = _word(ram[column] + 1)
+            address = self._static("Output", 1)
+            ram[address] = _word(ram[address] + 1)
+        if ram[column] == 32:
+            self.output_println()
+        else:
+            ram[left] = ~ram[left]
+        return 0
+
+    def output_printString(self, string: int) -> int:
+        # String fields: its maximum length, its characters, then its length
+        ram = self.ram
+        chars = ram[_word(string + 1)]
+        for i in range(ram[_word(string + 2)]):
+            self.output_printChar(ram[_word(chars + i)])
+        return 0
+
+    def sys_wait(self, duration: int) -> Optional[int]:
+        # only waits, a few steps per millisecond
+        return 0 if duration >= 0 else None
+
+
+# VM function -> built-in, and the OS classes of the VM code it replaces
+BUILTINS: Dict[str, Tuple[Callable[..., Optional[int]], FrozenSet[str]]] = {
+    "Math.abs": (JackOS.math_abs, frozenset(["Math"])),
+    "Math.multiply": (JackOS.math_multiply, frozenset(["Math"])),
+    "Math.divide": (JackOS.math_divide, frozenset(["Math"])),
+    "Math.sqrt": (JackOS.math_sqrt, frozenset(["Math"])),
+    "Math.max": (JackOS.math_max, frozenset(["Math"])),
+    "Math.min": (JackOS.math_min, frozenset(["Math"])),
+    "Memory.peek": (JackOS.memory_peek, frozenset(["Memory"])),
+    "Memory.poke": (JackOS.memory_poke, frozenset(["Memory"])),
+    "Memory.alloc": (JackOS.memory_alloc, frozenset(["Memory"])),
+    "Memory.deAlloc": (JackOS.memory_deAlloc, frozenset(["Memory"])),
+    "Array.new": (JackOS.array_new, frozenset(["Array", "Memory"])),
+    "Array.dispose": (JackOS.array_dispose, frozenset(["Array", "Memory"])),
+    "Screen.clearScreen": (JackOS.screen_clearScreen, frozenset(["Screen"])),
+    "Screen.drawPixel": (JackOS.screen_drawPixel, frozenset(["Screen", "Math"])),
+    "Screen.drawLine": (JackOS.screen_drawLine, frozenset(["Screen", "Math"])),
+    "Screen.drawRectangle": (
+        JackOS.screen_drawRectangle,
+        frozenset(["Screen", "Math"]),
+    ),
+    "Screen.drawCircle": (JackOS.screen_drawCircle, frozenset(["Screen", "Math"])),
+    "Output.println": (JackOS.output_println, frozenset(["Output"])),
+    "Output.backSpace": (JackOS.output_backSpace, frozenset(["Output"])),
+    "Output.printChar": (JackOS.output_printChar, frozenset(["Output", "String"])),
+    "Output.printString": (
+        JackOS.output_printString,
+        frozenset(["Output", "String"]),
+    ),
+    "Sys.wait": (JackOS.sys_wait, frozenset(["Sys"])),
+}
@@ -0,0 +1,101 @@
+from array import array
+from bisect import bisect_right
+import sys
+from typing import Dict, List, NamedTuple, Optional, TextIO, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from hack_vm.vm import VMProgram
+
+
+class FunctionProfile(NamedTuple):
+    name: str
+    calls: int
+    # steps of its own commands, and of the functions it calls
+    self_steps: int
+    cumulative_steps: int
+
+
+class Profile:
+    """Steps executed by each command of a program, and time spent in calls.
+
+    The emulator counts the steps of each command address in `counts`, and
+    reports calls and returns with `enter` and `leave`. Cumulative steps of
+    recursive functions are only counted for their outermost call.
+    """
+
+    def __init__(self, program: "VMProgram") -> None:
+        self.program = program
+        self.counts = array("Q", bytes(8 * len(program.ops)))
+        self.cumulative_steps = array("Q", bytes(8 * len(program.ops)))
+        # shadow call stack: function address and step of its first command
+        self._calls: List[Tuple[int, int]] = []
+        self._depths: Dict[int, int] = {}
+
+    def enter(self, function: int, step: int) -> None:
+        self._calls.append((function, step))
+        self._depths[function] = self._depths.get(function, 0) + 1
+
+    def leave(self, step: int) -> None:
+        # returns without a call are those of the test programs' fake frames
+        if not self._calls:
+            return
+        function, entry_step = self._calls.pop()
+        self._depths[function] -= 1
+        if not self._depths[function]:
+            self.cumulative_steps[function] += step - entry_step
+
+    def functions(self, steps: int) -> List[FunctionProfile]:
+        """Profile of the called functions, after `steps` executed steps.
+
+        Calls still in progress count up to the current step.
+        """
+        cumulative_steps = array("Q", self.cumulative_steps)
+        depths: Dict[int, int] = {}
+        for function, entry_step in self._calls:
+            if not depths.get(function):
+                cumulative_steps[function] += steps - entry_step
+            depths[function] = depths.get(function, 0) + 1
+        # functions own the commands up to the next function
+        addresses = sorted(self.program.functions.values())
+        ends = addresses[1:] + [len(self.program.ops)]
+        profiles = []
+        for name, address in self.program.functions.items():
+            if not self.counts[address]:
+                continue
+            end = ends[bisect_right(addresses, address) - 1]
+            profiles.append(
+                FunctionProfile(
+                    name,
+                    self.counts[address],
+                    sum(self.counts[address:end]),
+                    cumulative_steps[address],
+                )
+            )
+        return profiles
+
+    def labels(self) -> List[Tuple[str, int]]:
+        """Labels and the number of steps executed at their command."""
+        return [
+            (label, self.counts[address])
+            for label, address in self.program.labels.items()
+            if self.counts[address]
+        ]
+
+    def report(
+        self, steps: int, stream: Optional[TextIO] = None, limit: int = 20
+    ) -> None:
+        """Print the `limit` hottest functions and labels."""
+        stream = stream or sys.stdout
+        functions = self.functions(steps)
+        functions.sort(key=lambda profile: profile.cumulative_steps, reverse=True)
+        stream.write(
+            f"{'function':40} {'calls':>10} {'self steps':>12} {'cumulative':>12}\n"
+        )
+        for name, calls, self_steps, cumulative_steps in functions[:limit]:
+            stream.write(
+                f"{name:40} {calls:10} {self_steps:12} {cumulative_steps:12}\n"
+            )
+        labels = sorted(self.labels(), key=lambda item: item[1], reverse=True)
+        stream.write(f"\n{'label':53} {'steps':>12}\n")
+        for label, count in labels[:limit]:
+            stream.write(f"{label:53} {count:12}\n")
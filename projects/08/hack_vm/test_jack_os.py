@@ -0,0 +1,122 @@
+import os
+import random
+import tempfile
+import unittest
+
+from hack_vm.jack_os import *
+from hack_vm.vm import HackVM, load_program, STATIC
+
+
+PROJECTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+OS_DIR = os.path.join(PROJECTS_DIR, "..", "tools", "OS")
+HEAP = 2048
+SCREEN = 16384
+KBD = 24576
+
+
+def push(value):
+    if value >= 0:
+        return [f"push constant {value}"]
+    return [f"push constant {-value - 1}", "not"]
+
+
+def random_calls(rng, nb_calls):
+    """VM commands of random calls of OS functions with built-ins."""
+    commands = []
+    for index in range(10, 13):
+        commands += ["push constant 1", "call Memory.alloc 1", f"pop static {index}"]
+    for i in range(nb_calls):
+        kind = rng.randrange(6)
+        if kind == 0:
+            function = rng.choice(["Math.multiply", "Math.divide"])
+            x, y = rng.randint(-32768, 32767), rng.choice([-1, 1]) * rng.randint(1, 300)
+            commands += push(x) + push(y) + [f"call {function} 2"]
+            commands.append(f"pop static {i % 10}")
+        elif kind == 1:
+            commands += push(rng.randint(0, 32767)) + ["call Math.sqrt 1"]
+            commands.append(f"pop static {i % 10}")
+        elif kind == 2:
+            # allocate a block, and free the one of 3 allocations ago
+            index = 10 + i % 3
+            commands += [f"push static {index}", "call Memory.deAlloc 1"]
+            commands += ["pop temp 0"] + push(rng.randint(1, 50))
+            commands += ["call Memory.alloc 1", f"pop static {index}"]
+        elif kind == 3:
+            x1, x2 = rng.randint(0, 511), rng.randint(0, 511)
+            y1, y2 = rng.randint(0, 255), rng.randint(0, 255)
+            if rng.randrange(2):
+                x1, x2, y1, y2 = min(x1, x2), max(x1, x2), min(y1, y2), max(y1, y2)
+                function = "Screen.drawRectangle 4"
+            else:
+                function = "Screen.drawLine 4"
+            commands += push(rng.choice([0, -1])) + ["call Screen.setColor 1"]
+            commands += ["pop temp 0"] + push(x1) + push(y1) + push(x2) + push(y2)
+            commands += [f"call {function}", "pop temp 0"]
+        elif kind == 4:
+            x, y = rng.randint(30, 480), rng.randint(30, 225)
+            commands += push(x) + push(y) + push(rng.randint(0, 30))
+            commands += ["call Screen.drawCircle 3", "pop temp 0"]
+        else:
+            char = rng.choice([rng.randint(0, 140), 128, 129])
+            commands += push(char) + ["call Output.printChar 1", "pop temp 0"]
+    return commands
+
+
+def run_programs(commands):
+    """Run VM commands of Main.main with and without built-ins."""
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "Main.vm"), "w") as stream:
+            lines = ["function Main.main 0"] + commands + ["push constant 0", "return"]
+            stream.write("\n".join(lines) + "\n")
+        program = load_program(directory, OS_DIR)
+    vms = [HackVM(program, builtins=builtins) for builtins in [False, True]]
+    for vm in vms:
+        vm.run()
+    return vms
+
+
+class TestJackOS(unittest.TestCase):
+    def test_builtins(self):
+        vm, native_vm = run_programs(random_calls(random.Random(12), 100))
+        assert native_vm.builtins
+        assert native_vm.steps < vm.steps
+        assert native_vm.pc == vm.pc
+        # the registers, statics, heap and screen
+        for start, end in [(0, 5), (STATIC, 256), (HEAP, KBD)]:
+            assert native_vm.ram[start:end] == vm.ram[start:end], (start, end)
+
+    def test_native_os(self):
+        commands = random_calls(random.Random(13), 30)
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "Main.vm"), "w") as stream:
+                lines = ["function Main.main 0"] + commands
+                stream.write("\n".join(lines + ["push constant 0", "return"]))
+            program = load_program(directory, OS_DIR)
+        vm = HackVM(program)
+        vm.run()
+        native_vm = HackVM(program, native_os=True)
+        native_vm.run()
+        # the steps of Main.main and of Sys.init
+        assert native_vm.steps < vm.steps / 100
+        assert native_vm.pc == vm.pc
+        # the memory but the stack above SP, written by the calls
+        for start, end in [(0, vm.ram[0]), (HEAP, KBD)]:
+            assert native_vm.ram[start:end] == vm.ram[start:end], (start, end)
+        # native calls have no steps to profile
+        with self.assertRaises(ValueError):
+            HackVM(program, profile=True, native_os=True)
+
+    def test_errors(self):
+        # divide by zero, then an error code printed by Sys.error
+        commands = push(5) + push(0) + ["call Math.divide 2", "pop temp 0"]
+        vm, native_vm = run_programs(commands)
+        assert native_vm.pc == vm.pc
+        assert native_vm.ram[HEAP:KBD] == vm.ram[HEAP:KBD]
+        assert any(vm.ram[SCREEN:KBD])
+
+    def test_arithmetic(self):
+        jack_os = JackOS(None, {})
+        assert jack_os.math_multiply(-32768, -1) == -32768
+        assert jack_os.math_multiply(300, -300) == -(90000 - 65536)
+        assert jack_os.math_sqrt(32767) == 181
+        assert jack_os.math_abs(-32768) == -32768
@@ -0,0 +1,111 @@
+import io
+import os
+import tempfile
+import unittest
+
+from hack_vm.vm import *
+
+
+PROJECTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+OS_DIR = os.path.join(PROJECTS_DIR, "..", "tools", "OS")
+
+MAIN_VM = """\
+function Main.main 0
+push constant 6
+call Main.fact 1
+pop static 0
+push constant 32767
+push constant 2
+add
+pop static 1
+push constant 0
+return
+function Main.fact 0
+push argument 0
+push constant 2
+lt
+if-goto BASE
+push argument 0
+push argument 0
+push constant 1
+sub
+call Main.fact 1
+call Math.multiply 2
+return
+label BASE
+push constant 1
+return
+"""
+
+
+def load_source(source, os_dir=OS_DIR):
+    """Load a Main class, and the classes it needs from the OS."""
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "Main.vm"), "w") as stream:
+            stream.write(source)
+        return load_program(directory, os_dir)
+
+
+class TestHackVM(unittest.TestCase):
+    def test_run(self):
+        program = load_source(MAIN_VM)
+        assert "Sys.init" in program.functions
+        assert "Math.multiply" in program.functions
+        vm = HackVM(program)
+        nb_steps = vm.run()
+        assert vm.steps == nb_steps
+        # stopped at the call of Sys.halt
+        assert program.ops[vm.pc] == CALL
+        assert program.args[vm.pc] == program.functions["Sys.halt"]
+        assert vm.ram[SP] == STACK + 5
+        # statics of Main come first, the OS classes are loaded afterwards
+        assert vm.ram[STATIC] == 720
+        assert vm.ram[STATIC + 1] == -32767
+
+    def test_step(self):
+        program = load_source("push constant 1\npush constant 2\nadd\n", None)
+        vm = HackVM(program)
+        vm.ram[SP] = STACK
+        vm.step()
+        vm.step()
+        assert (vm.ram[SP], vm.pc) == (STACK + 2, 2)
+        assert vm.run() == 1
+        assert vm.ram[STACK] == 3
+        assert program.ops[vm.pc] == HALT
+        assert vm.run() == 0
+
+    def test_stack_pointer_segment(self):
+        source = "push constant 0\npop pointer 1\npush that 0\npush constant 1\nadd\n"
+        vm = HackVM(load_source(source + "pop that 0\n", None))
+        vm.ram[SP] = STACK
+        vm.run()
+        # `that 0` is SP: push pushes the stack pointer, pop sets it
+        assert vm.ram[SP] == STACK + 1
+
+    def test_undefined(self):
+        with self.assertRaises(ValueError):
+            load_source("goto END\n", None)
+        with self.assertRaises(ValueError):
+            load_source("call Main.f 0\n", None)
+
+    def test_profile(self):
+        vm = HackVM(load_source(MAIN_VM), profile=True)
+        vm.run()
+        functions = {
+            profile.name: profile for profile in vm.profile.functions(vm.steps)
+        }
+        assert functions["Main.fact"].calls == 6
+        assert "Sys.halt" not in functions
+        # steps of the recursive calls are counted once
+        main = functions["Main.main"]
+        fact = functions["Main.fact"]
+        assert main.cumulative_steps == main.self_steps + fact.cumulative_steps
+        assert fact.cumulative_steps > fact.self_steps
+        # Sys.init is still running
+        assert functions["Sys.init"].cumulative_steps == vm.steps
+        assert sum(profile.self_steps for profile in functions.values()) == vm.steps
+        labels = dict(vm.profile.labels())
+        assert labels["Main.fact$BASE"] == 1
+        stream = io.StringIO()
+        vm.profile.report(vm.steps, stream)
+        assert "Main.fact" in stream.getvalue()
@@ -0,0 +1,462 @@
+from array import array
+import os
+import sys
+from typing import Callable, Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+from hack_vm.jack_os import BUILTINS, JackOS
+from hack_vm.profiler import Profile
+from VMtranslator import Parser
+
+
+RAM_SIZE = 1 << 15
+# addresses of the stack pointer and the segment pointers
+SP = 0
+LCL = 1
+ARG = 2
+THIS = 3
+THAT = 4
+TEMP = 5
+STATIC = 16
+STACK = 256
+# bound of the steps of a call run to its return in one step
+MAX_NATIVE_CALL_STEPS = 10_000_000
+
+# opcodes, in the order of the dispatch of HackVM.run
+PUSH_SEGMENT = 0  # args: address of the segment pointer, index
+PUSH_CONSTANT = 1  # args: value
+PUSH_ADDRESS = 2  # args: address, of a temp, pointer or static word
+POP_SEGMENT = 3
+POP_ADDRESS = 4
+ADD = 5
+SUB = 6
+NEG = 7
+EQ = 8
+GT = 9
+LT = 10
+AND = 11
+OR = 12
+NOT = 13
+GOTO = 14  # args: address of the target command
+IF_GOTO = 15
+CALL = 16  # args: address of the function command, number of arguments
+FUNCTION = 17  # args: number of locals
+RETURN = 18
+HALT = 19
+
+ARITHMETIC_OPCODES = {
+    "add": ADD,
+    "sub": SUB,
+    "neg": NEG,
+    "eq": EQ,
+    "gt": GT,
+    "lt": LT,
+    "and": AND,
+    "or": OR,
+    "not": NOT,
+}
+SEGMENT_POINTERS = {"local": LCL, "argument": ARG, "this": THIS, "that": THAT}
+FIXED_SEGMENTS = {"temp": (TEMP, 8), "pointer": (THIS, 2)}
+
+
+class VMProgram(NamedTuple):
+    """VM commands resolved into opcodes with integer arguments.
+
+    The command at address i is `ops[i]` with arguments `args[i]` and
+    `args2[i]`; labels and function names are resolved to addresses, and
+    static variables to RAM addresses. The last command is HALT.
+    """
+
+    ops: array
+    args: array
+    args2: array
+    # name -> address of the `function` command
+    functions: Dict[str, int]
+    # `function$label` (or `label` outside of functions) -> address
+    labels: Dict[str, int]
+    # address of the first command, Sys.init if defined
+    entry: int
+    # (class name, index) -> address of the static variable
+    statics: Dict[Tuple[str, int], int]
+    # classes loaded from the OS directory
+    os_classes: FrozenSet[str]
+
+
+def _static_address(statics: Dict[Tuple[str, int], int], key: Tuple[str, int]) -> int:
+    # allocated in order of first reference, as by the assembler
+    address = statics.get(key)
+    if address is None:
+        address = statics[key] = STATIC + len(statics)
+        if address >= STACK:
+            raise ValueError("too many static variables")
+    return address
+
+
+def compile_program(
+    files: List[Tuple[str, Parser]], os_classes: FrozenSet[str] = frozenset()
+) -> VMProgram:
+    """Compile the parsed VM files, given with their class name."""
+    ops, args, args2 = array("B"), array("i"), array("i")
+    functions: Dict[str, int] = {}
+    labels: Dict[str, int] = {}
+    statics: Dict[Tuple[str, int], int] = {}
+    # jumps and calls to resolve: (address, name, VM command)
+    jumps: List[Tuple[int, str, str]] = []
+    calls: List[Tuple[int, str, str]] = []
+    for class_name, parser in files:
+        function = None
+        parser.reset()
+        while parser.has_more_commands():
+            parser.advance()
+            cmd_type = parser.command_type()
+            address = len(ops)
+            arg, arg2 = 0, 0
+            if cmd_type in ("C_PUSH", "C_POP"):
+                segment, index = parser.arg1(), parser.arg2()
+                is_push = cmd_type == "C_PUSH"
+                if segment == "constant" and is_push:
+                    op, arg = PUSH_CONSTANT, index
+                elif segment in SEGMENT_POINTERS:
+                    op = PUSH_SEGMENT if is_push else POP_SEGMENT
+                    arg, arg2 = SEGMENT_POINTERS[segment], index
+                elif segment in FIXED_SEGMENTS:
+                    base, size = FIXED_SEGMENTS[segment]
+                    if not 0 <= index < size:
+                        raise ValueError(f"{parser.current_command}: out of segment")
+                    op, arg = PUSH_ADDRESS if is_push else POP_ADDRESS, base + index
+                elif segment == "static":
+                    op = PUSH_ADDRESS if is_push else POP_ADDRESS
+                    arg = _static_address(statics, (class_name, index))
+                else:
+                    raise ValueError(f"{parser.current_command}: invalid segment")
+            elif cmd_type == "C_ARITHMETIC":
+                op = ARITHMETIC_OPCODES.get(parser.current_command)
+                if op is None:
+                    raise ValueError(f"unknown command: {parser.current_command}")
+            elif cmd_type == "C_LABEL":
+                label = f"{function}${parser.arg1()}" if function else parser.arg1()
+                if label in labels:
+                    raise ValueError(f"label {label} defined multiple times")
+                labels[label] = address
+                continue
+            elif cmd_type in ("C_GOTO", "C_IF"):
+                op = GOTO if cmd_type == "C_GOTO" else IF_GOTO
+                label = f"{function}${parser.arg1()}" if function else parser.arg1()
+                jumps.append((address, label, parser.current_command))
+            elif cmd_type == "C_CALL":
+                op, arg2 = CALL, parser.arg2()
+                calls.append((address, parser.arg1(), parser.current_command))
+            elif cmd_type == "C_FUNCTION":
+                function = parser.arg1()
+                if function in functions:
+                    raise ValueError(f"function {function} defined multiple times")
+                functions[function] = address
+                op, arg = FUNCTION, parser.arg2()
+            else:
+                op = RETURN
+            ops.append(op)
+            args.append(arg)
+            args2.append(arg2)
+    ops.append(HALT)
+    args.append(0)
+    args2.append(0)
+    # return addresses are pushed on the 16-bit stack
+    if len(ops) > 0x8000:
+        raise ValueError(f"program too large: {len(ops)} commands")
+    for address, label, command in jumps:
+        if label not in labels:
+            raise ValueError(f"{command}: unknown label {label}")
+        args[address] = labels[label]
+    for address, name, command in calls:
+        if name not in functions:
+            raise ValueError(f"{command}: unknown function {name}")
+        args[address] = functions[name]
+    entry = functions.get("Sys.init", 0)
+    return VMProgram(ops, args, args2, functions, labels, entry, statics, os_classes)
+
+
+def called_functions(parser: Parser) -> List[str]:
+    """Names of the functions called by the commands of a parser."""
+    names = []
+    parser.reset()
+    while parser.has_more_commands():
+        parser.advance()
+        if parser.command_type() == "C_CALL":
+            names.append(parser.arg1())
+    parser.reset()
+    return names
+
+
+def load_program(path: str, os_dir: Optional[str] = None) -> VMProgram:
+    """Load a .vm file, or the .vm files of a directory.
+
+    Classes called but not defined, and Sys if a directory does not define
+    Sys.init, are loaded from the .vm files of `os_dir` if given, as the OS
+    built into the VM emulator.
+    """
+    if os.path.isdir(path):
+        filenames = sorted(
+            os.path.join(path, fn) for fn in os.listdir(path) if fn.endswith(".vm")
+        )
+    else:
+        filenames = [path]
+    files = []
+    os_classes = set()
+    for filename in filenames:
+        with open(filename) as stream:
+            class_name = os.path.splitext(os.path.basename(filename))[0]
+            files.append((class_name, Parser(stream)))
+    if os_dir is not None:
+        class_names = {class_name for class_name, _ in files}
+        missing = [] if not os.path.isdir(path) or "Sys" in class_names else ["Sys"]
+        for _, parser in files:
+            missing.extend(name.split(".")[0] for name in called_functions(parser))
+        while missing:
+            class_name = missing.pop()
+            filename = os.path.join(os_dir, f"{class_name}.vm")
+            if class_name in class_names or not os.path.exists(filename):
+                continue
+            with open(filename) as stream:
+                parser = Parser(stream)
+            files.append((class_name, parser))
+            class_names.add(class_name)
+            os_classes.add(class_name)
+            missing.extend(name.split(".")[0] for name in called_functions(parser))
+    return compile_program(files, frozenset(os_classes))
+
+
+class HackVM:
+    """VM emulator: runs compiled VM programs on 32K words of RAM.
+
+    A program with Sys.init starts with SP = 256 and a call to Sys.init,
+    as by the bootstrap code of the VM translator; returning from Sys.init
+    halts. Other programs start at their first command, without setting SP.
+
+    With `builtins`, the calls of the functions of OS classes loaded from the
+    OS directory are served by the Python built-ins of JackOS, in one step.
+    With `native_os`, the other calls of these functions run to their return
+    in one step, as the OS built into the VM emulator of nand2tetris: test
+    scripts only count the steps of the program's own code. Such calls have
+    no steps to profile, so `native_os` excludes `profile`.
+    """
+
+    def __init__(
+        self,
+        program: VMProgram,
+        profile: bool = False,
+        builtins: bool = False,
+        native_os: bool = False,
+    ) -> None:
+        if profile and native_os:
+            raise ValueError("cannot profile native OS calls")
+        self.program = program
+        self.ram = array("h", bytes(2 * RAM_SIZE))
+        # function address -> built-in and its number of arguments
+        self.builtins: Dict[int, Tuple[Callable[..., Optional[int]], int]] = {}
+        if builtins:
+            jack_os = JackOS(self.ram, program.statics)
+            for name, (builtin, classes) in BUILTINS.items():
+                if name in program.functions and classes <= program.os_classes:
+                    nb_args = builtin.__code__.co_argcount - 1
+                    method = builtin.__get__(jack_os)
+                    self.builtins[program.functions[name]] = (method, nb_args)
+        # Sys.init is not called, it is the entry of the bootstrap frame
+        self.native_calls: FrozenSet[int] = frozenset(
+            address
+            for name, address in program.functions.items()
+            if native_os
+            and name.split(".")[0] in program.os_classes
+            and name != "Sys.init"
+        )
+        self.pc = program.entry
+        self.steps = 0
+        self.profile = Profile(program) if profile else None
+        if "Sys.init" in program.functions:
+            # return address, LCL, ARG, THIS and THAT of the bootstrap call
+            self.ram[STACK] = len(program.ops) - 1
+            self.ram[SP] = STACK + 5
+            self.ram[LCL] = STACK + 5
+            self.ram[ARG] = STACK
+            if self.profile is not None:
+                self.profile.enter(self.pc, 0)
+
+    def run(self, nb_steps: Optional[int] = None, stop_on_loop: bool = True) -> int:
+        """Execute up to `nb_steps` commands, or without limit if None.
+
+        With `stop_on_loop`, execution stops at HALT, on calls of Sys.halt
+        and on gotos to themselves. Return the number of executed commands.
+        """
+        if nb_steps is None:
+            if not stop_on_loop:
+                raise ValueError("cannot run without a limit nor a stop condition")
+            nb_steps = sys.maxsize
+        program, ram, profile = self.program, self.ram, self.profile
+        ops, args, args2 = program.ops, program.args, program.args2
+        sys_halt = program.functions.get("Sys.halt", -1) if stop_on_loop else -1
+        counts = profile.counts if profile is not None else None
+        builtins = self.builtins
+        native_calls = self.native_calls
+        pc, sp = self.pc, ram[SP]
+        executed = nb_steps
+        for step in range(nb_steps):
+            op = ops[pc]
+            if counts is not None:
+                counts[pc] += 1
+            if op == PUSH_SEGMENT:
+                # stale when reading SP itself: the stack pointer is in `sp`
+                address = ram[args[pc]] + args2[pc]
+                ram[sp] = ram[address] if address else sp
+                sp += 1
+            elif op == PUSH_CONSTANT or op == PUSH_ADDRESS:
+                ram[sp] = args[pc] if op == PUSH_CONSTANT else ram[args[pc]]
+                sp += 1
+            elif op == POP_SEGMENT:
+                sp -= 1
+                address = ram[args[pc]] + args2[pc]
+                ram[address] = ram[sp]
+                if not address:
+                    sp = ram[sp]
+            elif op == POP_ADDRESS:
+                sp -= 1
+                ram[args[pc]] = ram[sp]
+            elif op <= SUB:
+                sp -= 1
+                value = ram[sp - 1] + ram[sp] if op == ADD else ram[sp - 1] - ram[sp]
+                if not -32768 <= value <= 32767:
+                    value = (value + 32768 & 65535) - 32768
+                ram[sp - 1] = value
+            elif op == NEG:
+                ram[sp - 1] = -ram[sp - 1] if ram[sp - 1] != -32768 else -32768
+            elif op <= LT:
+                sp -= 1
+                x, y = ram[sp - 1], ram[sp]
+                if op == EQ:
+                    ram[sp - 1] = -(x == y)
+                elif op == GT:
+                    ram[sp - 1] = -(x > y)
+                else:
+                    ram[sp - 1] = -(x < y)
+            elif op <= OR:
+                sp -= 1
+                if op == AND:
+                    ram[sp - 1] &= ram[sp]
+                else:
+                    ram[sp - 1] |= ram[sp]
+            elif op == NOT:
+                ram[sp - 1] = ~ram[sp - 1]
+            elif op == GOTO:
+                if args[pc] == pc and stop_on_loop:
+                    executed = step
+                    break
+                pc = args[pc]
+                continue
+            elif op == IF_GOTO:
+                sp -= 1
+                if ram[sp]:
+                    pc = args[pc]
+                    continue
+            elif op == CALL:
+                target = args[pc]
+                if target == sys_halt:
+                    executed = step
+                    break
+                nb_args = args2[pc]
+                if target in builtins:
+                    builtin, builtin_nb_args = builtins[target]
+                    # built-ins see the RAM of a real call
+                    ram[SP] = sp
+                    result = (
+                        builtin(*ram[sp - nb_args : sp])
+                        if nb_args == builtin_nb_args
+                        else None
+                    )
+                    if result is not None:
+                        sp -= nb_args
+                        ram[sp] = result
+                        sp += 1
+                        if profile is not None:
+                            # a step of the called function, not of the caller
+                            counts[pc] -= 1
+                            counts[target] += 1
+                            profile.enter(target, self.steps + step)
+                            profile.leave(self.steps + step + 1)
+                        pc += 1
+                        continue
+                if target in native_calls:
+                    ram[SP] = sp
+                    if not self._run_call(target, nb_args, pc + 1):
+                        # stopped inside the call
+                        executed = step
+                        pc = self.pc
+                        sp = ram[SP]
+                        break
+                    pc += 1
+                    sp = ram[SP]
+                    continue
+                ram[sp] = pc + 1
+                ram[sp + 1] = ram[LCL]
+                ram[sp + 2] = ram[ARG]
+                ram[sp + 3] = ram[THIS]
+                ram[sp + 4] = ram[THAT]
+                ram[ARG] = sp - nb_args
+                sp += 5
+                ram[LCL] = sp
+                if profile is not None:
+                    profile.enter(target, self.steps + step + 1)
+                pc = target
+                continue
+            elif op == FUNCTION:
+                for _ in range(args[pc]):
+                    ram[sp] = 0
+                    sp += 1
+            elif op == RETURN:
+                frame = ram[LCL]
+                # overwritten by the return value when there are no arguments
+                return_address = ram[frame - 5]
+                ram[ram[ARG]] = ram[sp - 1]
+                sp = ram[ARG] + 1
+                ram[THAT] = ram[frame - 1]
+                ram[THIS] = ram[frame - 2]
+                ram[ARG] = ram[frame - 3]
+                ram[LCL] = ram[frame - 4]
+                if profile is not None:
+                    profile.leave(self.steps + step + 1)
+                pc = return_address
+                continue
+            else:
+                # HALT
+                executed = step
+                break
+            pc += 1
+        if counts is not None and executed < nb_steps:
+            # the stopping command is not executed
+            counts[pc] -= 1
+        ram[SP] = sp
+        self.pc = pc
+        self.steps += executed
+        return executed
+
+    def _run_call(self, target: int, nb_args: int, return_address: int) -> bool:
+        """Run a call with its arguments on the stack until it returns, without
+        counting its steps. Return False if it stopped before returning."""
+        ram, steps = self.ram, self.steps
+        sp = ram[SP]
+        # return to the final HALT, then to the caller
+        ram[sp] = len(self.program.ops) - 1
+        ram[sp + 1 : sp + 5] = ram[LCL : THAT + 1]
+        ram[ARG] = sp - nb_args
+        ram[SP] = ram[LCL] = sp + 5
+        self.pc = target
+        # the calls made by the call run in the same loop, not nested
+        native_calls, self.native_calls = self.native_calls, frozenset()
+        try:
+            self.run(MAX_NATIVE_CALL_STEPS)
+        finally:
+            self.native_calls = native_calls
+        self.steps = steps
+        if self.pc != len(self.program.ops) - 1:
+            return False
+        self.pc = return_address
+        return True
+
+    def step(self) -> None:
+        self.run(1, stop_on_loop=False)
@@ -0,0 +1,274 @@
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from tst_runner import run_script
+from VMtranslator import *
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# test programs, and whether they are translated without bootstrap code
+TEST_PROGRAMS = [
+    ("FunctionCalls/FibonacciElement", False),
+    ("FunctionCalls/NestedCall", False),
+    ("FunctionCalls/SimpleFunction", True),
+    ("FunctionCalls/StaticsTest", False),
+    ("ProgramFlow/BasicLoop", True),
+    ("ProgramFlow/FibonacciSeries", True),
+]
+
+
+def optimize(asm):
+    stream = io.StringIO()
+    stream.close = lambda: None
+    optimizer = PeepholeOptimizer(stream)
+    optimizer.write(asm)
+    optimizer.close()
+    return stream.getvalue().split()
+
+
+class TestPeepholeOptimizer(unittest.TestCase):
+    def test_push_add(self):
+        stream = io.StringIO()
+        stream.close = lambda: None
+        code_writer = CodeWriter(stream)
+        code_writer.write_push_pop("C_PUSH", "constant", 7)
+        code_writer.write_arithmetic("add")
+        code_writer.flush()
+        asm = optimize(stream.getvalue())
+        assert asm == ["@7", "D=A", "@SP", "A=M", "M=D", "A=A-1", "M=M+D"]
+
+    def test_jump_addresses(self):
+        # a push of 0 then the end of a comparison, jumping to a halt loop
+        asm = ["@0", "D=A", "@SP", "A=M", "M=D", "@SP", "M=M+1", "@9", "D;JEQ"]
+        asm = optimize("\n".join(asm + ["@9", "0;JMP"]))
+        assert asm == ["@SP", "AM=M+1", "A=A-1", "M=0", "@6", "D;JEQ", "@6", "0;JMP"]
+
+
+def translate_programs(directory, options):
+    """Translate the test programs copied to `directory`, with CLI options."""
+    for program, no_bootstrap in TEST_PROGRAMS:
+        program_dir = os.path.join(directory, program)
+        shutil.copytree(os.path.join(TEST_DIR, program), program_dir)
+        args = [program_dir] + options
+        if no_bootstrap:
+            args.append("no_bootstrap")
+        subprocess.run(
+            [sys.executable, os.path.join(TEST_DIR, "VMtranslator.py")] + args,
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+
+
+class TestTranslation(unittest.TestCase):
+    def check_programs(self, options):
+        with tempfile.TemporaryDirectory() as directory:
+            translate_programs(directory, options)
+            for program, _ in TEST_PROGRAMS:
+                name = os.path.basename(program)
+                result = run_script(os.path.join(directory, program, f"{name}.tst"))
+                assert result.status == "PASS", (program, result.message)
+
+    def test_optimize(self):
+        self.check_programs(["--optimize"])
+
+    def test_shared_routines(self):
+        self.check_programs(["--shared-routines"])
+        self.check_programs(["--shared-routines", "--optimize"])
+
+    def test_shared_compares(self):
+        self.check_programs(["--shared-compares"])
+        self.check_programs(["--shared-compares", "--optimize", "--jobs", "2"])
+
+    def test_cache_top(self):
+        self.check_programs(["--cache-top"])
+        self.check_programs(["--cache-top", "--optimize", "--jobs", "2"])
+        self.check_programs(["--cache-top", "--shared-routines", "--shared-compares"])
+
+    def test_remove_unused_functions(self):
+        self.check_programs(["--remove-unused-functions"])
+
+    def test_assemble_in_memory(self):
+        assembler = os.path.join(TEST_DIR, "..", "06", "assembler.py")
+        for options in [
+            [],
+            ["--shared-routines", "--optimize"],
+            ["--shared-compares", "--cache-top", "--jobs", "2"],
+        ]:
+            with tempfile.TemporaryDirectory() as directory:
+                asm_dir = os.path.join(directory, "asm")
+                hack_dir = os.path.join(directory, "hack")
+                translate_programs(asm_dir, options)
+                translate_programs(hack_dir, options + ["--format", "hack"])
+                for program, _ in TEST_PROGRAMS:
+                    name = os.path.basename(program)
+                    asm_file = os.path.join(asm_dir, program, f"{name}.asm")
+                    subprocess.run([sys.executable, assembler, asm_file], check=True)
+                    assert not os.path.exists(
+                        os.path.join(hack_dir, program, f"{name}.asm")
+                    )
+                    with open(asm_file[: -len(".asm")] + ".hack") as stream:
+                        expected = stream.read()
+                    hack_file = os.path.join(hack_dir, program, f"{name}.hack")
+                    with open(hack_file) as stream:
+                        assert stream.read() == expected, (program, options)
+
+    def test_parallel_translate(self):
+        os_dir = os.path.join(TEST_DIR, "..", "..", "tools", "OS")
+        filenames = [os.path.join(os_dir, fn) for fn in sorted(os.listdir(os_dir))]
+        for options in [{}, {"shared_routines": True, "shared_compares": True}]:
+            parsers = []
+            for fn in filenames:
+                with open(fn) as stream:
+                    parsers.append(Parser(stream))
+            reachable = reachable_functions(parsers, ["Sys.init"])
+            stream = io.StringIO()
+            code_writer = CodeWriter(stream, **options)
+            removed = translate(parsers, filenames, code_writer, True, reachable)
+            code_writer.write_shared_routines()
+            code_writer.flush()
+            parallel_stream = io.StringIO()
+            parallel_writer = CodeWriter(parallel_stream, **options)
+            parallel_removed = parallel_translate(
+                filenames, parallel_writer, 2, True, reachable
+            )
+            parallel_writer.write_shared_routines()
+            parallel_writer.flush()
+            assert parallel_stream.getvalue() == stream.getvalue()
+            assert parallel_removed == removed
+            saving = parallel_writer.shared_routines_saving
+            assert saving == code_writer.shared_routines_saving
+
+    def test_reachable_functions(self):
+        parsers = [
+            Parser(io.StringIO("function Sys.init 0\ncall Main.f 0\n")),
+            Parser(io.StringIO("function Main.f 0\ncall Main.g 0\nreturn\n")),
+            Parser(io.StringIO("function Main.g 0\nreturn\nfunction Main.h 0\n")),
+        ]
+        reachable = {None, "Sys.init", "Main.f", "Main.g"}
+        assert reachable_functions(parsers, [None, "Sys.init"]) == reachable
+        # the parsers are ready to translate
+        assert parsers[0].current_command is None
+
+    def test_stack_usage(self):
+        parsers = [
+            Parser(io.StringIO("function Sys.init 0\ncall Main.f 0\n")),
+            Parser(
+                io.StringIO(
+                    "function Main.f 2\npush constant 1\npush constant 2\n"
+                    "call Main.g 2\nlabel LOOP\npush local 0\nif-goto LOOP\n"
+                    "push constant 3\npush constant 4\nadd\ncall Main.f 0\n"
+                    "return\nfunction Main.g 1\npush argument 0\nreturn\n"
+                )
+            ),
+        ]
+        functions = function_stacks(parsers)
+        calls = [("Main.g", 2), ("Main.f", 2)]
+        assert functions["Main.f"] == FunctionStack(2, 3, calls)
+        assert functions["Main.g"] == FunctionStack(1, 1, [])
+        usage = stack_usage(functions, "Sys.init")
+        # frames of Sys.init, Main.f and Main.g, the arguments and locals
+        assert usage.nb_words == 5 + (5 + 2) + 2 + (5 + 1 + 1)
+        assert usage.path == ["Sys.init", "Main.f", "Main.g"]
+        assert usage.recursive == ["Main.f"]
+        assert uncalled_functions(functions) == ["Sys.init"]
+        # the parsers are ready to translate
+        assert parsers[0].current_command is None
+        functions = function_stacks([Parser(io.StringIO("push constant 1\n"))])
+        functions.update(function_stacks(parsers[1:]))
+        assert uncalled_functions(functions) == [None, "Main.f"]
+
+    def test_stack_usage_without_bootstrap(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for program in ["FunctionCalls/SimpleFunction", "ProgramFlow/BasicLoop"]:
+                program_dir = os.path.join(directory, program)
+                shutil.copytree(os.path.join(TEST_DIR, program), program_dir)
+                output = subprocess.run(
+                    [
+                        sys.executable,
+                        os.path.join(TEST_DIR, "VMtranslator.py"),
+                        program_dir,
+                        "no_bootstrap",
+                        "--stack-usage",
+                    ],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                ).stdout
+                assert "None" not in output, output
+                if program.endswith("SimpleFunction"):
+                    assert "9 words at most" in output
+                    assert "through SimpleFunction.test" in output
+                else:
+                    assert "through (before functions)" in output
+
+    def test_shared_routines_saving(self):
+        stream = io.StringIO()
+        stream.close = lambda: None
+        code_writer = CodeWriter(stream, shared_routines=True)
+        for _ in range(3):
+            code_writer.write_call("Main.main", 1)
+            code_writer.write_return()
+        code_writer.flush()
+        nb_sites = stream.getvalue().count("\n")
+        code_writer.write_shared_routines()
+        code_writer.flush()
+        nb_instructions = sum(
+            1 for line in stream.getvalue().split() if not line.startswith("(")
+        )
+        inlined_writer = CodeWriter(io.StringIO())
+        for _ in range(3):
+            inlined_writer.write_call("Main.main", 1)
+            inlined_writer.write_return()
+        nb_inlined = inlined_writer.nb_instructions
+        assert nb_sites == 3 * 15
+        assert code_writer.shared_routines_saving == nb_inlined - nb_instructions
+
+    def test_shared_compares_result(self):
+        # without cache_top, the result in D is pushed for other commands
+        code_writer = CodeWriter(io.StringIO(), shared_compares=True)
+        code_writer.write_arithmetic("lt")
+        code_writer.write_push_pop("C_PUSH", "constant", 1)
+        code_writer.write_push_pop("C_PUSH", "constant", 2)
+        assert not code_writer._top_in_d
+        size = 2 * PUSH_TEMPLATES["constant"].size
+        assert code_writer.nb_instructions == 4 + SPILL.size + size
+        # and taken from D by arithmetic commands and pops
+        code_writer = CodeWriter(io.StringIO(), shared_compares=True)
+        code_writer.write_arithmetic("eq")
+        code_writer.write_arithmetic("not")
+        code_writer.write_push_pop("C_POP", "temp", 0)
+        code_writer.write_push_pop("C_PUSH", "constant", 1)
+        assert not code_writer._top_in_d
+        size = 1 + CACHED_POP_TEMPLATES["temp"].size + PUSH_TEMPLATES["constant"].size
+        assert code_writer.nb_instructions == 4 + size
+
+    def test_shared_compares_saving(self):
+        os_dir = os.path.join(TEST_DIR, "..", "..", "tools", "OS")
+        for options in [[], ["--shared-routines"], ["--cache-top"]]:
+            with tempfile.TemporaryDirectory() as directory:
+                program_dir = os.path.join(directory, "OS")
+                shutil.copytree(os_dir, program_dir)
+                sizes = []
+                for shared_compares in [[], ["--shared-compares"]]:
+                    output = subprocess.run(
+                        [sys.executable, os.path.join(TEST_DIR, "VMtranslator.py")]
+                        + [program_dir, "--format", "hack"]
+                        + options
+                        + shared_compares,
+                        check=True,
+                        capture_output=True,
+                        text=True,
+                    ).stdout
+                    with open(os.path.join(program_dir, "OS.hack")) as stream:
+                        sizes.append(len(stream.readlines()))
+            # the saving reported is the one of the ROM
+            saving = sizes[0] - sizes[1]
+            assert f"shared compares: {saving} instructions saved" in output
+            # comparisons of the top of the stack cached in D stay inlined
+            assert saving == 0 if "--cache-top" in options else saving > 0
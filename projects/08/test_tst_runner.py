@@ -0,0 +1,96 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from tst_runner import *
+
+
+PROJECTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+class TestScriptRunner(unittest.TestCase):
+    def test_parse_script(self):
+        script = """// comment
+        load Max.hack, /* block
+        comment */ set RAM[0] 3;
+        repeat 2 { ticktock; output; }
+        """
+        assert parse_script(tokenize(script)) == [
+            Command("load", ("Max.hack",)),
+            Command("set", ("RAM[0]", "3")),
+            Command(
+                "repeat", ("2",), (Command("ticktock", ()), Command("output", ()))
+            ),
+        ]
+
+    def test_output_column(self):
+        column = OutputColumn.parse("RAM[3006]%D1.6.1")
+        assert column.header() == "RAM[3006"
+        assert column.cell(-42) == "    -42 "
+        assert OutputColumn.parse("RAM[0]%D2.6.2").header() == "  RAM[0]  "
+        assert OutputColumn.parse("reset%B2.1.2").cell(1) == "  1  "
+        assert OutputColumn.parse("time%S1.4.1").cell("1+") == " 1+   "
+        assert parse_value("%XFFFF") == -1
+
+    def test_computer_scripts(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for filename in ["ComputerMax.tst", "ComputerMax.cmp", "Max.hack"]:
+                shutil.copy(os.path.join(PROJECTS_DIR, "05", filename), directory)
+            result = run_script(os.path.join(directory, "ComputerMax.tst"))
+            assert result.status == "PASS", result.message
+            cmp_file = os.path.join(directory, "ComputerMax.cmp")
+            with open(cmp_file) as stream:
+                lines = stream.readlines()
+            lines[27] = lines[27].replace("23456 |\n", "23457 |\n")
+            with open(cmp_file, "w") as stream:
+                stream.writelines(lines)
+            result = run_script(os.path.join(directory, "ComputerMax.tst"))
+            assert result.status == "FAIL"
+            assert "line 28" in result.message
+
+    def test_unsupported_scripts(self):
+        script = os.path.join(PROJECTS_DIR, "05", "CPU.tst")
+        assert run_script(script).status == "SKIP"
+
+    def test_vm_emulator_scripts(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for project in ["07", "08"]:
+                project_dir = os.path.join(directory, project)
+                shutil.copytree(os.path.join(PROJECTS_DIR, project), project_dir)
+            scripts = [
+                script
+                for script in find_scripts([directory])
+                if script.endswith("VME.tst")
+            ]
+            assert len(scripts) == 11
+            for script in scripts:
+                result = run_script(script)
+                assert result.status == "PASS", (script, result.message)
+
+    def test_os_scripts(self):
+        compiler = os.path.join(PROJECTS_DIR, "11", "src", "jack_compiler.py")
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ["ArrayTest", "MathTest"]:
+                test_dir = os.path.join(PROJECTS_DIR, "12", name)
+                subprocess.run(
+                    [sys.executable, compiler, "--output-folder", directory, test_dir],
+                    check=True,
+                    stdout=subprocess.DEVNULL,
+                )
+                for extension in [".tst", ".cmp"]:
+                    shutil.copy(os.path.join(test_dir, name + extension), directory)
+                result = run_script(os.path.join(directory, name + ".tst"))
+                assert result.status == "PASS", (name, result.message)
+                for fn in os.listdir(directory):
+                    os.remove(os.path.join(directory, fn))
+
+    def test_vm_without_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "Main.tst"), "w") as stream:
+                stream.write("load; vmstep;\n")
+            result = run_script(os.path.join(directory, "Main.tst"))
+            assert result.status == "ERROR"
+            assert "no .vm files" in result.message
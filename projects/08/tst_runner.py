@@ -0,0 +1,546 @@
+"""Run nand2tetris test scripts (.tst) and compare their output to .cmp files.
+
+Usage: python tst_runner.py PATH... [--jobs N] [--jit] [--os-dir OS_DIR]
+
+PATH is a test script, or a directory searched recursively for them. Scripts
+run in parallel worker processes, each one is reported with its wall time.
+
+Supported targets are the CPU emulator (`load Prog.hack`, `load Prog.asm`),
+the built-in Hack computer (`load Computer.hdl` then `ROM32K load
+Prog.hack`) and the VM emulator (`load Prog.vm`, or `load` for the VM files of
+the script's directory). VM programs run with the classes of the OS they do
+not define, loaded from tools/OS or OS_DIR and built in as in the VM emulator:
+calls of OS functions take a single step. Scripts of other chips are skipped.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import os
+import re
+import sys
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "06"))
+
+from hack_cpu import HackCPU, JitHackCPU, KBD, load_program, SCREEN  # noqa: E402
+import hack_vm  # noqa: E402
+
+
+PROJECTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+# the OS classes the VM emulator provides to programs which do not define them
+OS_DIR = os.path.join(PROJECTS_DIR, "..", "tools", "OS")
+
+
+class ScriptError(Exception):
+    """Invalid script, or script failing for another reason than its output."""
+
+
+class UnsupportedScript(ScriptError):
+    """Script for a simulator that is not available here."""
+
+
+class ComparisonFailure(Exception):
+    pass
+
+
+_TOKEN_REGEX = re.compile(
+    r'\s+|//[^\n]*|/\*.*?\*/|(?P<token>"[^"]*"|[,;{}]|[^\s,;{}"]+)', re.DOTALL
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Split a script into words, strings and `,;{}`, dropping comments."""
+    tokens = []
+    for match in _TOKEN_REGEX.finditer(text):
+        if match.group("token"):
+            tokens.append(match.group("token"))
+    return tokens
+
+
+class Command(NamedTuple):
+    """Script command: its name, its arguments, and the body of a loop."""
+
+    name: str
+    args: Tuple[str, ...]
+    body: Tuple["Command", ...] = ()
+
+
+def parse_script(tokens: List[str]) -> List[Command]:
+    commands, position = _parse_commands(tokens, 0)
+    if position < len(tokens):
+        raise ScriptError(f"unexpected '{tokens[position]}'")
+    return commands
+
+
+def _parse_commands(tokens, position):
+    """Parse commands up to the end or a closing brace, which is consumed."""
+    commands: List[Command] = []
+    words: List[str] = []
+    while position < len(tokens):
+        token = tokens[position]
+        position += 1
+        if token == "{":
+            if not words or words[0] not in ("repeat", "while"):
+                raise ScriptError("'{' must follow a repeat or while command")
+            body, position = _parse_commands(tokens, position)
+            if tokens[position - 1] != "}":
+                raise ScriptError("missing '}'")
+            commands.append(Command(words[0], tuple(words[1:]), tuple(body)))
+            words = []
+        elif token in (",", ";", "}"):
+            if words:
+                commands.append(Command(words[0], tuple(words[1:])))
+            words = []
+            if token == "}":
+                return commands, position
+        else:
+            words.append(token)
+    if words:
+        commands.append(Command(words[0], tuple(words[1:])))
+    return commands, position
+
+
+class OutputColumn(NamedTuple):
+    """`name%<format><left pad>.<width>.<right pad>` of an output-list."""
+
+    name: str
+    format: str
+    left_pad: int
+    width: int
+    right_pad: int
+
+    @classmethod
+    def parse(cls, spec: str) -> "OutputColumn":
+        name, _, fmt = spec.partition("%")
+        match = re.fullmatch(r"([BDSX])(\d+)\.(\d+)\.(\d+)", fmt or "D1.6.1")
+        if match is None:
+            raise ScriptError(f"invalid output format: {spec}")
+        pads = [int(group) for group in match.groups()[1:]]
+        return cls(name, match.group(1), *pads)
+
+    def header(self) -> str:
+        total_width = self.left_pad + self.width + self.right_pad
+        name = self.name[:total_width]
+        left_space = (total_width - len(name)) // 2
+        return " " * left_space + name.ljust(total_width - left_space)
+
+    def cell(self, value) -> str:
+        if self.format == "S":
+            text = str(value).ljust(self.width)
+        elif self.format == "D":
+            text = str(value).rjust(self.width)
+        elif self.format == "B":
+            text = format(value & 0xFFFF, "016b")[-self.width :]
+        else:
+            text = format(value & 0xFFFF, "04X")[-self.width :]
+        return " " * self.left_pad + text + " " * self.right_pad
+
+
+def parse_value(text: str) -> int:
+    """Parse a value of a set command: decimal, or %D, %X and %B prefixed."""
+    try:
+        if text.startswith("%"):
+            base = {"B": 2, "D": 10, "X": 16}[text[1].upper()]
+            value = int(text[2:], base)
+            # binary and hexadecimal values are 16-bit words
+            return value - 0x10000 if base != 10 and value & 0x8000 else value
+        return int(text)
+    except (IndexError, KeyError, ValueError):
+        raise ScriptError(f"invalid value: {text}") from None
+
+
+_VARIABLE_REGEX = re.compile(r"([\w.]+)(?:\[(\d*)\])?")
+
+
+def parse_variable(text: str) -> Tuple[str, Optional[int]]:
+    """Split `RAM[12]` into ("RAM", 12), `PC[]` into ("PC", None)."""
+    match = _VARIABLE_REGEX.fullmatch(text)
+    if match is None:
+        raise ScriptError(f"invalid variable: {text}")
+    name, index = match.groups()
+    return name, int(index) if index else None
+
+
+class CPUTarget:
+    """CPU emulator: a Hack program, with `RAM[i]`, `A`, `D`, `PC` and `time`."""
+
+    def __init__(self, rom, jit: bool = False) -> None:
+        self.cpu = (JitHackCPU if jit else HackCPU)(rom)
+        self.time = 0
+        self._half_cycle = False
+
+    def get(self, name: str, index: Optional[int]):
+        if name == "RAM" and index is not None:
+            return self.cpu.ram[index]
+        if name == "time":
+            return f"{self.time}+" if self._half_cycle else str(self.time)
+        if name in ("A", "D", "PC") and index is None:
+            return getattr(self.cpu, name.lower())
+        raise ScriptError(f"unknown variable: {name}")
+
+    def set(self, name: str, index: Optional[int], value: int) -> None:
+        if name == "RAM" and index is not None:
+            self.cpu.ram[index] = value
+        elif name in ("A", "D", "PC") and index is None:
+            setattr(self.cpu, name.lower(), value)
+        else:
+            raise ScriptError(f"cannot set: {name}")
+
+    def tick(self) -> None:
+        self._half_cycle = True
+
+    def tock(self) -> None:
+        self._half_cycle = False
+        self.ticktock(1)
+
+    def ticktock(self, nb_cycles: int) -> None:
+        self.cpu.run(nb_cycles, stop_on_loop=False)
+        self.time += nb_cycles
+
+    def vmstep(self, nb_steps: int) -> None:
+        raise ScriptError("vmstep: no VM program loaded")
+
+    def load(self, filename: str) -> None:
+        raise ScriptError("the CPU emulator only loads a program")
+
+
+class ComputerTarget(CPUTarget):
+    """Built-in Computer.hdl chip, its program being loaded by `ROM32K load`."""
+
+    # chip part name -> RAM address of the first word
+    MEMORY_PARTS = {"RAM16K": 0, "Memory": 0, "Screen": SCREEN, "Keyboard": KBD}
+
+    def __init__(self, jit: bool = False) -> None:
+        super().__init__([], jit)
+        self._jit = jit
+        self.reset = 0
+
+    def get(self, name: str, index: Optional[int]):
+        if name in self.MEMORY_PARTS:
+            return self.cpu.ram[self.MEMORY_PARTS[name] + (index or 0)]
+        if name == "reset":
+            return self.reset
+        if name in ("ARegister", "DRegister", "PC"):
+            return super().get(name[0] if name != "PC" else name, None)
+        return super().get(name, index)
+
+    def set(self, name: str, index: Optional[int], value: int) -> None:
+        if name in self.MEMORY_PARTS:
+            self.cpu.ram[self.MEMORY_PARTS[name] + (index or 0)] = value
+        elif name == "reset":
+            self.reset = value
+        elif name in ("ARegister", "DRegister", "PC"):
+            super().set(name[0] if name != "PC" else name, None, value)
+        else:
+            super().set(name, index, value)
+
+    def ticktock(self, nb_cycles: int) -> None:
+        if self.reset:
+            self.cpu.pc = 0
+            self.time += nb_cycles
+        else:
+            super().ticktock(nb_cycles)
+
+    def load(self, filename: str) -> None:
+        ram = self.cpu.ram
+        self.cpu = (JitHackCPU if self._jit else HackCPU)(load_program(filename))
+        self.cpu.ram = ram
+
+
+class VMTarget:
+    """VM emulator: a VM program, with `RAM[i]`, the segment pointers `sp`,
+    `local`, `argument`, `this` and `that`, and `segment[i]` words."""
+
+    POINTERS = {"sp": 0, "local": 1, "argument": 2, "this": 3, "that": 4}
+    # segment -> address of its base pointer, or its fixed base address
+    SEGMENTS = {"local": 1, "argument": 2, "this": 3, "that": 4}
+    FIXED_SEGMENTS = {"temp": 5, "pointer": 3}
+
+    def __init__(self, program: hack_vm.VMProgram) -> None:
+        # the OS classes loaded from the OS directory are built in, as in the
+        # VM emulator: their calls take a single step
+        self.vm = hack_vm.HackVM(program, builtins=True, native_os=True)
+
+    def _address(self, name: str, index: Optional[int]) -> int:
+        if index is None and name in self.POINTERS:
+            return self.POINTERS[name]
+        if index is not None:
+            if name == "RAM":
+                return index
+            if name in self.SEGMENTS:
+                return self.vm.ram[self.SEGMENTS[name]] + index
+            if name in self.FIXED_SEGMENTS:
+                return self.FIXED_SEGMENTS[name] + index
+        raise ScriptError(f"unknown variable: {name}")
+
+    def get(self, name: str, index: Optional[int]):
+        return self.vm.ram[self._address(name, index)]
+
+    def set(self, name: str, index: Optional[int], value: int) -> None:
+        self.vm.ram[self._address(name, index)] = value
+
+    def vmstep(self, nb_steps: int) -> None:
+        self.vm.run(nb_steps, stop_on_loop=False)
+
+    def tick(self) -> None:
+        raise ScriptError("the VM emulator runs with vmstep")
+
+    def tock(self) -> None:
+        self.tick()
+
+    def ticktock(self, nb_cycles: int) -> None:
+        self.tick()
+
+
+def load_target(
+    directory: str,
+    filename: Optional[str],
+    jit: bool = False,
+    os_dir: Optional[str] = OS_DIR,
+):
+    """Target of a `load` command, loading `filename` from `directory`.
+
+    VM programs call the classes of `os_dir` they do not define.
+    """
+    if filename is None or filename.endswith(".vm") or "." not in filename:
+        # a VM file, or a directory of them
+        path = _program_path(directory, filename or "")
+        if os.path.isdir(path) and not any(
+            fn.endswith(".vm") for fn in os.listdir(path)
+        ):
+            raise ScriptError(f"{path}: no .vm files, compile the Jack files first")
+        return VMTarget(hack_vm.load_program(path, os_dir))
+    if filename == "Computer.hdl":
+        return ComputerTarget(jit)
+    if filename.endswith(".hdl"):
+        raise UnsupportedScript(f"{filename}: only the built-in computer is supported")
+    return CPUTarget(load_program(_program_path(directory, filename)), jit)
+
+
+def _program_path(directory: str, filename: str) -> str:
+    path = os.path.join(directory, filename)
+    root, extension = os.path.splitext(path)
+    # .hack files of projects 4 and 5 are produced from their .asm sources
+    if extension == ".hack" and not os.path.exists(path):
+        if os.path.exists(root + ".asm"):
+            return root + ".asm"
+    if not os.path.exists(path):
+        raise ScriptError(f"{filename}: no such file")
+    return path
+
+
+_WHILE_CONDITIONS = {
+    "=": lambda x, y: x == y,
+    "<>": lambda x, y: x != y,
+    "<": lambda x, y: x < y,
+    ">": lambda x, y: x > y,
+    "<=": lambda x, y: x <= y,
+    ">=": lambda x, y: x >= y,
+}
+
+
+class ScriptRunner:
+    """Execute the commands of a script on a target, comparing its output."""
+
+    def __init__(
+        self, directory: str, jit: bool = False, os_dir: Optional[str] = OS_DIR
+    ) -> None:
+        self.directory = directory
+        self.jit = jit
+        self.os_dir = os_dir
+        self.target = None
+        self.columns: List[OutputColumn] = []
+        self.output_lines: List[str] = []
+        self.output_file: Optional[str] = None
+        self.compare_lines: Optional[List[str]] = None
+
+    def run(self, commands: List[Command]) -> None:
+        try:
+            for command in commands:
+                self.execute(command)
+        finally:
+            if self.output_file is not None:
+                with open(self.output_file, "w") as stream:
+                    stream.writelines(line + "\n" for line in self.output_lines)
+
+    def execute(self, command: Command) -> None:
+        name, args = command.name, command.args
+        if name == "load":
+            filename = args[0] if args else None
+            self.target = load_target(self.directory, filename, self.jit, self.os_dir)
+        elif name == "output-file":
+            self.output_file = os.path.join(self.directory, args[0])
+        elif name == "compare-to":
+            with open(os.path.join(self.directory, args[0])) as stream:
+                self.compare_lines = stream.read().splitlines()
+        elif name == "output-list":
+            self.columns = [OutputColumn.parse(arg) for arg in args]
+            self.write_line("|".join(column.header() for column in self.columns))
+        elif name in ("echo", "clear-echo", "breakpoint", "clear-breakpoints"):
+            pass
+        elif self.target is None:
+            raise ScriptError(f"{name}: no program loaded")
+        elif name == "output":
+            cells = [
+                column.cell(self.target.get(*parse_variable(column.name)))
+                for column in self.columns
+            ]
+            self.write_line("|".join(cells))
+        elif name == "set":
+            self.target.set(*parse_variable(args[0]), parse_value(args[1]))
+        elif name == "tick":
+            self.target.tick()
+        elif name == "tock":
+            self.target.tock()
+        elif name == "ticktock":
+            self.target.ticktock(1)
+        elif name == "vmstep":
+            self.target.vmstep(1)
+        elif name == "ROM32K" and args[:1] == ("load",):
+            self.target.load(_program_path(self.directory, args[1]))
+        elif name == "repeat":
+            if not args:
+                raise UnsupportedScript("repeat without a count: interactive script")
+            self.repeat(int(args[0]), command.body)
+        elif name == "while":
+            self.loop_while(args, command.body)
+        else:
+            raise ScriptError(f"unknown command: {name}")
+
+    def repeat(self, nb_times: int, body: Tuple[Command, ...]) -> None:
+        names = [command.name for command in body]
+        if names in (["ticktock"], ["tick", "tock"]):
+            # the bulk of most scripts, let the CPU run without interruption
+            self.target.ticktock(nb_times)
+            return
+        if names == ["vmstep"]:
+            self.target.vmstep(nb_times)
+            return
+        for _ in range(nb_times):
+            for command in body:
+                self.execute(command)
+
+    def loop_while(self, args: Tuple[str, ...], body: Tuple[Command, ...]) -> None:
+        if len(args) != 3 or args[1] not in _WHILE_CONDITIONS:
+            raise ScriptError(f"invalid while condition: {' '.join(args)}")
+        condition = _WHILE_CONDITIONS[args[1]]
+        variable, value = parse_variable(args[0]), parse_value(args[2])
+        while condition(self.target.get(*variable), value):
+            for command in body:
+                self.execute(command)
+
+    def write_line(self, cells: str) -> None:
+        line = f"|{cells}|"
+        line_number = len(self.output_lines)
+        self.output_lines.append(line)
+        if self.compare_lines is None:
+            return
+        expected = (
+            self.compare_lines[line_number]
+            if line_number < len(self.compare_lines)
+            else ""
+        )
+        # `*` in the comparison file matches any character
+        if len(line) != len(expected) or any(
+            char != expected_char and expected_char != "*"
+            for char, expected_char in zip(line, expected)
+        ):
+            raise ComparisonFailure(
+                f"comparison failure at line {line_number + 1}:\n"
+                f"  expected: {expected}\n  actual:   {line}"
+            )
+
+
+class ScriptResult(NamedTuple):
+    path: str
+    status: str  # PASS, FAIL, ERROR or SKIP
+    message: str
+    elapsed: float
+
+
+def run_script(
+    path: str, jit: bool = False, os_dir: Optional[str] = OS_DIR
+) -> ScriptResult:
+    """Run a test script, catching its failure."""
+    start = time.perf_counter()
+    status, message = "PASS", ""
+    try:
+        with open(path) as stream:
+            commands = parse_script(tokenize(stream.read()))
+        ScriptRunner(os.path.dirname(path), jit, os_dir).run(commands)
+    except UnsupportedScript as e:
+        status, message = "SKIP", str(e)
+    except ComparisonFailure as e:
+        status, message = "FAIL", str(e)
+    except (ScriptError, OSError, ValueError) as e:
+        status, message = "ERROR", str(e)
+    return ScriptResult(path, status, message, time.perf_counter() - start)
+
+
+def find_scripts(paths: List[str]) -> List[str]:
+    scripts = []
+    for path in paths:
+        if not os.path.isdir(path):
+            scripts.append(path)
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            scripts.extend(
+                os.path.join(dirpath, filename)
+                for filename in sorted(filenames)
+                if filename.endswith(".tst")
+            )
+    return scripts
+
+
+def run_scripts(
+    scripts: List[str],
+    jobs: int = 1,
+    jit: bool = False,
+    os_dir: Optional[str] = OS_DIR,
+):
+    """Run test scripts in `jobs` worker processes, yielding results in order."""
+    if jobs == 1:
+        for script in scripts:
+            yield run_script(script, jit, os_dir)
+        return
+    with ProcessPoolExecutor(jobs) as executor:
+        nb_scripts = len(scripts)
+        yield from executor.map(
+            run_script, scripts, [jit] * nb_scripts, [os_dir] * nb_scripts
+        )
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Run nand2tetris test scripts.")
+    argparser.add_argument(
+        "paths", nargs="+", metavar="PATH", help="Test script, or directory of them."
+    )
+    argparser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes, one per CPU by default.",
+    )
+    argparser.add_argument(
+        "--jit", action="store_true", help="Run programs with the JIT CPU emulator."
+    )
+    argparser.add_argument(
+        "--os-dir",
+        default=OS_DIR,
+        help="Directory of the OS .vm files, loaded for the classes a VM program "
+        "calls but does not define (tools/OS by default).",
+    )
+    args = argparser.parse_args()
+
+    start = time.perf_counter()
+    counts: Dict[str, int] = {}
+    scripts = find_scripts(args.paths)
+    for result in run_scripts(scripts, args.jobs, args.jit, args.os_dir):
+        counts[result.status] = counts.get(result.status, 0) + 1
+        print(f"{result.status:5} {result.elapsed:7.3f}s {result.path}")
+        if result.message:
+            print("      " + result.message.replace("\n", "\n      "))
+    summary = ", ".join(f"{count} {status}" for status, count in sorted(counts.items()))
+    print(f"{summary} in {time.perf_counter() - start:.3f}s")
+    sys.exit(1 if counts.get("FAIL") or counts.get("ERROR") else 0)
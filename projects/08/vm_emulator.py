@@ -0,0 +1,91 @@
+import argparse
+import os
+import time
+
+from hack_vm import HackVM, load_program
+
+
+PROJECTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+OS_DIR = os.path.join(PROJECTS_DIR, "..", "tools", "OS")
+
+
+def parse_ram_assignment(arg):
+    address, value = arg.split("=")
+    return int(address), int(value)
+
+
+def parse_ram_range(arg):
+    start, _, end = arg.partition(":")
+    return range(int(start), int(end) if end else int(start) + 1)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Run a VM program.")
+    argparser.add_argument(
+        "program", help="Program to run, as a .vm file or a directory of them."
+    )
+    argparser.add_argument(
+        "--steps",
+        type=int,
+        help="Maximum number of VM commands to execute, no limit by default.",
+    )
+    argparser.add_argument(
+        "--no-stop-on-loop",
+        dest="stop_on_loop",
+        action="store_false",
+        help="Keep running when reaching Sys.halt or an infinite loop.",
+    )
+    argparser.add_argument(
+        "--os",
+        dest="os_dir",
+        default=OS_DIR,
+        help="Directory of the OS classes loaded when not in the program.",
+    )
+    argparser.add_argument(
+        "--set",
+        dest="assignments",
+        metavar="ADDRESS=VALUE",
+        type=parse_ram_assignment,
+        action="append",
+        default=[],
+        help="Set a RAM word before running.",
+    )
+    argparser.add_argument(
+        "--print",
+        dest="ram_ranges",
+        metavar="ADDRESS[:END]",
+        type=parse_ram_range,
+        action="append",
+        default=[],
+        help="Print RAM words after running.",
+    )
+    argparser.add_argument(
+        "--builtins",
+        action="store_true",
+        help="Run the OS functions loaded from --os as Python built-ins.",
+    )
+    argparser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Report calls and steps per function, and the hottest labels.",
+    )
+    args = argparser.parse_args()
+    if args.steps is None and not args.stop_on_loop:
+        argparser.error("--no-stop-on-loop requires --steps")
+
+    vm = HackVM(load_program(args.program, args.os_dir), args.profile, args.builtins)
+    for address, value in args.assignments:
+        vm.ram[address] = value
+    start = time.perf_counter()
+    nb_steps = vm.run(args.steps, args.stop_on_loop)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{nb_steps} VM commands in {elapsed:.3f}s "
+        f"({nb_steps / elapsed / 1e6:.2f}M commands/s), PC={vm.pc}"
+    )
+    for ram_range in args.ram_ranges:
+        for address in ram_range:
+            print(f"RAM[{address}] = {vm.ram[address]}")
+    if vm.profile is not None:
+        print()
+        vm.profile.report(vm.steps)
@@ -0,0 +1,62 @@
+"""Time the tokenization of Jack files.
+
+Usage: python bench_tokenizer.py [--repeat N] [FILE_OR_DIR ...]
+
+By default, all the Jack files of projects 10 and 11 are tokenized, and the
+throughput is reported in tokens per second.
+"""
+import argparse
+import os
+import time
+
+from tokenizer.jack_tokenizer import JackTokenizer
+
+
+PROJECTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+
+
+def jack_files(paths):
+    file_names = []
+    for path in paths:
+        if os.path.isfile(path):
+            file_names.append(path)
+            continue
+        for dir_path, _, names in os.walk(path):
+            file_names += [
+                os.path.join(dir_path, fn)
+                for fn in sorted(names)
+                if fn.endswith(".jack")
+            ]
+    return file_names
+
+
+def time_tokenizer(file_names, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        nb_tokens = 0
+        for fn in file_names:
+            nb_tokens += len(JackTokenizer(fn).get_tokens())
+        timings.append(time.perf_counter() - start)
+    return nb_tokens, min(timings)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Benchmark Jack tokenizers.")
+    argparser.add_argument(
+        "paths",
+        nargs="*",
+        default=[os.path.join(PROJECTS_DIR, "10"), os.path.join(PROJECTS_DIR, "11")],
+        help="Jack files, or folders searched for Jack files.",
+    )
+    argparser.add_argument(
+        "--repeat", type=int, default=5, help="Keep the best of N runs.",
+    )
+    args = argparser.parse_args()
+
+    file_names = jack_files(args.paths)
+    nb_tokens, elapsed = time_tokenizer(file_names, args.repeat)
+    print(
+        f"{nb_tokens} tokens of {len(file_names)} files in {elapsed:.3f}s, "
+        f"{nb_tokens / elapsed / 1000:.0f}k tokens/s"
+    )
@@ -1,16 +1,19 @@
 from tokenizer.jack_tokenizer import JackTokenizer, Token
+from tokenizer.token_store import TokenStore
 from jack_ast import add_scope_attributes, JackAST, parse_class
 from vm_writer import write_vm_code
 
 
 def compilation_engine(file_name: str, debug: bool = False) -> str:
     tokenizer = JackTokenizer(file_name)
-    parse_result = parse_class(tokenizer.get_tokens())
+    tokens = TokenStore(tokenizer.iter_tokens(), file_name)
+    parse_result = parse_class(tokens.view())
+    # the error is at the furthest token the parser looked at
     if parse_result is None:
-        raise ValueError(f"Could not parse file {file_name}")
+        raise ValueError(f"Could not parse {tokens.position(tokens.furthest)}")
     jast, remaining_tokens = parse_result
     if len(remaining_tokens):
-        raise ValueError(f"Could not parse {remaining_tokens}")
+        raise ValueError(f"Could not parse {tokens.position(tokens.furthest)}")
     add_scope_attributes(jast)
     if debug:
         print("===AST===")
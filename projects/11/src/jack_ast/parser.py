@@ -4,6 +4,7 @@ from typing import Any, Dict, List, Iterable, NamedTuple, Optional, Union
 
 from symbol_table import kind_to_str, Kind, SymbolTable
 from tokenizer.jack_tokenizer import JackTokenizer, Token
+from tokenizer.token_store import TokenStore, TokenView
 from jack_ast.token_parsing_lib import (
     choice,
     many,
@@ -56,32 +57,29 @@ class JackAST:
         return rec_repr(self, 0)
 
 
-def parse_kw_or_symbol(tok: Token, tokens: List[Token]) -> ParseResult:
+def parse_kw_or_symbol(tok: Token, tokens: TokenView) -> ParseResult:
     assert tok.token_type in ["KEYWORD", "SYMBOL"]
-    if len(tokens) == 0 or tokens[0] != tok:
+    if not tokens.starts_with(tok):
         return None
     return JackAST(tok.token_type, tok.value), tokens[1:]
 
 
-def parse_identifier(tokens: List[Token]) -> ParseResult:
-    if len(tokens) == 0 or tokens[0].token_type != "IDENTIFIER":
+def parse_identifier(tokens: TokenView) -> ParseResult:
+    if tokens.first_type() != "IDENTIFIER":
         return None
-    identifier = tokens[0]
-    return JackAST("IDENTIFIER", identifier.value), tokens[1:]
+    return JackAST("IDENTIFIER", tokens.first_value()), tokens[1:]
 
 
-def parse_integer_constant(tokens: List[Token]) -> ParseResult:
-    if len(tokens) == 0 or tokens[0].token_type != "INT_CONST":
+def parse_integer_constant(tokens: TokenView) -> ParseResult:
+    if tokens.first_type() != "INT_CONST":
         return None
-    const = tokens[0]
-    return JackAST("INTEGER_CONSTANT", const.value), tokens[1:]
+    return JackAST("INTEGER_CONSTANT", tokens.first_value()), tokens[1:]
 
 
-def parse_string_constant(tokens: List[Token]) -> ParseResult:
-    if len(tokens) == 0 or tokens[0].token_type != "STRING_CONST":
+def parse_string_constant(tokens: TokenView) -> ParseResult:
+    if tokens.first_type() != "STRING_CONST":
         return None
-    const = tokens[0]
-    return JackAST("STRING_CONSTANT", const.value), tokens[1:]
+    return JackAST("STRING_CONSTANT", tokens.first_value()), tokens[1:]
 
 
 def flat_list(elems: Iterable) -> List:
@@ -98,7 +96,9 @@ def flat_list(elems: Iterable) -> List:
     return result
 
 
-def parse_class(tokens: List[Token]) -> ParseResult:
+def parse_class(tokens: Union[List[Token], TokenView]) -> ParseResult:
+    if not isinstance(tokens, TokenView):
+        tokens = TokenStore(tokens).view()
     return sequence(
         partial(parse_kw_or_symbol, Token("KEYWORD", "class")),
         parse_identifier,
@@ -110,7 +110,7 @@ def parse_class(tokens: List[Token]) -> ParseResult:
     )(tokens)
 
 
-def parse_class_var_dec(tokens: List[Token]) -> ParseResult:
+def parse_class_var_dec(tokens: TokenView) -> ParseResult:
     return sequence(
         choice(
             partial(parse_kw_or_symbol, Token("KEYWORD", "static")),
@@ -128,7 +128,7 @@ def parse_class_var_dec(tokens: List[Token]) -> ParseResult:
     )(tokens)
 
 
-def parse_subroutine_dec(tokens: List[Token]) -> ParseResult:
+def parse_subroutine_dec(tokens: TokenView) -> ParseResult:
     return sequence(
         choice(
             partial(parse_kw_or_symbol, Token("KEYWORD", "constructor")),
@@ -145,7 +145,7 @@ def parse_subroutine_dec(tokens: List[Token]) -> ParseResult:
     )(tokens)
 
 
-def parse_parameter_list(tokens: List[Token]) -> ParseResult:
+def parse_parameter_list(tokens: TokenView) -> ParseResult:
     return zero_or_one(
         sequence(
             parse_type,
@@ -163,7 +163,7 @@ def parse_parameter_list(tokens: List[Token]) -> ParseResult:
     )(tokens)
 
 
-def parse_subroutine_body(tokens: List[Token]) -> ParseResult:
+def parse_subroutine_body(tokens: TokenView) -> ParseResult:
     return sequence(
         partial(parse_kw_or_symbol, Token("SYMBOL", "{")),
         many(parse_var_dec),
@@ -173,7 +173,7 @@ def parse_subroutine_body(tokens: List[Token]) -> ParseResult:
     )(tokens)
 
 
-def parse_var_dec(tokens: List[Token]) -> ParseResult:
+def parse_var_dec(tokens: TokenView) -> ParseResult:
     return sequence(
         partial(parse_kw_or_symbol, Token("KEYWORD", "var")),
         parse_type,
@@ -188,7 +188,7 @@ def parse_var_dec(tokens: List[Token]) -> ParseResult:
     )(tokens)
 
 
-def parse_type(tokens: List[Token]) -> ParseResult:
+def parse_type(tokens: TokenView) -> ParseResult:
     return choice(
         partial(parse_kw_or_symbol, Token("KEYWORD", "int")),
         partial(parse_kw_or_symbol, Token("KEYWORD", "boolean")),
@@ -197,14 +197,14 @@ def parse_type(tokens: List[Token]) -> ParseResult:
     )(tokens)
 
 
-def parse_statements(tokens: List[Token]) -> ParseResult:
+def parse_statements(tokens: TokenView) -> ParseResult:
     return sequence(
         many(parse_statement),
         aggregator=lambda *jasts: JackAST("STATEMENTS", flat_list(jasts)),
     )(tokens)
 
 
-def parse_statement(tokens: List[Token]) -> ParseResult:
+def parse_statement(tokens: TokenView) -> ParseResult:
     return choice(
         parse_let_statement,
         parse_if_statement,
@@ -214,7 +214,7 @@ def parse_statement(tokens: List[Token]) -> ParseResult:
     )(tokens)
 
 
-def parse_let_statement(tokens: List[Token]) -> ParseResult:
+def parse_let_statement(tokens: TokenView) -> ParseResult:
     return sequence(
         partial(parse_kw_or_symbol, Token("KEYWORD", "let")),
         parse_identifier,
@@ -232,7 +232,7 @@ def parse_let_statement(tokens: List[Token]) -> ParseResult:
     )(tokens)
 
 
-def parse_if_statement(tokens: List[Token]) -> ParseResult:
+def parse_if_statement(tokens: TokenView) -> ParseResult:
     return sequence(
         partial(parse_kw_or_symbol, Token("KEYWORD", "if")),
         partial(parse_kw_or_symbol, Token("SYMBOL", "(")),
@@ -253,7 +253,7 @@ def parse_if_statement(tokens: List[Token]) -> ParseResult:
     )(tokens)
 
 
-def parse_while_statement(tokens: List[Token]) -> ParseResult:
+def parse_while_statement(tokens: TokenView) -> ParseResult:
     return sequence(
         partial(parse_kw_or_symbol, Token("KEYWORD", "while")),
         partial(parse_kw_or_symbol, Token("SYMBOL", "(")),
@@ -266,7 +266,7 @@ def parse_while_statement(tokens: List[Token]) -> ParseResult:
     )(tokens)
 
 
-def parse_do_statement(tokens: List[Token]) -> ParseResult:
+def parse_do_statement(tokens: TokenView) -> ParseResult:
     return sequence(
         partial(parse_kw_or_symbol, Token("KEYWORD", "do")),
         parse_subroutine_call,
@@ -275,7 +275,7 @@ def parse_do_statement(tokens: List[Token]) -> ParseResult:
     )(tokens)
 
 
-def parse_return_statement(tokens: List[Token]) -> ParseResult:
+def parse_return_statement(tokens: TokenView) -> ParseResult:
     return sequence(
         partial(parse_kw_or_symbol, Token("KEYWORD", "return")),
         zero_or_one(parse_expression),
@@ -284,7 +284,7 @@ def parse_return_statement(tokens: List[Token]) -> ParseResult:
     )(tokens)
 
 
-def parse_expression(tokens: List[Token]) -> ParseResult:
+def parse_expression(tokens: TokenView) -> ParseResult:
     return sequence(
         parse_term,
         many(sequence(parse_op, parse_term)),
@@ -292,7 +292,7 @@ def parse_expression(tokens: List[Token]) -> ParseResult:
     )(tokens)
 
 
-def parse_term(tokens: List[Token]) -> ParseResult:
+def parse_term(tokens: TokenView) -> ParseResult:
     return choice(
         parse_integer_constant,
         parse_string_constant,
@@ -315,7 +315,7 @@ def parse_term(tokens: List[Token]) -> ParseResult:
     )(tokens)
 
 
-def parse_subroutine_call(tokens: List[Token]) -> ParseResult:
+def parse_subroutine_call(tokens: TokenView) -> ParseResult:
     return sequence(
         choice(
             sequence(
@@ -336,7 +336,7 @@ def parse_subroutine_call(tokens: List[Token]) -> ParseResult:
     )(tokens)
 
 
-def parse_expression_list(tokens: List[Token]) -> ParseResult:
+def parse_expression_list(tokens: TokenView) -> ParseResult:
     return sequence(
         zero_or_one(
             sequence(
@@ -353,7 +353,7 @@ def parse_expression_list(tokens: List[Token]) -> ParseResult:
     )(tokens)
 
 
-def parse_op(tokens: List[Token]) -> ParseResult:
+def parse_op(tokens: TokenView) -> ParseResult:
     return choice(
         partial(parse_kw_or_symbol, Token("SYMBOL", "+")),
         partial(parse_kw_or_symbol, Token("SYMBOL", "-")),
@@ -367,14 +367,14 @@ def parse_op(tokens: List[Token]) -> ParseResult:
     )(tokens)
 
 
-def parse_unary_op(tokens: List[Token]) -> ParseResult:
+def parse_unary_op(tokens: TokenView) -> ParseResult:
     return choice(
         partial(parse_kw_or_symbol, Token("SYMBOL", "-")),
         partial(parse_kw_or_symbol, Token("SYMBOL", "~")),
     )(tokens)
 
 
-def parse_keyword_constant(tokens: List[Token]) -> ParseResult:
+def parse_keyword_constant(tokens: TokenView) -> ParseResult:
     return choice(
         partial(parse_kw_or_symbol, Token("KEYWORD", "true")),
         partial(parse_kw_or_symbol, Token("KEYWORD", "false")),
@@ -1,13 +1,13 @@
-from tokenizer.jack_tokenizer import Token
+from tokenizer.token_store import TokenView
 
 from typing import Any, Callable, List, Optional, Tuple, Union
 
-ParseResult = Optional[Tuple[Any, List[Token]]]
-ParserFunc = Callable[[List[Token]], ParseResult]
+ParseResult = Optional[Tuple[Any, TokenView]]
+ParserFunc = Callable[[TokenView], ParseResult]
 
 
 def sequence(*parser_funcs: ParserFunc, aggregator: Callable = None) -> ParserFunc:
-    def parser_func(tokens: List[Token]) -> ParseResult:
+    def parser_func(tokens: TokenView) -> ParseResult:
         parsed_items = []
         for p in parser_funcs:
             parse_parsed_items = p(tokens)
@@ -23,7 +23,7 @@ def sequence(*parser_funcs: ParserFunc, aggregator: Callable = None) -> ParserFu
 
 
 def many(p: ParserFunc) -> ParserFunc:
-    def parser_func(tokens: List[Token]) -> ParseResult:
+    def parser_func(tokens: TokenView) -> ParseResult:
         parsed_items = []
         parse_result = p(tokens)
         while parse_result is not None:
@@ -36,7 +36,7 @@ def many(p: ParserFunc) -> ParserFunc:
 
 
 def zero_or_one(p: ParserFunc, default_value: Any = None) -> ParserFunc:
-    def parser_func(tokens: List[Token]) -> ParseResult:
+    def parser_func(tokens: TokenView) -> ParseResult:
         parse_result = p(tokens)
         if parse_result is not None:
             return parse_result
@@ -46,7 +46,7 @@ def zero_or_one(p: ParserFunc, default_value: Any = None) -> ParserFunc:
 
 
 def choice(*parser_funcs: ParserFunc, callback: Callable = None) -> ParserFunc:
-    def parser_func(tokens: List[Token]) -> ParseResult:
+    def parser_func(tokens: TokenView) -> ParseResult:
         for p in parser_funcs:
             parse_result = p(tokens)
             if parse_result is not None:
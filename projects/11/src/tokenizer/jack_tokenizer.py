@@ -1,9 +1,7 @@
-from dataclasses import dataclass
-from functools import partial
+from collections import deque
+from dataclasses import dataclass, field
 import re
-from typing import Union
-
-from tokenizer.parsing_lib import *
+from typing import Deque, Iterable, Iterator, Optional, Union
 
 
 KEYWORDS = [
@@ -50,127 +48,136 @@ SYMBOLS = [
     "=",
     "~",
 ]
+KEYWORD_SET = frozenset(KEYWORDS)
+
+# a single alternation matching every token, or whitespace and comments to skip;
+# the last group catches anything else, e.g. an unterminated string or comment.
+# Block comments of any length are skipped in one match, wherever they start
+# and end on their lines, and the code around them is kept
+TOKEN_REGEX = re.compile(
+    r"""
+    (?P<SKIP>\s+|//[^\n]*|/\*.*?\*/)
+    |(?P<INT_CONST>[0-9]+)
+    |(?P<STRING_CONST>"[^\n"]*")
+    |(?P<WORD>[a-zA-Z_]\w*)
+    |(?P<SYMBOL>[{}()\[\].,;+\-*&|<>=~]|/(?!\*))
+    |(?P<ERROR>.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
 
 
 @dataclass
 class Token:
     token_type: str
     value: Union[int, str]
+    # position in the file, from 1, which does not make tokens different
+    line: int = field(default=0, compare=False, repr=False)
+    column: int = field(default=0, compare=False, repr=False)
+
+
+def int_const(s):
+    value = int(s)
+    if value > 32767:
+        raise ValueError(f"Cannot parse {value}, upper bound is 32767")
+    return value
+
+
+def scan_tokens(text, file_name="<string>"):
+    """Tokens of a Jack source, found in a single pass of TOKEN_REGEX."""
+    line_no = 1
+    # position of the first character of the line
+    line_start = 0
+    for m in TOKEN_REGEX.finditer(text):
+        kind = m.lastgroup
+        value = m.group()
+        if kind == "SKIP":
+            nb_newlines = value.count("\n")
+            if nb_newlines:
+                line_no += nb_newlines
+                line_start = m.start() + value.rindex("\n") + 1
+            continue
+        column = m.start() - line_start + 1
+        if kind == "WORD":
+            token_type = "KEYWORD" if value in KEYWORD_SET else "IDENTIFIER"
+            yield Token(token_type, value, line_no, column)
+        elif kind == "SYMBOL":
+            yield Token("SYMBOL", value, line_no, column)
+        elif kind == "INT_CONST":
+            yield Token("INT_CONST", int_const(value), line_no, column)
+        elif kind == "STRING_CONST":
+            yield Token("STRING_CONST", value[1:-1], line_no, column)
+        elif text.startswith("/*", m.start()):
+            raise ValueError(
+                f"Unterminated comment at line {line_no} in file {file_name}"
+            )
+        else:
+            end = text.find("\n", m.start())
+            remainder = text[m.start() : end if end >= 0 else len(text)]
+            raise ValueError(
+                f"Couldn't tokenize {repr(remainder.rstrip())} at line {line_no} "
+                f"in file {file_name}"
+            )
 
 
-def parse_keyword(keyword, s):
-    if s.startswith(keyword):
-        rest = s.lstrip(keyword)
-        # this condition is a hack to prevent an identifier such as 'double' to be parsed as two tokens
-        # 'do' and 'uble'
-        if len(rest) > 0 and not rest[0].isalnum():
-            return Token("KEYWORD", keyword), rest
-
-
-def parse_symbol(symbol, s):
-    if s.startswith(symbol):
-        return Token("SYMBOL", symbol), s[len(symbol) :]
-
-
-def parse_int_const(s):
-    if (m := re.match(r"([0-9]+)", s)) is not None:
-        value = int(m.group(0))
-        if value > 32767:
-            raise ValueError(f"Cannot parse {value}, upper bound is 32767")
-        return Token("INT_CONST", value), s.lstrip(m.group(1))
-
-
-def parse_string_const(s):
-    if (m := re.match(r'"([^\n"]*)"', s)) is not None:
-        # need to strip string litteral + surrounding quotes
-        # hence we strip m.group(0)
-        return Token("STRING_CONST", m.group(1)), s.lstrip(m.group(0))
-
-
-def parse_identifier(s):
-    if (m := re.match(r"([a-zA-Z_]\w*)", s)) is not None:
-        return Token("IDENTIFIER", m.group(1)), s.lstrip(m.group(1))
-
-
-def parse_token(s):
-    parsers: list = []
-    for kw in KEYWORDS:
-        parsers.append(partial(parse_keyword, kw))
-
-    for symbol in SYMBOLS:
-        parsers.append(partial(parse_symbol, symbol))
-
-    parsers.append(parse_int_const)
-    parsers.append(parse_string_const)
-    parsers.append(parse_identifier)
-    return alternative(*parsers)(s)
-
-
-def parse_regex(regex, s, result=None):
-    if (m := re.match(regex, s)) is not None:
-        return result, s.lstrip(m.group(0))
-
+class TokenStream:
+    """Tokens read from an iterator as they are needed.
 
-def parse_whitespace(s):
-    return parse_regex(r"\s*", s, "WHITESPACE")
+    At most `max_lookahead` tokens are read ahead of the last returned one,
+    and kept in a buffer until they are returned in turn.
+    """
 
+    def __init__(self, tokens: Iterable[Token], max_lookahead: int = 2) -> None:
+        self._tokens = iter(tokens)
+        self._buffer: Deque[Token] = deque()
+        self.max_lookahead = max_lookahead
 
-def parse_comment(s):
-    return parse_regex(r"//.*", s, "COMMENT")
+    def __iter__(self) -> Iterator[Token]:
+        return self
 
+    def __next__(self) -> Token:
+        if self._buffer:
+            return self._buffer.popleft()
+        return next(self._tokens)
 
-def parse_start_multiline_comment(s):
-    return parse_regex(r"/\*\*.*", s, "START_ML_COMMENT")
+    def peek(self, offset: int = 0) -> Optional[Token]:
+        """The token `offset` positions after the next one, None past the end."""
+        if not 0 <= offset < self.max_lookahead:
+            raise ValueError(f"Cannot look {offset + 1} tokens ahead")
+        while len(self._buffer) <= offset:
+            token = next(self._tokens, None)
+            if token is None:
+                return None
+            self._buffer.append(token)
+        return self._buffer[offset]
 
 
-def parse_end_multiline_comment(s):
-    return parse_regex(r"\*/", s, "END_ML_COMMENT")
+class JackTokenizer:
+    """Tokens of a Jack file, scanned with `scan_tokens` as they are needed.
 
+    The file is read at the first token, and the tokens are not kept: the
+    tokenizer holds the current one and at most `max_lookahead` next ones.
+    """
 
-class JackTokenizer:
-    def __init__(self, file_name):
+    def __init__(self, file_name, max_lookahead=2):
         self.file_name = file_name
-        self._token_index = -1
-        self._tokens = []
-        self._consume_file()
+        self._current = None
+        self._stream = TokenStream(self._read_tokens(), max_lookahead)
 
-    def _consume_file(self):
+    def _read_tokens(self):
         with open(self.file_name) as stream:
-            multiline_comment = False
-            for line_no, line in enumerate(stream.readlines()):
-                # remove left and whitespace
-                line = line.lstrip().rstrip()
-                # handling multiline comments
-                if line.startswith("/**"):
-                    if not line.endswith("*/"):
-                        multiline_comment = True
-                    continue
-                if line.endswith("*/"):
-                    multiline_comment = False
-                    continue
-                if multiline_comment:
-                    continue
-                parser = many(
-                    chain_and_ignore_right(
-                        alternative(parse_comment, parse_token), parse_whitespace
-                    )
-                )
-                parse_result = parser(line)
-                tokens = parse_result[0]
-                if "COMMENT" in tokens:
-                    tokens = tokens[: tokens.index("COMMENT")]
-                self._tokens += tokens
-                remainder = parse_result[1]
-                if not (remainder.isspace() or remainder == ""):
-                    raise ValueError(
-                        f"Couldn't tokenize {repr(remainder)} at line {line_no + 1} in file {self.file_name}"
-                    )
+            text = stream.read()
+        yield from scan_tokens(text, self.file_name)
 
     def has_more_tokens(self):
-        return self._token_index < len(self._tokens) - 1
+        return self._stream.peek() is not None
 
     def advance(self):
-        self._token_index += 1
+        self._current = next(self._stream)
+
+    def peek(self, offset=0):
+        """The token `offset` positions after the next one, without advancing."""
+        return self._stream.peek(offset)
 
     def token_type(self):
         current_token = self._current_token
@@ -191,12 +198,14 @@ class JackTokenizer:
     def string_val(self):
         return self._get_val("STRING_CONST")
 
+    def iter_tokens(self):
+        """Iterator of the remaining tokens, each becoming the current token."""
+        for token in self._stream:
+            self._current = token
+            yield token
+
     def get_tokens(self):
-        result = []
-        while self.has_more_tokens():
-            self.advance()
-            result.append(self._current_token)
-        return result
+        return list(self.iter_tokens())
 
     def _get_val(self, token_type):
         current_token = self._current_token
@@ -219,5 +228,5 @@ class JackTokenizer:
 
     @property
     def _current_token(self):
-        if self._token_index >= 0:
-            return self._tokens[self._token_index]
+        # None before the first advance
+        return self._current
@@ -0,0 +1,144 @@
+import glob
+import html
+import os
+import tempfile
+import unittest
+
+from tokenizer.jack_tokenizer import *
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECTS_DIR = os.path.join(TEST_DIR, "..", "..", "..")
+
+
+def tokenize(source):
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, "Main.jack")
+        with open(file_name, "w") as stream:
+            stream.write(source)
+        return JackTokenizer(file_name).get_tokens()
+
+
+XML_TAGS = {
+    "keyword": "KEYWORD",
+    "symbol": "SYMBOL",
+    "integerConstant": "INT_CONST",
+    "stringConstant": "STRING_CONST",
+    "identifier": "IDENTIFIER",
+}
+
+
+def read_xml_tokens(file_name):
+    """Tokens of a reference ...T.xml file of project 10."""
+    tokens = []
+    with open(file_name) as stream:
+        for line in stream:
+            tag, _, rest = line.strip()[1:].partition("> ")
+            if tag in XML_TAGS:
+                text = html.unescape(rest[: rest.rindex(" </")])
+                value = int(text) if tag == "integerConstant" else text
+                tokens.append(Token(XML_TAGS[tag], value))
+    return tokens
+
+
+class TestJackTokenizer(unittest.TestCase):
+    def test_reference_tokens(self):
+        pattern = os.path.join(PROJECTS_DIR, "10", "*", "*T.xml")
+        xml_files = glob.glob(pattern)
+        assert xml_files
+        for xml_file in xml_files:
+            jack_file = xml_file[: -len("T.xml")] + ".jack"
+            tokens = JackTokenizer(jack_file).get_tokens()
+            assert tokens == read_xml_tokens(xml_file), jack_file
+
+    def test_scan_tokens(self):
+        tokens = list(scan_tokens('do double(x_1, "a b") ; // do\n/** */ return'))
+        assert tokens == [
+            Token("KEYWORD", "do"),
+            Token("IDENTIFIER", "double"),
+            Token("SYMBOL", "("),
+            Token("IDENTIFIER", "x_1"),
+            Token("SYMBOL", ","),
+            Token("STRING_CONST", "a b"),
+            Token("SYMBOL", ")"),
+            Token("SYMBOL", ";"),
+            Token("KEYWORD", "return"),
+        ]
+        # keywords are only whole words
+        assert list(scan_tokens("do_it if1")) == [
+            Token("IDENTIFIER", "do_it"),
+            Token("IDENTIFIER", "if1"),
+        ]
+        assert list(scan_tokens("x/y/*c*/-1")) == [
+            Token("IDENTIFIER", "x"),
+            Token("SYMBOL", "/"),
+            Token("IDENTIFIER", "y"),
+            Token("SYMBOL", "-"),
+            Token("INT_CONST", 1),
+        ]
+
+    def test_block_comments(self):
+        lines = ["let x /* a\n", "b */ = /** c\n", "\n", "*/ 1; /* d */\n"]
+        lines += ["/* e */ /** f */ return // g */ h\n", "/*/ i */\n"]
+        tokens = list(scan_tokens("".join(lines)))
+        assert [token.value for token in tokens] == ["let", "x", "=", 1, ";", "return"]
+        assert [token.line for token in tokens] == [1, 1, 2, 4, 4, 5]
+        with self.assertRaisesRegex(ValueError, "Unterminated comment at line 2"):
+            list(scan_tokens("".join(lines[:2])))
+
+    def test_comment_banners(self):
+        banner = "/**" + " *\n" * 1000 + " * // not a line comment /* nor a start\n */"
+        source = f'{banner} let /***/ s = "a // b /* c */"; // */ x\n/**/return'
+        tokens = list(scan_tokens(source))
+        assert [token.value for token in tokens] == [
+            "let",
+            "s",
+            "=",
+            "a // b /* c */",
+            ";",
+            "return",
+        ]
+        assert (tokens[0].line, tokens[0].column) == (1002, 5)
+        assert tokens[-1].line == 1003
+
+    def test_stream(self):
+        stream = TokenStream(scan_tokens("let x = 1;\nlet y = #;\n"), max_lookahead=2)
+        assert stream.peek(1) == Token("IDENTIFIER", "x")
+        with self.assertRaises(ValueError):
+            stream.peek(2)
+        assert next(stream) == Token("KEYWORD", "let")
+        assert [next(stream).value for _ in range(4)] == ["x", "=", 1, ";"]
+        # the tokens before the error are scanned and returned first
+        assert stream.peek(1) == Token("IDENTIFIER", "y")
+        assert next(stream) == Token("KEYWORD", "let")
+        with self.assertRaises(ValueError):
+            list(stream)
+
+    def test_tokenizer_api(self):
+        file_name = os.path.join(PROJECTS_DIR, "11", "Seven", "Main.jack")
+        tokens = JackTokenizer(file_name).get_tokens()
+        tokenizer = JackTokenizer(file_name)
+        # no current token before the first advance
+        assert tokenizer._current_token is None
+        assert tokenizer.peek(1) == tokens[1]
+        tokenizer.advance()
+        assert tokenizer.keyword() == "class"
+        assert tokenizer.peek() == tokens[1]
+        tokenizer.advance()
+        assert tokenizer.token_type() == "IDENTIFIER"
+        assert tokenizer.get_tokens() == tokens[2:]
+        assert not tokenizer.has_more_tokens()
+        assert tokenizer.symbol() == "}"
+
+    def test_long_line(self):
+        source = " ".join(f'let a{i} = "s" + {i};' for i in range(2000)) + " return"
+        tokens = tokenize(source)
+        assert len(tokens) == 2000 * 7 + 1
+        assert tokens[-1] == Token("KEYWORD", "return")
+
+    def test_errors(self):
+        for source in ["let x = 32768;", 'let s = "abc;', "let x = 1; /* x", "x = #"]:
+            with self.assertRaises(ValueError):
+                tokenize("class Main {\n" + source + "\n}\n")
+        with self.assertRaisesRegex(ValueError, "at line 2 "):
+            tokenize("class Main {\nx = #\n}\n")
@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+
+from compilation import compilation_engine
+from tokenizer.jack_tokenizer import JackTokenizer, scan_tokens, Token
+from tokenizer.token_store import *
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PONG_GAME = os.path.join(TEST_DIR, "..", "..", "Pong", "PongGame.jack")
+
+
+class TestTokenStore(unittest.TestCase):
+    def test_store(self):
+        tokens = JackTokenizer(PONG_GAME).get_tokens()
+        store = TokenStore(tokens, PONG_GAME)
+        assert len(store) == len(tokens)
+        assert list(store.view()) == tokens
+        # values are interned once per file
+        assert len(store.strings) == len(set(store.strings)) < len(tokens) / 4
+        assert store.strings.count("ball") == 1
+        token = store.view()[5]
+        assert store.token(5) == token == tokens[5]
+        assert (token.line, token.column) == (tokens[5].line, tokens[5].column)
+
+    def test_positions(self):
+        lines = ["class Main {\n", "  /** c */ field int x; // x\n", '\tlet s = "a";']
+        tokens = list(scan_tokens("".join(lines)))
+        positions = [(token.line, token.column) for token in tokens]
+        assert positions[:3] == [(1, 1), (1, 7), (1, 12)]
+        assert positions[3:7] == [(2, 12), (2, 18), (2, 22), (2, 23)]
+        assert positions[7:] == [(3, 2), (3, 6), (3, 8), (3, 10), (3, 13)]
+        tokens = JackTokenizer(PONG_GAME).get_tokens()
+        positions = [(token.line, token.column) for token in tokens]
+        assert positions[:3] == [(9, 1), (9, 7), (9, 16)]
+        assert positions[-1] == (137, 1)
+
+    def test_view(self):
+        store = TokenStore(scan_tokens("let x = 1;"))
+        view = store.view()
+        assert view.starts_with(Token("KEYWORD", "let"))
+        assert not view.starts_with(Token("IDENTIFIER", "let"))
+        assert not view.starts_with(Token("KEYWORD", "do"))
+        rest = view[3:]
+        assert rest.first_type() == "INT_CONST"
+        assert rest.first_value() == 1
+        assert rest[1:].starts_with(Token("SYMBOL", ";"))
+        assert rest[2:] == [] and rest[2:].first_type() is None
+        assert not rest[2:].starts_with(Token("SYMBOL", ";"))
+        assert store.furthest == 5
+        assert store.position(3) == "<string>:1:9"
+
+    def test_syntax_error_position(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, "Main.jack")
+            with open(file_name, "w") as stream:
+                stream.write("class Main {\n  function void main() {\n")
+                stream.write("    let x = (1 + ;\n    return;\n  }\n}\n")
+            with self.assertRaisesRegex(ValueError, "Main.jack:3:18"):
+                compilation_engine(file_name)
@@ -0,0 +1,145 @@
+from array import array
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+from tokenizer.jack_tokenizer import Token
+
+
+TOKEN_TYPES = ["KEYWORD", "SYMBOL", "INT_CONST", "STRING_CONST", "IDENTIFIER"]
+TYPE_CODES = {token_type: code for code, token_type in enumerate(TOKEN_TYPES)}
+INT_CONST_CODE = TYPE_CODES["INT_CONST"]
+
+
+class TokenStore:
+    """Tokens of a file, stored in parallel `array` columns.
+
+    A token is a type code, a value and its line and column in the file. The
+    value of an INT_CONST token is its integer, and the value of the other
+    tokens is the index of their string in the string table of the file,
+    where strings are interned: two tokens are equal if their type codes and
+    values are.
+    """
+
+    def __init__(self, tokens: Iterable[Token] = (), file_name: str = "<string>"):
+        self.file_name = file_name
+        self.type_codes = array("B")
+        self.values = array("i")
+        self.lines = array("I")
+        self.columns = array("I")
+        self.strings: List[str] = []
+        self._string_ids: Dict[str, int] = {}
+        # the furthest token looked at by a parser, where a syntax error is
+        self.furthest = 0
+        for token in tokens:
+            self.append(token)
+
+    def __len__(self) -> int:
+        return len(self.type_codes)
+
+    def string_id(self, s: str) -> int:
+        """Index of the string `s` in the string table, added if needed."""
+        string_id = self._string_ids.get(s)
+        if string_id is None:
+            string_id = self._string_ids[s] = len(self.strings)
+            self.strings.append(sys.intern(s))
+        return string_id
+
+    def append(self, token: Token) -> None:
+        type_code = TYPE_CODES[token.token_type]
+        self.type_codes.append(type_code)
+        if type_code == INT_CONST_CODE:
+            self.values.append(token.value)  # type: ignore
+        else:
+            self.values.append(self.string_id(token.value))  # type: ignore
+        self.lines.append(token.line)
+        self.columns.append(token.column)
+
+    def token(self, index: int) -> Token:
+        type_code = self.type_codes[index]
+        value: Union[int, str] = self.values[index]
+        if type_code != INT_CONST_CODE:
+            value = self.strings[value]  # type: ignore
+        return Token(
+            TOKEN_TYPES[type_code], value, self.lines[index], self.columns[index]
+        )
+
+    def position(self, index: int) -> str:
+        """Position of a token for error messages, the end of file past the end."""
+        if index >= len(self):
+            return f"end of file {self.file_name}"
+        return f"{self.file_name}:{self.lines[index]}:{self.columns[index]}"
+
+    def view(self, start: int = 0) -> "TokenView":
+        return TokenView(self, start)
+
+
+class TokenView:
+    """The tokens of a store from `start`, e.g. the tokens left to parse.
+
+    Slicing from an index makes a view of the same store, and the first
+    token is compared with `starts_with` without creating Token objects.
+    """
+
+    __slots__ = ["store", "start"]
+
+    def __init__(self, store: TokenStore, start: int = 0) -> None:
+        self.store = store
+        self.start = start
+
+    def __len__(self) -> int:
+        return max(len(self.store) - self.start, 0)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.stop is not None or index.step is not None:
+                raise IndexError("Only slices from an index to the end are views")
+            return TokenView(self.store, self.start + (index.start or 0))
+        if not 0 <= index < len(self):
+            raise IndexError("token index out of range")
+        return self.store.token(self.start + index)
+
+    def __iter__(self) -> Iterator[Token]:
+        for index in range(self.start, len(self.store)):
+            yield self.store.token(index)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, TokenView):
+            return self.store is other.store and self.start == other.start
+        return list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return f"TokenView({self.store.position(self.start)})"
+
+    def _look(self) -> Optional[int]:
+        """Index of the first token in the store, None if there is none."""
+        start = self.start
+        store = self.store
+        if start > store.furthest:
+            store.furthest = start
+        return start if start < len(store.type_codes) else None
+
+    def starts_with(self, token: Token) -> bool:
+        """Whether the first token is equal to `token`."""
+        index = self._look()
+        if index is None:
+            return False
+        store = self.store
+        if store.type_codes[index] != TYPE_CODES[token.token_type]:
+            return False
+        if isinstance(token.value, int):
+            return store.values[index] == token.value
+        return store.values[index] == store._string_ids.get(token.value)
+
+    def first_type(self) -> Optional[str]:
+        """Type of the first token, None if there is none."""
+        index = self._look()
+        if index is None:
+            return None
+        return TOKEN_TYPES[self.store.type_codes[index]]
+
+    def first_value(self) -> Union[int, str]:
+        store = self.store
+        value = store.values[self.start]
+        if store.type_codes[self.start] == INT_CONST_CODE:
+            return value
+        return store.strings[value]